@@ -0,0 +1,9 @@
+import multiprocessing
+import sys
+
+from gemino.cli import main
+
+if __name__ == "__main__":
+    # Hash verification runs in worker processes, needed for the frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
+    sys.exit(main())
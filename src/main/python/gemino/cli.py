@@ -0,0 +1,365 @@
+"""
+gemino-cli: copies and verifications without the interface (and without PySide6),
+for headless acquisition servers and scripts.
+
+    gemino-cli copy SOURCE DESTINATION [DESTINATION ...] [options]
+    gemino-cli plan SOURCE DESTINATION [DESTINATION ...] [options]
+    gemino-cli verify CONTAINER.aff4
+
+Exit status: 0 if every destination was copied and verified, 1 if a destination failed
+(lost, not enough space, verification failed), 2 on errors.
+"""
+
+import argparse
+import os
+import os.path as path
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from .core import (
+    AFF4_COMPRESSIONS,
+    DEFAULT_MEMORY_CEILING,
+    DURABILITY_POLICIES,
+    CapacityPlanner,
+    CopyEngine,
+    MiB,
+    ProgressData,
+    SourceManifest,
+    VerifyEngine,
+    algorithms,
+    container_summary,
+)
+from .vars import VERSION
+
+STATUS_LABELS = {0: "Copying", 1: "Verifying", 4: "Verifying", 7: "Exporting"}
+
+
+class ConsoleProgress:
+    """
+    Progress callback of the engines, printing the progress of each destination every interval seconds.
+    """
+
+    def __init__(
+        self, total_bytes: int, total_files: int, interval: float = 2.0, quiet=False
+    ):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.interval = interval
+        self.quiet = quiet
+        self.statuses = {}  # {dst: status, ...} last status of each destination
+        self.__last_print = 0.0
+
+    def __call__(self, progress: ProgressData):
+        if progress.status not in STATUS_LABELS:
+            # End of the job, nothing per destination
+            return
+        for dst, progress_status in progress.payload.items():
+            self.statuses[dst] = progress_status["status"]
+            log = progress_status.get("log")
+            if log:
+                # Verification log of AFF4 containers
+                print(log, end="")
+        now = time.monotonic()
+        if self.quiet or now - self.__last_print < self.interval:
+            return
+        self.__last_print = now
+        for dst, progress_status in progress.payload.items():
+            processed_bytes = progress_status["processed_bytes"]
+            percent = (
+                100 * processed_bytes / self.total_bytes if self.total_bytes else 100
+            )
+            print(
+                f"[{STATUS_LABELS[progress.status]}] {dst}: {percent:.1f}% - "
+                f"{processed_bytes / 10**9:.2f}/{self.total_bytes / 10**9:.2f} GB - "
+                f"{progress_status['processed_files']}/{self.total_files} files - "
+                f"{progress_status['current_file']}",
+                file=sys.stderr,
+            )
+
+    def failed(self, destinations: list) -> list:
+        """
+        :return: destinations not copied and verified (lost during the copy or failing the verification)
+        """
+        return [dst for dst in destinations if self.statuses.get(dst) != "done"]
+
+
+def volume_space(destination: str) -> tuple:
+    """
+    :return: bytes available on the volume of destination, its cluster size (0 if unknown)
+    """
+    if hasattr(os, "statvfs"):
+        stat = os.statvfs(destination)
+        return stat.f_bavail * stat.f_frsize, stat.f_frsize
+    return shutil.disk_usage(destination).free, 0
+
+
+def base_path(source: str) -> str:
+    # Name of the copy on the destinations, as in the interface
+    name = path.basename(path.normpath(source))
+    return name if name != "" else "[root]"
+
+
+def plan_destinations(args, manifest: SourceManifest) -> list:
+    """
+    :return: [CapacityPlan, ...] of the destinations, printed
+    """
+    planner = CapacityPlanner(manifest)
+    plans = []
+    for destination in args.destinations:
+        free, cluster_size = volume_space(destination)
+        plan = planner.plan(
+            destination,
+            free,
+            cluster_size,
+            hashes=args.hashes,
+            aff4=args.aff4 is not None,
+            csv_log=args.csv,
+            chunk_manifest=args.chunk_manifest and args.aff4 is None,
+        )
+        print(
+            f"{destination}: {plan.describe()} - {plan.free / 10**9:.2f} GB Free"
+            f" - {plan.cluster_size} Bytes Clusters{'' if plan.fits else ' - ! Insufficient Space !'}"
+        )
+        plans.append(plan)
+    return plans
+
+
+def scan(source: str) -> SourceManifest:
+    print(f"Scanning {source}...")
+    manifest = SourceManifest.scan(source)
+    print(f"{manifest.total_files} Files - {manifest.total_bytes / 10**9:.2f} GB")
+    return manifest
+
+
+def plan(args) -> int:
+    manifest = scan(args.source)
+    plans = plan_destinations(args, manifest)
+    return 0 if all(plan.fits for plan in plans) else 1
+
+
+def copy(args) -> int:
+    manifest = scan(args.source)
+    plans = plan_destinations(args, manifest)
+    if not args.ignore_space and not all(plan.fits for plan in plans):
+        print(
+            "Not enough space on all the destinations (--ignore-space to copy anyway)",
+            file=sys.stderr,
+        )
+        return 1
+
+    aff4_filename = ""
+    if args.aff4 is not None:
+        aff4_filename = (args.aff4 or base_path(args.source)) + ".aff4"
+    destinations = [path.normpath(destination) for destination in args.destinations]
+    for destination in destinations:
+        if args.aff4 is not None:
+            dst_path = path.join(destination, aff4_filename)
+            exists = path.exists(dst_path)
+        else:
+            dst_path = path.join(destination, base_path(args.source))
+            exists = not args.resume and path.exists(dst_path) and os.listdir(dst_path)
+        if exists and not args.overwrite:
+            print(
+                f"{dst_path} already exists (--overwrite to copy anyway)",
+                file=sys.stderr,
+            )
+            return 2
+
+    progress = ConsoleProgress(
+        manifest.total_bytes, manifest.total_files, quiet=args.quiet
+    )
+    engine = CopyEngine(
+        args.source,
+        destinations,
+        args.hashes,
+        manifest.total_files,
+        manifest.total_bytes,
+        {"operator": args.operator, "intake": args.intake, "notes": args.notes},
+        args.aff4 is not None,
+        aff4_filename,
+        args.csv,
+        async_multicast=args.async_multicast,
+        resume=args.resume and args.aff4 is None,
+        source_manifest=manifest,
+        kernel_copy=args.kernel_copy and args.aff4 is None,
+        memory_ceiling=max(2, args.memory_ceiling) * MiB,
+        chunk_manifest=args.chunk_manifest and args.aff4 is None,
+        repair=args.repair,
+        uncached_verify=args.uncached_verify and args.aff4 is None,
+        durability=args.durability,
+        file_compression=args.file_compression,
+        progress=progress,
+    )
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        engine.terminate()
+        for destination in destinations:
+            try:
+                report_file_path = path.join(
+                    destination, f"{engine.base_path}_copy_report.txt"
+                )
+                with open(report_file_path, "a", encoding="utf-8") as report_file:
+                    report_file.write(
+                        f"\nUser interrupted copy process at: {datetime.now().isoformat()}"
+                    )
+            except FileNotFoundError as error:
+                print(f"Error writing to report: {error}", file=sys.stderr)
+        print("Copy interrupted", file=sys.stderr)
+        return 130
+
+    failed = progress.failed(destinations)
+    for destination in failed:
+        print(
+            f"{destination}: {progress.statuses.get(destination, 'lost')} - see the copy report",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+def verify(args) -> int:
+    print(f"Reading {args.container}...")
+    total_files, total_bytes = container_summary(args.container)
+    progress = ConsoleProgress(total_bytes, total_files, quiet=args.quiet)
+    engine = VerifyEngine(args.container, total_files, total_bytes, progress)
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        print("Verification interrupted", file=sys.stderr)
+        return 130
+    return 1 if progress.failed([args.container]) else 0
+
+
+def parser() -> argparse.ArgumentParser:
+    hash_algos = [algorithm.name for algorithm in algorithms()]
+    main_parser = argparse.ArgumentParser(
+        prog="gemino-cli",
+        description="Forensic copy of a folder to several destinations, hashing and verifying the copies.",
+    )
+    main_parser.add_argument("--version", action="version", version=VERSION)
+    commands = main_parser.add_subparsers(dest="command", required=True)
+
+    copy_parser = commands.add_parser(
+        "copy", help="copy a folder to the destinations and verify the copies"
+    )
+    plan_parser = commands.add_parser(
+        "plan", help="space (and time) the copy of a folder takes on the destinations"
+    )
+    for command_parser in (copy_parser, plan_parser):
+        command_parser.add_argument("source", help="folder to copy")
+        command_parser.add_argument(
+            "destinations", nargs="+", help="folders the copy is written to"
+        )
+        command_parser.add_argument(
+            "--hash",
+            dest="hashes",
+            action="append",
+            choices=hash_algos,
+            help=f"hashing algorithm, repeat for several (default: {', '.join(algorithm.name for algorithm in algorithms() if algorithm.forensic)})",
+        )
+        command_parser.add_argument(
+            "--aff4",
+            nargs="?",
+            const="",
+            metavar="NAME",
+            help="write an AFF4-L container (NAME.aff4, named after the source if not set) instead of a folder",
+        )
+        command_parser.add_argument(
+            "--csv", action="store_true", help="write a CSV log with file metadata"
+        )
+        command_parser.add_argument(
+            "--chunk-manifest",
+            action="store_true",
+            help="record chunk hashes of large files, to locate corrupt byte ranges",
+        )
+
+    copy_parser.add_argument("--operator", default="", help="operator name")
+    copy_parser.add_argument("--intake", default="", help="intake number")
+    copy_parser.add_argument("--notes", default="", help="notes for the report")
+    copy_parser.add_argument(
+        "--async-multicast",
+        action="store_true",
+        help="let faster destinations run ahead of slower ones",
+    )
+    copy_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume an interrupted copy, skipping the files already copied",
+    )
+    copy_parser.add_argument(
+        "--kernel-copy",
+        action="store_true",
+        help="copy extra destinations in the kernel, without going through memory",
+    )
+    copy_parser.add_argument(
+        "--memory-ceiling",
+        type=int,
+        default=DEFAULT_MEMORY_CEILING // MiB,
+        metavar="MB",
+        help="memory the copy buffers can use at most (default: %(default)s)",
+    )
+    copy_parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="copy again corrupt byte ranges from the source (with --chunk-manifest)",
+    )
+    copy_parser.add_argument(
+        "--uncached-verify",
+        action="store_true",
+        help="verify the data read from the media, bypassing the page cache",
+    )
+    copy_parser.add_argument(
+        "--durability",
+        choices=DURABILITY_POLICIES,
+        default="none",
+        help="when the copied files are flushed to the media (default: %(default)s)",
+    )
+    copy_parser.add_argument(
+        "--file-compression",
+        choices=AFF4_COMPRESSIONS,
+        default="stored",
+        help="compression of the files of the AFF4-L container that compress, chosen per file from a sample of its start (default: %(default)s)",
+    )
+    copy_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="copy even if the copy already exists on a destination",
+    )
+    copy_parser.add_argument(
+        "--ignore-space",
+        action="store_true",
+        help="copy even if a destination seems to lack the space needed",
+    )
+    copy_parser.add_argument(
+        "--quiet", action="store_true", help="do not print the progress"
+    )
+    copy_parser.set_defaults(function=copy)
+    plan_parser.set_defaults(function=plan)
+
+    verify_parser = commands.add_parser(
+        "verify", help="verify the hashes of an AFF4-L container"
+    )
+    verify_parser.add_argument("container", help="AFF4-L container")
+    verify_parser.add_argument(
+        "--quiet", action="store_true", help="do not print the progress"
+    )
+    verify_parser.set_defaults(function=verify)
+    return main_parser
+
+
+def main(argv: list = None) -> int:
+    args = parser().parse_args(argv)
+    if getattr(args, "hashes", ()) is None:
+        args.hashes = [
+            algorithm.name for algorithm in algorithms() if algorithm.forensic
+        ]
+    if hasattr(args, "source") and not path.isdir(args.source):
+        print(f"{args.source} is not a folder", file=sys.stderr)
+        return 2
+    try:
+        return args.function(args)
+    except Exception as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 2
@@ -0,0 +1,15 @@
+# Core of gemino, without Qt: source scan, capacity planning, folder and AFF4 copies, verification and export.
+# Engines report their progress as ProgressData to a callback; the interface runs them in an EngineThread,
+# gemino-cli (see gemino/cli.py) and scripts call run() directly, PySide6 is not needed.
+
+from ..threads.common.engine import Engine
+from ..threads.common.manifest import SourceManifest
+from ..threads.common.utils import ProgressData
+from ..threads.aff4.utils import container_summary
+from ..threads.copy.algorithms import algorithms, available
+from ..threads.copy.capacity import CapacityPlan, CapacityPlanner
+from ..threads.copy.logical.compression import AFF4_COMPRESSIONS
+from ..threads.copy.logical.copy import CopyEngine, VerifyEngine
+from ..threads.copy.tuning import DEFAULT_MEMORY_CEILING, MiB
+from ..threads.copy.utils import DURABILITY_POLICIES
+from ..threads.export import ExportEngine
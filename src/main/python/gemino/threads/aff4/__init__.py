@@ -1,2 +0,0 @@
-from .get_summary import GetSummaryThread
-from .open_container import OpenContainerThread
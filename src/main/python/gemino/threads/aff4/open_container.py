@@ -1,11 +1,12 @@
 from PySide6.QtCore import QThread, Signal
 from pyaff4 import utils, rdfvalue, escaping, lexicon, zip, container
-from urllib.parse import unquote
 
 from ..common.utils import ProgressData
 from ..common.threads import TaskThread
-from .common import AFF4Item
-from .utils import iterate_folder
+from .utils import read_items
+
+# Items sent to the tree at once while the metadata of the container is read
+BATCH_SIZE = 1000
 
 
 class OpenContainerThread(TaskThread):
@@ -16,62 +17,48 @@ class OpenContainerThread(TaskThread):
 
     def task(self):
         """
-        :return: volume, items
+        :return: batches of items (status 2) as they are read, then the path of the container
         """
-        items = {}
-
-        volume = container.Container.openURNtoContainer(
-            rdfvalue.URN.FromFileName(self.__src)
-        )
-
-        iterate_folder(items, volume, lexicon.standard11.FolderImage)
-        # This is to be compliant with unicode.aff4 in reference images,
-        # although it looks like an issue with reference image or base library.
-        iterate_folder(items, volume, lexicon.standard11.base + "FolderImage")
-
+        items = []
         processed_items = 0
 
-        for image in volume.images():
-            # Each image is a file in the container.
-
-            filesize = int(
-                volume.resolver.store.get(image.urn).get(lexicon.AFF4_STREAM_SIZE)
-            )
-            path = unquote(image.urn.Parse().path[1:])
-            items[path] = AFF4Item(
-                name=None,
-                size=filesize,
-                modify=str(
-                    volume.resolver.store.get(image.urn).get(
-                        lexicon.standard11.lastWritten
-                    )
-                ),
-                create=str(
-                    volume.resolver.store.get(image.urn).get(
-                        lexicon.standard11.birthTime
-                    )
-                ),
-                urn=image.urn,
-                path=path,
-            )
+        # The tree is populated from the metadata read in a stream, pyaff4 only loads the container
+        # once an item is opened (see OpenVolumeThread)
+        for item in read_items(self.__src):
+            items.append(item)
             processed_items += 1
-            self.task_progress.emit(
-                ProgressData(
-                    1,
-                    {
-                        "current_item": str(image.urn),
-                        "processed_items": processed_items,
-                    },
-                )
-            )
+            if len(items) == BATCH_SIZE:
+                self.__emit_items(items, processed_items)
+                items = []
+        self.__emit_items(items, processed_items)
+
+        self.task_progress.emit(ProgressData(0, {"src_container_path": self.__src}))
 
+    def __emit_items(self, items: list, processed_items: int):
+        self.task_progress.emit(ProgressData(2, {"aff4_items": items}))
         self.task_progress.emit(
             ProgressData(
-                0,
+                1,
                 {
-                    "aff4_volume": volume,
-                    "aff4_items": dict(sorted(items.items())),
-                    "src_container_path": self.__src,
+                    "current_item": str(items[-1].urn) if items else None,
+                    "processed_items": processed_items,
                 },
             )
         )
+
+
+class OpenVolumeThread(TaskThread):
+    """
+    Loads the container with pyaff4, needed to read the files and the metadata of the container.
+    """
+
+    def __init__(self, src):
+        super().__init__()
+        self.__src = src
+
+    def task(self):
+        self.task_progress.emit(ProgressData(1, {"message": "Opening Container"}))
+        volume = container.Container.openURNtoContainer(
+            rdfvalue.URN.FromFileName(self.__src)
+        )
+        self.task_progress.emit(ProgressData(0, {"aff4_volume": volume}))
@@ -0,0 +1,286 @@
+# Streaming reader of the metadata (information.turtle) of AFF4 containers.
+# pyaff4 parses the whole turtle into an rdflib graph, then copies every triple into its resolver before a container
+# can be listed: minutes and gigabytes for containers with millions of files. The listing of a container (the tree of
+# the viewer, its number of files and size) only needs the images, one at a time: the turtle is read in chunks and
+# tokenized, the statements of each subject being yielded as soon as they are parsed.
+
+import re
+from typing import NamedTuple
+from urllib.parse import urljoin
+
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+CHUNK_SIZE = 1024 * 1024
+# Characters kept ahead of the current token, most tokens are parsed without refilling the buffer
+LOOKAHEAD = 64 * 1024
+# Characters after a token telling it does not continue (eg. the subtag of a language tag)
+TOKEN_MARGIN = 16
+
+TOKENS = re.compile(
+    r"""
+    (?:\s+|\#[^\n]*)*
+    (?:
+    (?P<iri><[^>\\]*(?:\\.[^>\\]*)*>)
+    | (?P<long_string>\"\"\"[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*\"\"\"|'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*''')
+    | (?P<string>"[^"\\\n\r]*(?:\\.[^"\\\n\r]*)*"|'[^'\\\n\r]*(?:\\.[^'\\\n\r]*)*')
+    | (?P<at>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+    | (?P<datatype>\^\^)
+    | (?P<number>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.?\d+[eE][+-]?\d+|\d*\.\d+|\d+))
+    | (?P<blank>_:[\w\-.]*[\w\-])
+    | (?P<name>(?:[A-Za-z][\w\-.]*)?:(?:(?:[\w\-:%]|\\.)(?:[\w\-.:%]|\\.)*)?|[A-Za-z][\w\-]*)
+    | (?P<punctuation>[.;,\[\]()])
+    )
+    """,
+    re.VERBOSE,
+)
+SKIP = re.compile(r"(?:\s+|#[^\n]*)+")
+ESCAPES = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))", re.DOTALL)
+CHARACTER_ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f"}
+
+
+class Literal(NamedTuple):
+    value: str  # lexical form
+    datatype: str = None
+    language: str = None
+
+    def __str__(self):
+        return self.value
+
+
+class TurtleError(ValueError):
+    pass
+
+
+def unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+    return ESCAPES.sub(
+        lambda match: (
+            chr(int(match.group(1) or match.group(2), 16))
+            if match.group(3) is None
+            else CHARACTER_ESCAPES.get(match.group(3), match.group(3))
+        ),
+        text,
+    )
+
+
+class TurtleReader:
+    """
+    Reads turtle statements from a text stream, a chunk at a time.
+    IRIs are str, literals Literal, blank nodes "_:label".
+    """
+
+    def __init__(self, stream, base: str = ""):
+        """
+        :param stream: text stream of the turtle
+        :param base: IRI relative IRIs are resolved against
+        """
+        self.stream = stream
+        self.base = base
+        self.prefixes = {}
+        self.__buffer = ""
+        self.__position = 0
+        self.__eof = False
+        self.__peeked = None
+        self.__blank_nodes = 0
+        # Subjects of the blank node property lists ([ ... ]) of the statement being parsed
+        self.__nested = []
+
+    def subjects(self):
+        """
+        Yields the statements of each subject, as (subject, {predicate: [object, ...], ...}).
+        A subject is yielded once per block of statements (ending with "."), which is once per subject for the turtle
+        written by rdflib, pyaff4 and gemino.
+        """
+        while True:
+            token = self.__next()
+            if token is None:
+                return
+            kind, value = token
+            if kind == "at" or (kind == "name" and value.upper() in ("PREFIX", "BASE")):
+                self.__directive(kind, value)
+                continue
+            if token == ("punctuation", "["):
+                predicates = self.__blank_node_properties()[1]
+                if self.__peek() != ("punctuation", "."):
+                    # [ ... ] followed by more predicates of the blank node
+                    self.__predicate_objects(predicates)
+            else:
+                predicates = {}
+                self.__nested.append((self.__term(token), predicates))
+                self.__predicate_objects(predicates)
+            self.__expect(".")
+            # The subject of the statement first, then its blank nodes
+            nested, self.__nested = self.__nested, []
+            yield from nested
+
+    def __directive(self, kind: str, value: str):
+        sparql = kind == "name"
+        directive = value.lstrip("@").upper()
+        if directive == "PREFIX":
+            kind, prefix = self.__next_or_fail()
+            if kind != "name" or not prefix.endswith(":"):
+                raise TurtleError(f"Invalid prefix {prefix}")
+            self.prefixes[prefix[:-1]] = self.__iri(self.__next_or_fail())
+        elif directive == "BASE":
+            self.base = self.__iri(self.__next_or_fail())
+        else:
+            raise TurtleError(f"Unknown directive {value}")
+        if not sparql:
+            self.__expect(".")
+
+    def __predicate_objects(self, predicates: dict):
+        while True:
+            token = self.__next_or_fail()
+            if token == ("name", "a"):
+                predicate = RDF_TYPE
+            else:
+                predicate = self.__iri(token)
+            objects = predicates.setdefault(predicate, [])
+            while True:
+                objects.append(self.__object(self.__next_or_fail()))
+                if self.__peek() != ("punctuation", ","):
+                    break
+                self.__next()
+            # ";" can be repeated and can end the list
+            if self.__peek() != ("punctuation", ";"):
+                return
+            while self.__peek() == ("punctuation", ";"):
+                self.__next()
+            if self.__peek() in (("punctuation", "."), ("punctuation", "]")):
+                return
+
+    def __object(self, token):
+        kind, value = token
+        if token == ("punctuation", "["):
+            return self.__blank_node_properties()[0]
+        if token == ("punctuation", "("):
+            items = []
+            while self.__peek() != ("punctuation", ")"):
+                items.append(self.__object(self.__next_or_fail()))
+            self.__next()
+            return tuple(items)
+        if kind in ("string", "long_string"):
+            quotes = 3 if kind == "long_string" else 1
+            lexical = unescape(value[quotes:-quotes])
+            following = self.__peek()
+            if following is not None and following[0] == "at":
+                self.__next()
+                return Literal(lexical, language=following[1][1:])
+            if following == ("datatype", "^^"):
+                self.__next()
+                return Literal(lexical, self.__iri(self.__next_or_fail()))
+            return Literal(lexical, XSD + "string")
+        if kind == "number":
+            if "e" in value or "E" in value:
+                return Literal(value, XSD + "double")
+            return Literal(value, XSD + ("decimal" if "." in value else "integer"))
+        if kind == "name" and value in ("true", "false"):
+            return Literal(value, XSD + "boolean")
+        return self.__term(token)
+
+    def __blank_node_properties(self) -> tuple:
+        """
+        :return: subject, predicates of the blank node property list [ ... ]
+        """
+        self.__blank_nodes += 1
+        subject, predicates = f"_:gemino{self.__blank_nodes}", {}
+        self.__nested.append((subject, predicates))
+        if self.__peek() != ("punctuation", "]"):
+            self.__predicate_objects(predicates)
+        self.__expect("]")
+        return subject, predicates
+
+    def __term(self, token) -> str:
+        if token[0] == "blank":
+            return token[1]
+        return self.__iri(token)
+
+    def __iri(self, token) -> str:
+        kind, value = token
+        if kind == "iri":
+            iri = unescape(value[1:-1])
+            if self.base and ":" not in iri.split("/", 1)[0]:
+                # Relative IRI
+                return urljoin(self.base, iri)
+            return iri
+        if kind == "name" and ":" in value:
+            prefix, local = value.split(":", 1)
+            if prefix not in self.prefixes:
+                raise TurtleError(f"Undeclared prefix {prefix}")
+            if "\\" in local:
+                local = re.sub(r"\\(.)", r"\1", local)
+            return self.prefixes[prefix] + local
+        raise TurtleError(f"Unexpected {value}")
+
+    def __expect(self, punctuation: str):
+        token = self.__next()
+        if token != ("punctuation", punctuation):
+            raise TurtleError(
+                f"Expected {punctuation}, found {token[1] if token else 'end of file'}"
+            )
+
+    def __next_or_fail(self):
+        token = self.__next()
+        if token is None:
+            raise TurtleError("Unexpected end of file")
+        return token
+
+    def __peek(self):
+        if self.__peeked is None:
+            self.__peeked = self.__read()
+        return self.__peeked
+
+    def __next(self):
+        """
+        :return: (kind, text) of the next token, None at the end of the stream
+        """
+        if self.__peeked is not None:
+            token, self.__peeked = self.__peeked, None
+            return token
+        return self.__read()
+
+    def __read(self):
+        while True:
+            buffer, position = self.__buffer, self.__position
+            if not self.__eof and len(buffer) - position < LOOKAHEAD:
+                self.__fill()
+                continue
+            # Whitespace and comments are matched with the token
+            match = TOKENS.match(buffer, position)
+            if not self.__eof and (
+                match is None
+                or match.end() + TOKEN_MARGIN > len(buffer)
+                or (
+                    # Unterminated long string, not to be read as an empty string
+                    buffer.startswith(('"""', "'''"), match.start(match.lastgroup))
+                    and match.lastgroup != "long_string"
+                )
+            ):
+                # The token might continue in the next chunk
+                self.__fill(grow=True)
+                continue
+            if match is None:
+                if SKIP.fullmatch(buffer, position) or position == len(buffer):
+                    return None
+                raise TurtleError(
+                    f"Invalid turtle: {buffer[position:position + 40].strip()!r}"
+                )
+            kind = match.lastgroup
+            text = match.group(kind)
+            self.__position = match.end()
+            if kind == "name" and text.endswith("."):
+                # A local name cannot end with ".", it ends the statement
+                self.__position -= len(text) - len(text.rstrip("."))
+                text = text.rstrip(".")
+            return kind, text
+
+    def __fill(self, grow=False):
+        size = CHUNK_SIZE
+        if grow:
+            size = max(CHUNK_SIZE, len(self.__buffer) - self.__position)
+        chunk = self.stream.read(size)
+        if not chunk:
+            self.__eof = True
+        self.__buffer = self.__buffer[self.__position :] + chunk
+        self.__position = 0
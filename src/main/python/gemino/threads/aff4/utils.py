@@ -1,29 +1,71 @@
+import io
 from pyaff4 import utils, rdfvalue, escaping, lexicon, zip, container
 from urllib.parse import unquote
 from zipfile import ZipFile
 
 from .common import AFF4Item
+from .turtle import TurtleReader
 
 
-def iterate_folder(items, volume, rdf_lexicon):
-    for folder in volume.resolver.QueryPredicateObject(
-        volume.urn, lexicon.AFF4_TYPE, rdf_lexicon
-    ):
-        path = unquote(folder.Parse().path[1:])
-
-        items[path] = AFF4Item(
-            name=None,
-            size=None,
-            modify=str(
-                volume.resolver.store.get(folder).get(lexicon.standard11.lastWritten)
-            ),
-            create=str(
-                volume.resolver.store.get(folder).get(lexicon.standard11.birthTime)
-            ),
-            urn=folder,
-            path=path,
-            folder=True,
+def container_lexicon(zip_file: ZipFile):
+    """
+    :return: types of the file and folder images of the container, by the version of the AFF4 standard it follows
+    """
+    folder_types = (
+        lexicon.standard11.FolderImage,
+        lexicon.standard11.base + "FolderImage",
+    )
+    try:
+        version = container.parseProperties(
+            zip_file.read("version.txt").decode("utf-8")
         )
+    except KeyError:
+        version = {}
+    if version.get("major") == "1" and version.get("minor") == "0":
+        # scudette's winpmem pre-std implementation, at 1.0
+        return (lexicon.standard.Image,), folder_types
+    return (lexicon.standard11.FileImage,), folder_types
+
+
+def read_items(src: str):
+    """
+    Yields the AFF4Item of each file and folder of the container, as the metadata of the container is read
+    (see turtle.py), without loading the container with pyaff4.
+    :param src: AFF4-L container
+    """
+    with ZipFile(src) as zip_file:
+        file_types, folder_types = container_lexicon(zip_file)
+        with zip_file.open("information.turtle") as turtle:
+            reader = TurtleReader(io.TextIOWrapper(turtle, encoding="utf-8"))
+            for subject, predicates in reader.subjects():
+                types = predicates.get(lexicon.AFF4_TYPE, ())
+                folder = any(folder_type in types for folder_type in folder_types)
+                if not folder and not any(
+                    file_type in types for file_type in file_types
+                ):
+                    continue
+                urn = rdfvalue.URN(subject)
+                path = unquote(urn.Parse().path[1:])
+                size = None
+                if not folder:
+                    size = int(str(first(predicates, lexicon.AFF4_STREAM_SIZE)))
+                yield AFF4Item(
+                    name=None,
+                    size=size,
+                    modify=str(first(predicates, lexicon.standard11.lastWritten)),
+                    create=str(first(predicates, lexicon.standard11.birthTime)),
+                    urn=urn,
+                    path=path,
+                    folder=folder,
+                )
+
+
+def first(predicates: dict, predicate: str):
+    """
+    :return: first object of predicate, None if missing
+    """
+    objects = predicates.get(predicate)
+    return objects[0] if objects else None
 
 
 def number_of_items(src: str) -> int:
@@ -38,3 +80,24 @@ def number_of_items(src: str) -> int:
         items = myzip.infolist()
 
     return len(items)
+
+
+def container_summary(src: str, progress=None) -> tuple:
+    """
+    :param src: AFF4-L container
+    :param progress: progress(current_item, processed_items) called after each file
+    :return: file number, total size (bytes)
+    """
+    filecount = 0
+    total_size = 0
+
+    for item in read_items(src):
+        if item.folder:
+            continue
+        # Each image is a file in the container.
+        filecount += 1
+        total_size += item.size
+        if progress is not None:
+            progress(str(item.urn), filecount)
+
+    return filecount, total_size
@@ -1 +0,0 @@
-from .size_calc import SizeCalcThread
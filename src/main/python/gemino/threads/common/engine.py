@@ -0,0 +1,34 @@
+from typing import Callable
+
+from .utils import ProgressData
+
+
+class Engine:
+    """
+    Job (copy, verification, export) independent of Qt, run by an EngineThread in the interface
+    or directly by the command line. Progress is reported as ProgressData to the progress callback.
+    """
+
+    def __init__(self, progress: Callable = None):
+        """
+        :param progress: progress(ProgressData) called from the thread running the engine
+        """
+        self.progress = progress
+        # termination_guard(enabled) called around the sections the thread running the engine
+        # must not be terminated in, set by EngineThread
+        self.termination_guard = None
+
+    def emit(self, progress: ProgressData):
+        if self.progress is not None:
+            self.progress(progress)
+
+    def setTerminationEnabled(self, enabled: bool = True):
+        if self.termination_guard is not None:
+            self.termination_guard(enabled)
+
+    def run(self):
+        raise NotImplementedError
+
+    def terminate(self):
+        # Release what does not stop with the thread running the engine (eg. worker processes)
+        pass
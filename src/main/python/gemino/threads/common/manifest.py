@@ -0,0 +1,46 @@
+import os
+
+from .walker import TreeWalker, FileEntry
+
+
+class SourceManifest:
+    """
+    Listing of a source tree with the stat of every file, taken once when the source is selected
+    and consumed by the copy instead of walking and stat'ing the source again.
+    """
+
+    def __init__(self, top: str, directories: list):
+        """
+        :param top: source folder
+        :param directories: [DirectoryEntry, ...] in os.walk order
+        """
+        self.top = top
+        self.directories = directories
+        self.total_bytes = 0
+        self.total_files = 0
+        for directory in directories:
+            for entry in directory.files:
+                if entry.stat is None:
+                    continue
+                self.total_bytes += entry.size
+                self.total_files += 1
+
+    @classmethod
+    def scan(cls, top: str, workers: int = 16) -> "SourceManifest":
+        return cls(top, list(TreeWalker(top, workers).walk()))
+
+    def __iter__(self):
+        return iter(self.directories)
+
+    @staticmethod
+    def changed(entry: FileEntry, stat: os.stat_result) -> bool:
+        """
+        Whether a file changed since the manifest was taken
+        :param entry: file in the manifest
+        :param stat: current stat of the file (eg. fstat of the file just opened)
+        """
+        return (
+            entry.stat is None
+            or entry.stat.st_mtime_ns != stat.st_mtime_ns
+            or entry.stat.st_size != stat.st_size
+        )
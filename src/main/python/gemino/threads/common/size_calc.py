@@ -1,8 +1,9 @@
 # Generic utils for gemino's
 
 from PySide6.QtCore import QThread, Signal
-import os
-import os.path as path
+
+from .manifest import SourceManifest
+from ..copy.capacity import CapacityPlanner
 
 
 class SizeCalcThread(QThread):
@@ -13,16 +14,12 @@ class SizeCalcThread(QThread):
         self.folder = folder
 
     def run(self):
-        dir_size = 0
-        total_files = 0
-        for dirpath, dirnames, filenames in os.walk(self.folder):
-            for filename in filenames:
-                try:
-                    filepath = path.join(dirpath, filename)
-                    dir_size += path.getsize(filepath)
-                    total_files += 1
-                except (FileNotFoundError, OSError):
-                    pass
+        # The manifest is reused by the copy instead of walking the source again
+        manifest = SourceManifest.scan(self.folder)
+        # Footprint of the copy on the destinations, computed once for the whole manifest
+        planner = CapacityPlanner(manifest)
 
-        self.data_ready.emit((dir_size, total_files))
+        self.data_ready.emit(
+            (manifest.total_bytes, manifest.total_files, manifest, planner)
+        )
         self.quit()
@@ -1,5 +1,6 @@
 from PySide6.QtCore import QThread, Signal
 
+from .engine import Engine
 from .utils import ProgressData
 
 
@@ -15,3 +16,24 @@ class TaskThread(QThread):
 
     def task(self):
         raise NotImplementedError
+
+
+class EngineThread(QThread):
+    """
+    Runs an engine (copy, verification, export) for the interface, its progress emitted as a signal.
+    """
+
+    progress = Signal(object)
+
+    def __init__(self, engine: Engine):
+        super().__init__()
+        self.engine = engine
+        self.engine.progress = self.progress.emit
+        self.engine.termination_guard = self.setTerminationEnabled
+
+    def run(self):
+        self.engine.run()
+
+    def terminate(self):
+        self.engine.terminate()
+        super().terminate()
@@ -0,0 +1,101 @@
+# Concurrent directory walker, enumerating the source tree once for both the size calculation and the copy.
+# Each directory is listed with os.scandir on a pool of threads, subdirectories being scanned as soon as
+# they are found, which hides the latency of network shares. The stat of each file comes from the DirEntry
+# (free on Windows, one call per file otherwise) and is kept with the file.
+
+import os
+import os.path as path
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    stat: os.stat_result | None  # None if the file could not be stat'ed
+
+    @property
+    def name(self) -> str:
+        return path.basename(self.path)
+
+
+class DirectoryEntry(NamedTuple):
+    path: str
+    dirnames: list  # [name, ...]
+    files: list  # [FileEntry, ...]
+
+
+class TreeWalker:
+    """
+    Walks a tree like os.walk (top-down, same order, symlinks to directories listed but not followed,
+    unreadable directories skipped) with the directories listed in parallel.
+    """
+
+    def __init__(self, top: str, workers: int = 16):
+        self.top = top
+        self.workers = workers
+
+    def walk(self):
+        """
+        :return: DirectoryEntry for each directory of the tree, in os.walk order
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            pending = [executor.submit(self.__scan, executor, self.top)]
+            while pending:
+                directory, subdirectories = pending.pop().result()
+                # Depth first, the first subdirectory is yielded next
+                pending.extend(reversed(subdirectories))
+                if directory is not None:
+                    yield directory
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def files(self):
+        """
+        :return: FileEntry for each file of the tree, in os.walk order
+        """
+        for directory in self.walk():
+            yield from directory.files
+
+    def __scan(self, executor: ThreadPoolExecutor, dirpath: str):
+        dirnames = []
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        dirnames.append(entry.name)
+                        try:
+                            is_symlink = entry.is_symlink()
+                        except OSError:
+                            is_symlink = False
+                        if not is_symlink:
+                            subdirectories.append(entry.path)
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # Still part of the tree, copying it will report the error
+                        stat = None
+                    files.append(
+                        FileEntry(entry.path, stat.st_size if stat else 0, stat)
+                    )
+        except OSError:
+            # Unreadable directory, skipped as os.walk does
+            return None, []
+
+        try:
+            futures = [
+                executor.submit(self.__scan, executor, subdirectory)
+                for subdirectory in subdirectories
+            ]
+        except RuntimeError:
+            # Walk interrupted, the executor does not accept new directories
+            return None, []
+        return DirectoryEntry(dirpath, dirnames, files), futures
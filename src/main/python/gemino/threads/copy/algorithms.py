@@ -0,0 +1,77 @@
+# Registry of the hash algorithms offered for copies.
+# Forensic algorithms (md5, sha1, sha256) are the ones reports are usually checked against, fast integrity
+# algorithms (blake2b, and blake3 / xxh3 when their packages are installed) make verifying very large copies
+# much cheaper. Algorithms whose package is missing are not registered and never offered.
+
+import hashlib
+from typing import Callable, NamedTuple
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+class HashAlgorithm(NamedTuple):
+    name: str
+    factory: Callable  # factory(parallel: bool) -> hash object, hashlib like
+    forensic: bool  # widely accepted in forensic reports, selected by default
+
+
+_registry = {}
+
+
+def register(name: str, factory: Callable, forensic: bool = False):
+    """
+    :param name: name of the algorithm, used in the reports, the CSV columns and the .<name> hash files
+    :param factory: factory(parallel: bool) returning a new hash object (update/hexdigest),
+           parallel allows the hash object to use several cores for a single update
+    :param forensic: widely accepted in forensic reports, selected by default
+    """
+    _registry[name] = HashAlgorithm(name, factory, forensic)
+
+
+def algorithms() -> list:
+    """
+    :return: [HashAlgorithm, ...] available, in the order they are offered
+    """
+    return list(_registry.values())
+
+
+def available(hashes: list) -> list:
+    """
+    :param hashes: names of hash algorithms
+    :return: names of the algorithms available, in the same order
+    """
+    return [hash_algo for hash_algo in hashes if hash_algo in _registry]
+
+
+def new_hash(name: str, parallel: bool = True):
+    """
+    :param name: name of a registered algorithm
+    :param parallel: False when several files are already hashed at once on all the cores (eg. verification)
+    :return: new hash object
+    """
+    return _registry[name].factory(parallel)
+
+
+register("md5", lambda parallel: hashlib.md5(), forensic=True)
+register("sha1", lambda parallel: hashlib.sha1(), forensic=True)
+register("sha256", lambda parallel: hashlib.sha256(), forensic=True)
+register("blake2b", lambda parallel: hashlib.blake2b())
+if blake3 is not None:
+    # Tree hash, large updates are hashed on all the cores
+    register(
+        "blake3",
+        lambda parallel: blake3.blake3(
+            max_threads=blake3.blake3.AUTO if parallel else 1
+        ),
+    )
+if xxhash is not None:
+    # Non cryptographic, only detects accidental corruption
+    register("xxh3_128", lambda parallel: xxhash.xxh3_128())
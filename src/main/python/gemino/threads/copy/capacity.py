@@ -0,0 +1,229 @@
+# Pre-flight estimate of the space a copy takes on each destination, from the source manifest.
+# Files take whole clusters on the destination filesystem, each directory at least one cluster for its entries
+# (long names taking several entries on FAT/exFAT) and the copy writes its report, hash files, index and journal
+# next to the data. On FAT/exFAT drives with large clusters, a copy of many small files can need far more space
+# than the size of the source.
+
+import json
+import os.path as path
+from typing import NamedTuple
+
+from ..common.manifest import SourceManifest
+from .algorithms import new_hash
+from .chunks import CHUNK_HASH, CHUNK_SIZE
+
+# Cluster size assumed when the destination does not report one
+DEFAULT_CLUSTER_SIZE = 4096
+# FAT/exFAT directory entry, a long name takes one more entry every 13 characters (the most of any filesystem)
+DIRECTORY_ENTRY_SIZE = 32
+# NTFS allocates a 1KB record in the MFT for every file and directory, out of the free space
+FILE_RECORD_SIZE = 1024
+# Per file fields of the reports besides the path and the hashes (CSV sizes and timestamps, journal keys)
+CSV_ROW_SIZE = 160
+JOURNAL_RECORD_SIZE = 80
+CHUNK_RECORD_SIZE = 100
+# Zip headers and RDF metadata of a file in an AFF4-L container, besides its path
+AFF4_FILE_SIZE = 2048
+# Header and details of the text reports, hash files and other files of the copy
+REPORTS_SIZE = 64 * 1024
+
+
+class CapacityPlan(NamedTuple):
+    destination: str
+    required: int  # bytes the copy takes on the destination
+    free: int  # bytes free on the destination
+    cluster_size: int
+    # Write throughput measured on the destination by a previous copy, bytes/s
+    throughput: float | None
+
+    @property
+    def fits(self) -> bool:
+        return self.required <= self.free
+
+    @property
+    def duration(self) -> float | None:
+        """
+        :return: estimated seconds to write the copy, None if the throughput of the destination is unknown
+        """
+        if not self.throughput:
+            return None
+        return self.required / self.throughput
+
+    def describe(self) -> str:
+        text = f"{self.required / 10**9:.2f} GB Needed"
+        if self.duration is not None:
+            text += f" - ~{format_duration(self.duration)} at {self.throughput / 10**6:.0f} MB/s"
+        return text
+
+
+class CapacityPlanner:
+    """
+    Space taken by a copy of a source manifest, for the cluster size and filesystem of each destination.
+    The manifest is gone through once, the footprint for a cluster size is then cached.
+    """
+
+    def __init__(self, manifest: SourceManifest):
+        self.manifest = manifest
+        self.total_bytes = manifest.total_bytes
+        self.files = 0
+        self.directories = 0
+        # Paths of the files relative to the copy, as written in the reports
+        self.path_bytes = 0
+        self.json_path_bytes = 0  # same paths, escaped in the JSON journal
+        self.chunks = 0  # chunks of the files large enough for the chunk manifest
+        self.chunked_files = 0
+        self.chunked_path_bytes = 0
+        self.__sizes = []  # size of every file
+        self.__directory_entries = []  # bytes of directory entries of every directory
+        self.__footprints = {}  # {cluster_size: bytes of files and directories, ...}
+
+        for directory in manifest:
+            rel_path = path.relpath(directory.path, manifest.top)
+            entries = 2  # "." and ".."
+            for name in directory.dirnames:
+                entries += self.__name_entries(name)
+            for entry in directory.files:
+                entries += self.__name_entries(entry.name)
+                if entry.stat is None:
+                    continue
+                filepath = path.normpath(path.join(rel_path, entry.name))
+                path_bytes = len(filepath.encode("utf-8", "surrogateescape"))
+                self.files += 1
+                self.path_bytes += path_bytes
+                self.json_path_bytes += len(json.dumps(filepath))
+                self.__sizes.append(entry.size)
+                if entry.size > CHUNK_SIZE:
+                    self.chunked_files += 1
+                    self.chunked_path_bytes += path_bytes
+                    self.chunks += -(-entry.size // CHUNK_SIZE)
+            self.directories += 1
+            self.__directory_entries.append(entries * DIRECTORY_ENTRY_SIZE)
+
+    @staticmethod
+    def __name_entries(name: str) -> int:
+        return 2 + -(-len(name) // 13)
+
+    def data_footprint(self, cluster_size: int) -> int:
+        """
+        :param cluster_size: allocation unit of the destination
+        :return: bytes taken by the files and directories of the source
+        """
+        if cluster_size not in self.__footprints:
+            self.__footprints[cluster_size] = sum(
+                -(-size // cluster_size) * cluster_size for size in self.__sizes
+            ) + sum(
+                max(1, -(-entries // cluster_size)) * cluster_size
+                for entries in self.__directory_entries
+            )
+        return self.__footprints[cluster_size]
+
+    def reports_size(
+        self,
+        hashes: list,
+        csv_log: bool = False,
+        journal: bool = True,
+        chunk_manifest: bool = False,
+    ) -> int:
+        """
+        :param hashes: algorithms of the copy
+        :return: bytes of the reports written with the copy (text report, index, hash files, CSV, journal, chunks)
+        """
+        digests = {
+            hash_algo: new_hash(hash_algo, parallel=False).digest_size * 2
+            for hash_algo in hashes
+        }
+        hashes_bytes = sum(digests.values())
+        # Text report and index: hashes and path of every file
+        size = 2 * (self.path_bytes + self.files * (hashes_bytes + 3 * len(hashes) + 2))
+        # One .<algo> file per hash
+        size += sum(
+            self.path_bytes + self.files * (digest + 2) for digest in digests.values()
+        )
+        if csv_log:
+            size += self.path_bytes + self.files * (
+                CSV_ROW_SIZE + hashes_bytes + len(hashes)
+            )
+        if journal:
+            size += self.json_path_bytes + self.files * (
+                JOURNAL_RECORD_SIZE
+                + sum(
+                    len(hash_algo) + digest + 8 for hash_algo, digest in digests.items()
+                )
+            )
+        if chunk_manifest:
+            chunk_digest = new_hash(CHUNK_HASH, parallel=False).digest_size * 2
+            size += (
+                self.chunked_path_bytes
+                + self.chunked_files * CHUNK_RECORD_SIZE
+                + self.chunks * (chunk_digest + 4)
+            )
+        return size + REPORTS_SIZE
+
+    def footprint(
+        self,
+        cluster_size: int,
+        filesystem: str = "",
+        hashes: list = (),
+        aff4: bool = False,
+        csv_log: bool = False,
+        chunk_manifest: bool = False,
+    ) -> int:
+        """
+        :param cluster_size: allocation unit of the destination, DEFAULT_CLUSTER_SIZE if unknown (0 or less)
+        :param filesystem: type of the destination filesystem (eg. "exfat", "ntfs")
+        :param hashes: algorithms of the copy
+        :param aff4: copy to an AFF4-L container instead of a folder
+        :param csv_log: CSV report written
+        :param chunk_manifest: chunk manifest written
+        :return: bytes the copy takes on the destination
+        """
+        if cluster_size <= 0:
+            cluster_size = DEFAULT_CLUSTER_SIZE
+        if aff4:
+            # A single container file, with the headers and metadata of each file
+            container = (
+                self.total_bytes + self.files * AFF4_FILE_SIZE + 2 * self.path_bytes
+            )
+            size = -(-container // cluster_size) * cluster_size
+            size += self.reports_size(hashes, csv_log, journal=False)
+        else:
+            size = self.data_footprint(cluster_size)
+            size += self.reports_size(hashes, csv_log, True, chunk_manifest)
+            if filesystem.lower().startswith("ntfs"):
+                size += (self.files + self.directories) * FILE_RECORD_SIZE
+        return size
+
+    def plan(
+        self,
+        destination: str,
+        free: int,
+        cluster_size: int,
+        filesystem: str = "",
+        throughput: float = None,
+        **options,
+    ) -> CapacityPlan:
+        """
+        :param destination: destination folder
+        :param free: bytes free on the destination
+        :param throughput: write throughput measured on the destination by a previous copy, bytes/s
+        :param options: options of the copy, see footprint
+        """
+        return CapacityPlan(
+            destination,
+            self.footprint(cluster_size, filesystem, **options),
+            free,
+            cluster_size if cluster_size > 0 else DEFAULT_CLUSTER_SIZE,
+            throughput,
+        )
+
+
+def format_duration(seconds: float) -> str:
+    """
+    :return: duration rounded for display (eg. "45 s", "12 min", "3 h 20 min")
+    """
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60:02d} min"
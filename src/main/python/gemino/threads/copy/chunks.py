@@ -0,0 +1,304 @@
+# Per-chunk digests of the large files, recorded in a sidecar manifest next to the copy report.
+# Each file larger than a chunk gets one digest per CHUNK_SIZE bytes, computed from the blocks read for the copy.
+# The verification computes them again along with the hashes of the file and locates the corrupt byte ranges,
+# which can then be repaired by copying again only those ranges from the source.
+
+import json
+import os
+import os.path as path
+from typing import NamedTuple
+
+from .algorithms import new_hash
+from .direct import aligned_buffer, open_verify
+from .utils import write_all
+
+CHUNK_SIZE = 64 * 1024 * 1024
+# Always available and cryptographic, a chunk matching its digest has not been altered
+CHUNK_HASH = "blake2b"
+
+
+class Chunk(NamedTuple):
+    algorithm: str
+    # Size of the whole file, a file of another size fails all its chunks
+    file_size: int
+    offset: int
+    length: int
+    digest: str
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.length - 1
+
+
+class ChunkDigests:
+    """
+    Hash object (hashlib like) computing a digest for every chunk_size bytes of the data.
+    """
+
+    def __init__(self, algorithm: str = CHUNK_HASH, chunk_size: int = CHUNK_SIZE):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.digests = []
+        self.__hash = new_hash(algorithm, parallel=False)
+        self.__hashed = 0  # bytes of the current chunk hashed
+
+    def update(self, data):
+        data = memoryview(data)
+        while data:
+            length = min(len(data), self.chunk_size - self.__hashed)
+            self.__hash.update(data[:length])
+            self.__hashed += length
+            data = data[length:]
+            if self.__hashed == self.chunk_size:
+                self.digests.append(self.__hash.hexdigest())
+                self.__hash = new_hash(self.algorithm, parallel=False)
+                self.__hashed = 0
+
+    def hexdigests(self) -> list:
+        """
+        :return: digests of all the chunks, the last one possibly shorter
+        """
+        if self.__hashed:
+            return self.digests + [self.__hash.hexdigest()]
+        return list(self.digests)
+
+
+class ChunkManifest:
+    """
+    Chunk digests of the large files copied to a destination, kept next to the copy report.
+    One JSON record per file, appended as soon as the file is hashed, the last record of a file wins.
+    """
+
+    def __init__(self, dst: str, base_path: str):
+        self.path = path.join(dst, f"{base_path}_chunk_manifest.jsonl")
+        self.recorded = set()  # files recorded by the copy being resumed
+        self.__manifest_file = None
+
+    def open(self, resume: bool):
+        """
+        :param resume: keep the chunk digests of the previous copy, otherwise start a new manifest
+        """
+        if resume and path.exists(self.path):
+            self.recorded = {
+                filepath for filepath, chunks in self.chunks().items() if chunks
+            }
+            with open(self.path, "rb") as manifest_file:
+                manifest_file.seek(0, os.SEEK_END)
+                truncated = False
+                if manifest_file.tell():
+                    manifest_file.seek(-1, os.SEEK_END)
+                    truncated = manifest_file.read(1) != b"\n"
+            self.__manifest_file = open(self.path, "a", encoding="utf-8")
+            if truncated:
+                # Do not append the next record to the truncated one
+                self.__manifest_file.write("\n")
+        else:
+            self.recorded = set()
+            self.__manifest_file = open(self.path, "w", encoding="utf-8")
+
+    def append(self, filepath: str, size: int, chunk_digests: ChunkDigests):
+        """
+        :param filepath: path of the file relative to the copy
+        :param size: size of the file
+        :param chunk_digests: ChunkDigests the whole file went through
+        """
+        self.__manifest_file.write(
+            json.dumps(
+                {
+                    "path": filepath,
+                    "size": size,
+                    "algorithm": chunk_digests.algorithm,
+                    "chunk_size": chunk_digests.chunk_size,
+                    "chunks": chunk_digests.hexdigests(),
+                }
+            )
+            + "\n"
+        )
+        self.__manifest_file.flush()
+
+    def forget(self, filepath: str):
+        """
+        Drop the chunk digests recorded by the copy being resumed, the file is copied again
+        :param filepath: path of the file relative to the copy
+        """
+        self.__manifest_file.write(
+            json.dumps(
+                {
+                    "path": filepath,
+                    "size": 0,
+                    "algorithm": CHUNK_HASH,
+                    "chunk_size": CHUNK_SIZE,
+                    "chunks": [],
+                }
+            )
+            + "\n"
+        )
+        self.__manifest_file.flush()
+        self.recorded.discard(filepath)
+
+    def close(self):
+        if self.__manifest_file is not None:
+            self.__manifest_file.close()
+            self.__manifest_file = None
+
+    def remove(self):
+        # Copy verified, no corrupt range left to locate
+        try:
+            os.remove(self.path)
+        except OSError as error:
+            print(f"Unable to remove chunk manifest: {error}")
+
+    def records(self):
+        """
+        Stream the files recorded, in the order they were appended
+        :return: (filepath, [Chunk, ...]) for each record, no chunk for a forgotten file
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                for line in manifest_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line is truncated if the copy was interrupted while writing it
+                        continue
+                    yield record["path"], file_chunks(record)
+        except FileNotFoundError:
+            return
+
+    def chunks(self) -> dict:
+        """
+        Chunks of the files recorded, only large files are recorded so this is kept in memory
+        :return: {filepath: [Chunk, ...], ...} from the last record of each file
+        """
+        return dict(self.records())
+
+
+def file_chunks(record: dict) -> list:
+    """
+    :param record: manifest record of a file
+    :return: [Chunk, ...] of the file
+    """
+    chunk_size = record["chunk_size"]
+    return [
+        Chunk(
+            record["algorithm"],
+            record["size"],
+            index * chunk_size,
+            min(chunk_size, record["size"] - index * chunk_size),
+            digest,
+        )
+        for index, digest in enumerate(record["chunks"])
+    ]
+
+
+def hash_chunk(
+    filepath: str,
+    chunk: Chunk,
+    buffer_size: int,
+    progress=None,
+    key=None,
+    uncached: bool = False,
+):
+    """
+    Hash a chunk of a file, to be run in a worker process.
+    :param filepath: file to hash
+    :param chunk: Chunk to hash
+    :param buffer_size: size of the blocks read
+    :param progress: queue receiving (key, hashed_bytes) after each block
+    :param key: key identifying the chunk in progress updates
+    :param uncached: read the data from the media, bypassing the page cache (see direct.py)
+    :return: hex digest of the chunk, None if the file does not have the size of the source
+    """
+    with open_verify(filepath, uncached) as file:
+        if os.fstat(file.fileno()).st_size != chunk.file_size:
+            return None
+        hash_buffer = new_hash(chunk.algorithm, parallel=False)
+        view = memoryview(
+            (aligned_buffer if uncached else bytearray)(min(buffer_size, chunk.length))
+        )
+        file.seek(chunk.offset)
+        remaining = chunk.length
+        while remaining:
+            read = file.readinto(view[: min(remaining, len(view))])
+            if not read:
+                break
+            hash_buffer.update(view[:read])
+            remaining -= read
+            if progress is not None:
+                progress.put((key, read))
+    return hash_buffer.hexdigest()
+
+
+def repair_chunks(
+    src_file_path: str,
+    dst_file_path: str,
+    chunks: list,
+    buffer_size: int,
+    uncached: bool = False,
+) -> list:
+    """
+    Copy again the corrupt chunks of a file from the source, checking the source still matches the chunk
+    digests before writing anything, then verifying the chunks written.
+    :param src_file_path: source file
+    :param dst_file_path: corrupt file on the destination
+    :param chunks: [Chunk, ...] failing the verification
+    :param buffer_size: size of the blocks read
+    :param uncached: verify the chunks written from the media, bypassing the page cache
+    :return: [Chunk, ...] repaired and verified
+    """
+    repaired = []
+    view = memoryview(
+        bytearray(min(buffer_size, max(chunk.length for chunk in chunks)))
+    )
+    with open(src_file_path, "rb", buffering=0) as src_file, open(
+        dst_file_path, "r+b", buffering=0
+    ) as dst_file:
+        for chunk in chunks:
+            # Chunks are much larger than the buffer, the source is read twice rather than kept in memory
+            hash_buffer = new_hash(chunk.algorithm, parallel=False)
+            src_file.seek(chunk.offset)
+            remaining = chunk.length
+            while remaining:
+                read = src_file.readinto(view[: min(remaining, len(view))])
+                if not read:
+                    break
+                hash_buffer.update(view[:read])
+                remaining -= read
+            if remaining or hash_buffer.hexdigest() != chunk.digest:
+                print(f"Source changed since the copy, not repairing: {src_file_path}")
+                continue
+            # Changes to the source from now on fail the verification of the chunks written
+            src_file.seek(chunk.offset)
+            dst_file.seek(chunk.offset)
+            remaining = chunk.length
+            while remaining:
+                read = src_file.readinto(view[: min(remaining, len(view))])
+                if not read:
+                    break
+                write_all(dst_file, view[:read])
+                remaining -= read
+            repaired.append(chunk)
+        if repaired:
+            # Drop anything written past the end of the source file
+            dst_file.truncate(repaired[0].file_size)
+            os.fsync(dst_file.fileno())
+    return [
+        chunk
+        for chunk in repaired
+        if hash_chunk(dst_file_path, chunk, buffer_size, uncached=uncached)
+        == chunk.digest
+    ]
+
+
+def format_ranges(chunks: list) -> str:
+    """
+    :param chunks: [Chunk, ...] in file order
+    :return: byte ranges covered by the chunks, adjacent chunks merged (eg. "bytes 0-67108863, ...")
+    """
+    ranges = []
+    for chunk in chunks:
+        if ranges and ranges[-1][1] + 1 == chunk.offset:
+            ranges[-1][1] = chunk.end
+        else:
+            ranges.append([chunk.offset, chunk.end])
+    return "bytes " + ", ".join(f"{start}-{end}" for start, end in ranges)
@@ -0,0 +1,120 @@
+# Reads bypassing the page cache, so that the verification reads the data back from the media and not from
+# the pages just written, without evicting the working set of the machine either.
+# Linux: O_DIRECT with page aligned buffers, the kernel writes back the dirty pages of the range first.
+# macOS: F_NOCACHE. Elsewhere, or if the filesystem refuses O_DIRECT, the file is flushed and its pages
+# dropped before reading, the pages read being dropped as they go (posix_fadvise DONTNEED).
+
+import errno
+import mmap
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+ALIGNMENT = mmap.PAGESIZE
+
+DIRECT_IO = hasattr(os, "O_DIRECT")
+NOCACHE = fcntl is not None and hasattr(fcntl, "F_NOCACHE")
+FADVISE = hasattr(os, "posix_fadvise")
+# Reads can bypass the page cache on this platform
+UNCACHED_READS = DIRECT_IO or NOCACHE or FADVISE
+
+
+def aligned_buffer(size: int):
+    """
+    :return: writable buffer of size bytes, aligned on a page as required by O_DIRECT
+    """
+    # Anonymous maps are page aligned
+    return mmap.mmap(-1, size)
+
+
+class UncachedReader:
+    """
+    Read-only raw file (readinto, seek, fileno) reading the data from the media.
+    Buffers handed to readinto should come from aligned_buffer, unaligned reads go through a bounce buffer.
+    """
+
+    def __init__(self, filepath: str):
+        self.direct = False
+        self.fd = None
+        if DIRECT_IO:
+            try:
+                self.fd = os.open(filepath, os.O_RDONLY | os.O_DIRECT)
+                self.direct = True
+            except OSError as error:
+                if error.errno != errno.EINVAL:
+                    raise
+                # Filesystem without direct I/O support (eg. tmpfs)
+        if self.fd is None:
+            self.fd = os.open(filepath, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            if NOCACHE:
+                fcntl.fcntl(self.fd, fcntl.F_NOCACHE, 1)
+            elif FADVISE:
+                # Dirty pages cannot be dropped, write them to the media first
+                os.fsync(self.fd)
+                os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        self.__position = 0
+        self.__bounce = None
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def seek(self, offset: int):
+        self.__position = offset
+        if not self.direct:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+
+    def readinto(self, view) -> int:
+        view = memoryview(view)
+        if self.direct:
+            read = self.__read_direct(view)
+        else:
+            read = os.readv(self.fd, [view])
+            if FADVISE and not NOCACHE and read:
+                os.posix_fadvise(self.fd, self.__position, read, os.POSIX_FADV_DONTNEED)
+        self.__position += read
+        return read
+
+    def __read_direct(self, view) -> int:
+        # O_DIRECT needs the position, the size and the buffer aligned
+        if not self.__position % ALIGNMENT and not len(view) % ALIGNMENT:
+            try:
+                return os.preadv(self.fd, [view], self.__position)
+            except OSError as error:
+                if error.errno != errno.EINVAL:
+                    raise
+                # Buffer not aligned, read through the bounce buffer
+        start = self.__position - self.__position % ALIGNMENT
+        skip = self.__position - start
+        length = -(-(skip + len(view)) // ALIGNMENT) * ALIGNMENT
+        if self.__bounce is None or len(self.__bounce) < length:
+            self.__bounce = aligned_buffer(length)
+        bounce = memoryview(self.__bounce)[:length]
+        read = max(0, os.preadv(self.fd, [bounce], start) - skip)
+        read = min(read, len(view))
+        view[:read] = bounce[skip : skip + read]
+        return read
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def open_verify(filepath: str, uncached: bool):
+    """
+    :param uncached: read the data from the media, bypassing the page cache
+    :return: raw file to read filepath from
+    """
+    if uncached and UNCACHED_READS:
+        return UncachedReader(filepath)
+    return open(filepath, "rb", buffering=0)
@@ -0,0 +1,109 @@
+# Computes all the hashes of the same data at once.
+# Each algorithm runs in its own long-lived thread (hashlib releases the GIL while hashing large updates),
+# the data being split in chunks hashed in lockstep: all the algorithms hash the same chunk at the same time,
+# while it is still in the CPU cache, instead of each one streaming the whole block from memory on its own.
+
+from threading import Barrier, BrokenBarrierError
+
+from .utils import Block, BufferWorker
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_chunks(hash_buffer, data, chunk_size: int, barrier: Barrier | None):
+    data = memoryview(data)
+    try:
+        for start in range(0, len(data), chunk_size):
+            hash_buffer.update(data[start : start + chunk_size])
+            if barrier is not None:
+                # Wait for the other algorithms to be done with the chunk
+                barrier.wait()
+    except BaseException as error:
+        if barrier is not None and not isinstance(error, BrokenBarrierError):
+            # Do not leave the other algorithms waiting for this one
+            barrier.abort()
+        raise
+
+
+class _HashLane(BufferWorker):
+    # The other lanes wait for this one at each chunk, its jobs always run
+    skip_after_error = False
+
+
+class MultiHasher:
+    """
+    Updates several hash objects (hashlib like) with the same data, one thread per hash object.
+    """
+
+    def __init__(self, lanes: int, chunk_size: int = CHUNK_SIZE):
+        """
+        :param lanes: maximum number of hash objects updated at once, usually the number of algorithms
+        :param chunk_size: size of the chunks hashed in lockstep
+        """
+        self.chunk_size = chunk_size
+        self.workers = [_HashLane() for _ in range(lanes)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+
+    def update(self, hash_buffers: list, block: Block):
+        """
+        Hash a block in the background, the block is released once per hash object
+        :param hash_buffers: hash objects to update, at most one per lane
+        :param block: Block with len(hash_buffers) consumers
+        """
+        barrier = Barrier(len(hash_buffers)) if len(hash_buffers) > 1 else None
+        for worker, hash_buffer in zip(self.workers, hash_buffers):
+            worker.submit(
+                _hash_chunks,
+                hash_buffer,
+                block.data,
+                self.chunk_size,
+                barrier,
+                block=block,
+            )
+
+    def update_data(self, hash_buffers: list, data):
+        """
+        Hash data and wait for all the hash objects to be updated
+        :param hash_buffers: hash objects to update, at most one per lane
+        :param data: bytes like
+        """
+        if len(hash_buffers) == 1:
+            # Nothing to run in parallel, no thread handoff
+            hash_buffers[0].update(data)
+            return
+        barrier = Barrier(len(hash_buffers))
+        for worker, hash_buffer in zip(self.workers, hash_buffers):
+            worker.submit(_hash_chunks, hash_buffer, data, self.chunk_size, barrier)
+        self.wait()
+
+    def wait(self):
+        """
+        Wait for all the data submitted to be hashed, raising the errors of the threads
+        """
+        errors = []
+        for worker in self.workers:
+            try:
+                worker.wait()
+            except Exception as error:
+                errors.append(error)
+        if errors:
+            # The lanes aborted by a failing one only report a broken barrier
+            raise next(
+                (
+                    error
+                    for error in errors
+                    if not isinstance(error, BrokenBarrierError)
+                ),
+                errors[0],
+            )
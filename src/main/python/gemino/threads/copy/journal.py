@@ -0,0 +1,104 @@
+import json
+import os
+import os.path as path
+
+
+class CopyJournal:
+    """
+    Journal of the files completely written to a destination, kept next to the copy report.
+    One JSON record per line, appended as soon as a file is closed, so that an interrupted copy
+    can be resumed without copying again the files already on the destination.
+    """
+
+    def __init__(self, dst: str, base_path: str):
+        self.path = path.join(dst, f"{base_path}_copy_journal.jsonl")
+        self.__journal_file = None
+
+    def load(self) -> dict:
+        """
+        :return: {filepath: record, ...} for all the files recorded, the last record of a file wins
+        """
+        records = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line is truncated if the copy was interrupted while writing it
+                        continue
+                    records[record["path"]] = record
+        except FileNotFoundError:
+            pass
+        return records
+
+    def open(self, resume: bool):
+        """
+        :param resume: keep the records of the previous copy, otherwise start a new journal
+        """
+        if resume and path.exists(self.path):
+            with open(self.path, "rb") as journal_file:
+                journal_file.seek(0, os.SEEK_END)
+                truncated = False
+                if journal_file.tell():
+                    journal_file.seek(-1, os.SEEK_END)
+                    truncated = journal_file.read(1) != b"\n"
+            self.__journal_file = open(self.path, "a", encoding="utf-8")
+            if truncated:
+                # Do not append the next record to the truncated one
+                self.__journal_file.write("\n")
+        else:
+            self.__journal_file = open(self.path, "w", encoding="utf-8")
+
+    def append(self, record: dict):
+        self.__journal_file.write(json.dumps(record) + "\n")
+        self.__journal_file.flush()
+
+    def close(self):
+        if self.__journal_file is not None:
+            self.__journal_file.close()
+            self.__journal_file = None
+
+    def remove(self):
+        # Copy done and verified, nothing left to resume
+        try:
+            os.remove(self.path)
+        except OSError as error:
+            print(f"Unable to remove copy journal: {error}")
+
+
+def journal_record(filepath: str, src_stat: os.stat_result, file_hashes: dict) -> dict:
+    """
+    :param filepath: path of the file relative to the copy
+    :param src_stat: stat of the source file when it was copied
+    :param file_hashes: {hash_name: hash_value, ...}
+    """
+    return {
+        "path": filepath,
+        "size": src_stat.st_size,
+        "mtime_ns": src_stat.st_mtime_ns,
+        "hashes": file_hashes,
+    }
+
+
+def resumable(
+    record: dict | None, src_stat: os.stat_result, hashes: list, dst_file_path: str
+) -> bool:
+    """
+    Whether a file recorded in a journal does not need to be copied again
+    :param record: journal record of the file, None if not recorded
+    :param src_stat: current stat of the source file
+    :param hashes: hash algorithms of the current copy
+    :param dst_file_path: file on the destination
+    """
+    if record is None:
+        return False
+    if record["size"] != src_stat.st_size or record["mtime_ns"] != src_stat.st_mtime_ns:
+        # Source changed since it was copied
+        return False
+    if any(hash_algo not in record["hashes"] for hash_algo in hashes):
+        return False
+    try:
+        return path.getsize(dst_file_path) == record["size"]
+    except OSError:
+        return False
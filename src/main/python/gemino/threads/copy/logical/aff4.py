@@ -1,16 +1,31 @@
 # Utils specific to AFF4 container creation, and placeholder for subclass for AFF4 logical imaging.
 
-from pyaff4 import utils, rdfvalue, escaping, lexicon, zip, container
+import os
+import platform
+from datetime import datetime
+from queue import Queue
+
+import tzlocal
+from pyaff4 import utils, rdfvalue, escaping, lexicon, zip, container, logical
+from pyaff4 import hashes as aff4_hashes
 from pyaff4.aff4 import ProgressContext
 from past.utils import old_div
 
+if platform.system() == "Linux":
+    from pyaff4 import statx
+
 from ...common.utils import ProgressData
+from ..algorithms import new_hash
+from ..hashing import MultiHasher
+from ..utils import Block, BlockRing, BufferWorker, write_all
 
 
 class ProgressContextListener(ProgressContext):
 
-    copy_progress = None
+    copy_progress = None  # progress(ProgressData) of the engine
     destinations = None
+    # {dst: progress_status, ...} of the other destinations, reported as is
+    payload = None
     processed_files = None
     current_file = None
     status = ""
@@ -25,20 +40,138 @@ class ProgressContextListener(ProgressContext):
         if now > self.last_time + old_div(1000000, 4):
             self.last_time = now
             self.last_offset = readptr
-            self.copy_progress.emit(
-                ProgressData(
-                    status=self.main_status,
-                    payload={
-                        dst: {
-                            "status": self.status,
-                            "processed_bytes": readptr,
-                            "processed_files": self.processed_files,
-                            "current_file": self.current_file,
-                        }
-                        for dst in self.destinations
-                    },
+            payload = dict(self.payload or {})
+            for dst in self.destinations:
+                payload[dst] = {
+                    "status": self.status,
+                    "processed_bytes": readptr,
+                    "processed_files": self.processed_files,
+                    "current_file": self.current_file,
+                }
+            self.copy_progress(ProgressData(status=self.main_status, payload=payload))
+
+
+class StreamHasher(object):
+    """
+    Drop-in for pyaff4's linear_hasher.StreamHasher, hashing the data read with all the algorithms
+    at once on a MultiHasher instead of one algorithm after the other.
+    Algorithms without an AFF4 datatype (eg. fast integrity hashes) are computed alongside, in others.
+    Given a reader and a ring, the stream is read ahead in blocks by the reader and hashed in the background,
+    pyaff4 compressing and writing the data already read in the meantime: finish() before getting the hashes.
+    """
+
+    def __init__(
+        self,
+        parent,
+        hashDatatypes,
+        multi_hasher: MultiHasher,
+        other_hashes: list = (),
+        reader: BufferWorker = None,
+        ring: BlockRing = None,
+        length: int = None,
+    ):
+        """
+        :param parent: source file, unbuffered
+        :param reader: long-lived worker reading the streams ahead, one after the other
+        :param ring: BlockRing bounding the blocks read ahead
+        :param length: bytes read ahead at most, the size of the file written
+        """
+        self.parent = parent
+        self.multi_hasher = multi_hasher
+        self.hashes = []
+        self.hashToType = {}
+        for hashDataType in hashDatatypes:
+            h = aff4_hashes.new(hashDataType)
+            self.hashToType[h] = hashDataType
+            self.hashes.append(h)
+        self.others = {hash_algo: new_hash(hash_algo) for hash_algo in other_hashes}
+        self.pipelined = reader is not None and ring is not None
+        self.__blocks = Queue()  # Blocks read ahead, then None (or the error) once done
+        self.__block = None  # Block being read by pyaff4
+        self.__offset = 0  # Position in the block being read
+        self.__done = not self.pipelined  # End of the blocks read ahead reached
+        self.__stopped = False
+        if self.pipelined:
+            reader.submit(self.__read_ahead, ring, length)
+
+    def read(self, bytes):
+        if not self.pipelined:
+            data = self.parent.read(bytes)
+            hash_buffers = self.hashes + list(self.others.values())
+            if len(data) > 0 and hash_buffers:
+                self.multi_hasher.update_data(hash_buffers, data)
+            return data
+        chunks = []
+        while bytes > 0 and not self.__done:
+            if self.__block is None:
+                block = self.__blocks.get()
+                if block is None or isinstance(block, BaseException):
+                    self.__done = True
+                    if block is not None:
+                        raise block
+                    break
+                self.__block = block
+                self.__offset = 0
+            data = self.__block.data[self.__offset : self.__offset + bytes]
+            chunks.append(data.tobytes())
+            self.__offset += len(data)
+            bytes -= len(data)
+            if self.__offset == len(self.__block.data):
+                self.__release()
+        return b"".join(chunks)
+
+    def finish(self):
+        """
+        Stop reading ahead and wait for the data read to be hashed
+        """
+        self.close()
+        self.multi_hasher.wait()
+
+    def close(self):
+        """
+        Stop reading ahead, dropping the blocks not read by pyaff4 (eg. on errors), before closing the source
+        """
+        self.__stopped = True
+        self.__release()
+        while not self.__done:
+            block = self.__blocks.get()
+            if block is None or isinstance(block, BaseException):
+                self.__done = True
+            else:
+                block.release()
+
+    def getHash(self, dataType):
+        return next(h for h in self.hashes if self.hashToType[h] == dataType)
+
+    def __release(self):
+        if self.__block is not None:
+            block, self.__block = self.__block, None
+            block.release()
+
+    def __read_ahead(self, ring: BlockRing, length: int):
+        hash_buffers = self.hashes + list(self.others.values())
+        try:
+            remaining = length
+            while not self.__stopped and (remaining is None or remaining > 0):
+                block = ring.read(
+                    self.parent,
+                    len(hash_buffers) + 1,
+                    min(ring.block_size, remaining or ring.block_size),
                 )
-            )
+                if block is None:
+                    break
+                if self.__stopped:
+                    ring.release(block)
+                    break
+                if remaining is not None:
+                    remaining -= len(block.data)
+                if hash_buffers:
+                    self.multi_hasher.update(hash_buffers, block)
+                self.__blocks.put(block)
+            self.__blocks.put(None)
+        except BaseException as error:
+            # Raised by read() in the thread of pyaff4
+            self.__blocks.put(error)
 
 
 class LinearVerificationListener(object):
@@ -59,6 +192,220 @@ class LinearVerificationListener(object):
             self.failed[file].append(data)
 
 
+class MirrorWorker(BufferWorker):
+    """
+    Writes the container to another destination, at the offsets it is written to on the first one.
+    A destination failing (disconnected, full) is lost, without stopping the copy to the other ones.
+    """
+
+    def __init__(self, destination: str, file_path: str):
+        """
+        :param destination: destination folder
+        :param file_path: container file on the destination
+        """
+        super().__init__()
+        self.destination = destination
+        self.file_path = file_path
+        self.file_handler = None
+        # Destination not available anymore, following jobs are ignored
+        self.lost = False
+        self.lost_error = None
+        self.written_bytes = 0
+        self.submit(self.__mirror, self.__open)
+
+    def write_block(self, block: Block, offset: int):
+        self.submit(self.__mirror, self.__write, block.data, offset, block=block)
+
+    def truncate(self, size: int):
+        self.submit(self.__mirror, self.__truncate, size)
+
+    def run(self):
+        super().run()
+        if self.file_handler is not None:
+            file_handler, self.file_handler = self.file_handler, None
+            try:
+                file_handler.close()
+            except OSError:
+                pass
+
+    def __mirror(self, job, *args):
+        if self.lost:
+            return
+        try:
+            job(*args)
+        except OSError as error:
+            print(
+                "{} is not available anymore! Deleting from destination list!".format(
+                    self.destination
+                )
+            )
+            self.lost = True
+            self.lost_error = error
+
+    def __open(self):
+        self.file_handler = open(self.file_path, "w+b", buffering=0)
+
+    def __write(self, data, offset):
+        self.file_handler.seek(offset)
+        write_all(self.file_handler, data)
+        self.written_bytes += len(data)
+
+    def __truncate(self, size):
+        self.file_handler.truncate(size)
+
+
+class ContainerFile(object):
+    """
+    Drop-in for the file object of pyaff4's FileBackedObject, the container on the first destination.
+    Writes are queued to a writer thread, pyaff4 going on with the next data while the previous one is written,
+    and replicated at the same offset to the other destinations by a MirrorWorker each: all the containers
+    are byte-identical and the source is read once for all of them.
+    Anything but writes and seeks (reads, truncation, flush) first waits for the writes queued.
+    """
+
+    def __init__(self, file, mirrors: list, ring: BlockRing):
+        """
+        :param file: file object of the container on the first destination
+        :param mirrors: [MirrorWorker, ...] of the other destinations, started
+        :param ring: BlockRing bounding the writes in flight
+        """
+        self.file = file
+        self.writer = BufferWorker()
+        self.writer.start()
+        self.mirrors = mirrors
+        self.ring = ring
+        self.__closed = False
+        # Written before the container was wrapped (eg. by the zip volume when created)
+        self.file.flush()
+        self.__position = self.file.tell()
+        size = self.file.seek(0, 2)
+        if size and mirrors:
+            self.file.seek(0)
+            self.__submit(self.file.read(size), 0, mirrors_only=True)
+        self.file.seek(self.__position)
+
+    def __getattr__(self, name):
+        self.drain()
+        return getattr(self.file, name)
+
+    def write(self, data):
+        self.writer.check()
+        if not isinstance(data, bytes):
+            # The caller may reuse its buffer once written
+            data = bytes(data)
+        self.__submit(data, self.__position)
+        self.__position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.__position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence != os.SEEK_SET:
+            # Relative to the end, of the data written
+            self.drain()
+            offset = self.file.seek(offset, whence)
+        self.__position = offset
+        return offset
+
+    def read(self, size: int = -1):
+        self.drain()
+        self.file.seek(self.__position)
+        data = self.file.read(size)
+        self.__position += len(data)
+        return data
+
+    def truncate(self, size: int = None) -> int:
+        self.drain()
+        size = self.file.truncate(self.__position if size is None else size)
+        for mirror in self.mirrors:
+            if not mirror.lost:
+                mirror.truncate(size)
+        return size
+
+    def flush(self):
+        self.drain()
+        self.file.flush()
+
+    def drain(self):
+        """
+        Wait for the writes queued to the first destination, raising its errors
+        """
+        self.writer.wait()
+
+    def close(self):
+        """
+        Close the container on all the destinations, once everything was written
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        try:
+            try:
+                self.drain()
+            finally:
+                self.writer.stop()
+                self.writer.join()
+                self.file.close()
+        finally:
+            for mirror in self.mirrors:
+                mirror.stop()
+            for mirror in self.mirrors:
+                mirror.join()
+
+    @property
+    def lost(self) -> list:
+        """
+        :return: [MirrorWorker, ...] of the destinations lost while writing
+        """
+        return [mirror for mirror in self.mirrors if mirror.lost]
+
+    def __submit(self, data: bytes, offset: int, mirrors_only: bool = False):
+        mirrors = [mirror for mirror in self.mirrors if not mirror.lost]
+        block = self.ring.block(data, len(mirrors) + (not mirrors_only))
+        if not mirrors_only:
+            self.writer.submit(self.__write, block.data, offset, block=block)
+        for mirror in mirrors:
+            mirror.write_block(block, offset)
+
+    def __write(self, data: bytes, offset: int):
+        self.file.seek(offset)
+        write_all(self.file, data)
+
+
+def fs_metadata(filename: str, stat: os.stat_result) -> logical.FSMetadata:
+    """
+    Same as pyaff4's FSMetadata.create, from a stat already taken (eg. by the source manifest)
+    :param filename: absolute path of the file
+    :param stat: stat of the file
+    :return: platform specific FSMetadata
+    """
+    system = platform.system()
+    local_tz = tzlocal.get_localzone()
+    size = stat.st_size
+    lastWritten = datetime.fromtimestamp(stat.st_mtime, local_tz)
+    accessed = datetime.fromtimestamp(stat.st_atime, local_tz)
+
+    if system == "Windows":
+        birthTime = datetime.fromtimestamp(stat.st_ctime, local_tz)
+        return logical.WindowsFSMetadata(
+            filename, filename, size, lastWritten, accessed, birthTime
+        )
+    recordChanged = datetime.fromtimestamp(stat.st_ctime, local_tz)
+    if system == "Darwin":
+        birthTime = datetime.fromtimestamp(stat.st_birthtime, local_tz)
+        return logical.MacOSFSMetadata(
+            filename, filename, size, lastWritten, accessed, recordChanged, birthTime
+        )
+    if system == "Linux":
+        # Birth time is not part of the stat on Linux
+        birthTime = datetime.fromtimestamp(statx.statx(filename).get_btime(), local_tz)
+        return logical.LinuxFSMetadata(
+            filename, filename, size, lastWritten, accessed, recordChanged, birthTime
+        )
+    return logical.FSMetadata.create(filename)
+
+
 def trimVolume(volume, image):
     """
     Shamelessly taken from aff4.py from aff4/pyaff4
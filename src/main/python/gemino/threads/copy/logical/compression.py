@@ -0,0 +1,117 @@
+# Compression of the segments of AFF4-L containers, stored (uncompressed) by default for compatibility.
+# The AFF4 standard allows zip segments (the files of a logical container) to be stored or deflated, and AFF4
+# image streams (chunked, used here for the large files with lz4) to be compressed chunk by chunk with zlib, lz4
+# or snappy; zstd is not part of the standard. Deflating files that do not compress (pictures, videos, archives)
+# only costs CPU: each file is compressed or stored, a sample at its start being compressed on a pool of threads
+# (zlib releases the GIL) a few files before the writer gets to it, files saving less than MIN_SAVING being stored.
+# The files themselves are compressed by pyaff4 while writing them.
+
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from pyaff4 import lexicon
+
+AFF4_COMPRESSIONS = ("stored", "deflate", "lz4")
+# Compression method of the container, zip segments are deflated unless stored
+CONTAINER_METHODS = {
+    "stored": lexicon.AFF4_IMAGE_COMPRESSION_STORED,
+    "deflate": lexicon.AFF4_IMAGE_COMPRESSION_ZLIB,
+    "lz4": lexicon.AFF4_IMAGE_COMPRESSION_LZ4,
+}
+SAMPLE_SIZE = 256 * 1024
+MIN_SAVING = 0.05
+# Files sampled ahead of the writer, per thread sampling
+SAMPLES_AHEAD = 2
+
+
+class Segment(NamedTuple):
+    compression_method: str  # AFF4 compression of the file
+    # Large files written as zip segments instead of AFF4 image streams
+    large_zip_segment: bool
+
+
+class SegmentCompressor:
+    """
+    Chooses how each file is written to the container, compressed or stored.
+    The compressibility of the next files to write is sampled in parallel, up to SAMPLES_AHEAD files per thread.
+    """
+
+    def __init__(self, compression: str = "stored", workers: int = None):
+        """
+        :param compression: one of AFF4_COMPRESSIONS
+        :param workers: threads sampling the files, one per core if not set
+        """
+        self.compression = compression if compression in AFF4_COMPRESSIONS else "stored"
+        self.method = CONTAINER_METHODS[self.compression]
+        self.compressed_files = 0
+        self.stored_files = 0  # files not compressible enough, stored
+        self.__samples = {}  # {filepath: Future, ...} sampled, or being sampled
+        # [FileEntry, ...] to sample once the writer gets closer
+        self.__queued = deque()
+        self.__executor = None
+        self.__workers = workers or os.cpu_count() or 1
+        if self.compression != "stored":
+            self.__executor = ThreadPoolExecutor(max_workers=self.__workers)
+
+    def prefetch(self, entries: list):
+        """
+        :param entries: [FileEntry, ...] about to be written, in order
+        """
+        if self.__executor is None:
+            return
+        self.__queued.extend(entries)
+        self.__sample_ahead()
+
+    def __sample_ahead(self):
+        while self.__queued and len(self.__samples) < SAMPLES_AHEAD * self.__workers:
+            entry = self.__queued.popleft()
+            if entry.path not in self.__samples:
+                self.__samples[entry.path] = self.__executor.submit(
+                    compressibility, entry.path
+                )
+
+    def segment(self, entry) -> Segment:
+        """
+        :param entry: FileEntry about to be written
+        """
+        if self.__executor is None:
+            return Segment(self.method, True)
+        future = self.__samples.pop(entry.path, None)
+        if future is None and self.__queued and self.__queued[0].path == entry.path:
+            # Writer ahead of the sampling, sampled inline
+            self.__queued.popleft()
+        self.__sample_ahead()
+        try:
+            saving = (
+                future.result() if future is not None else compressibility(entry.path)
+            )
+        except OSError:
+            # Reported when the file itself is read
+            saving = 0.0
+        if saving < MIN_SAVING:
+            self.stored_files += 1
+            return Segment(lexicon.AFF4_IMAGE_COMPRESSION_STORED, True)
+        self.compressed_files += 1
+        # lz4 is only allowed for AFF4 image streams, small files are still deflated zip segments
+        return Segment(self.method, self.compression != "lz4")
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+        self.__samples = {}
+        self.__queued.clear()
+
+
+def compressibility(filepath: str) -> float:
+    """
+    :return: fraction of the sample at the start of the file saved by compressing it
+    """
+    with open(filepath, "rb", buffering=0) as file:
+        data = file.read(SAMPLE_SIZE)
+    if not data:
+        return 0.0
+    return 1 - len(zlib.compress(data, 1)) / len(data)
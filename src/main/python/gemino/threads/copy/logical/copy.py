@@ -1,30 +1,50 @@
-from PySide6.QtCore import QThread, Signal
-
 import os
 import os.path as path
-import hashlib
 from datetime import datetime
 import shutil
 import uuid
-from copy import copy, deepcopy
-import csv
+from copy import copy
 
 from pyaff4 import container
 from pyaff4 import lexicon, logical, escaping
 from pyaff4 import rdfvalue, utils
-from pyaff4 import hashes as aff4_hashes
-from pyaff4 import data_store, linear_hasher
-
-from ..utils import CopyBuffer, HashBuffer
+from pyaff4 import linear_hasher
+
+from ..algorithms import available, new_hash
+from ..chunks import (
+    CHUNK_SIZE,
+    ChunkDigests,
+    ChunkManifest,
+    format_ranges,
+    repair_chunks,
+)
+from ..direct import UNCACHED_READS
+from ..hashing import MultiHasher
+from ..utils import BlockRing, BufferWorker, CopyWorker
+from ..verification import HashVerifier, VerificationScheduler
+from ..journal import CopyJournal, journal_record, resumable
+from ..report import ReportSink
+from ..tuning import BlockSizeController, MiB, DEFAULT_MEMORY_CEILING, throughput
+from ...common.engine import Engine
 from ...common.utils import ProgressData
-from .aff4 import LinearVerificationListener, trimVolume, ProgressContextListener
+from ...common.walker import TreeWalker, FileEntry
+from ...common.manifest import SourceManifest
+from .compression import AFF4_COMPRESSIONS, SegmentCompressor
+from .metadata import ColumnarDataStore
+from .aff4 import (
+    LinearVerificationListener,
+    ContainerFile,
+    MirrorWorker,
+    trimVolume,
+    ProgressContextListener,
+    StreamHasher,
+    fs_metadata,
+)
 from ....vars import VERSION
 
 
-# TODO - Split CopyThread in Two Subclasses for basic and aff4 (and maybe others).
-class CopyThread(QThread):
-    copy_progress = Signal(object)
-
+# TODO - Split CopyEngine in Two Subclasses for basic and aff4 (and maybe others).
+class CopyEngine(Engine):
     def __init__(
         self,
         src: str,
@@ -36,11 +56,23 @@ class CopyThread(QThread):
         aff4: bool,
         aff4_filename: str,
         csv_log: bool,
+        async_multicast: bool = False,
+        resume: bool = False,
+        source_manifest: SourceManifest = None,
+        kernel_copy: bool = False,
+        memory_ceiling: int = DEFAULT_MEMORY_CEILING,
+        chunk_manifest: bool = False,
+        repair: bool = False,
+        uncached_verify: bool = False,
+        durability: str = "none",
+        file_compression: str = "stored",
+        progress=None,
     ):
-        super().__init__()
+        super().__init__(progress)
         self.src = src
         self.destinations = destinations
-        self.hashes = hashes
+        # Algorithms whose package is not installed are left out of the copy
+        self.hashes = available(hashes)
         self.total_files = total_files
         self.file_hashes = {}
         self.total_bytes = total_bytes
@@ -57,6 +89,26 @@ class CopyThread(QThread):
             )
         print(self.aff4, self.aff4_filename, self.destinations)
         self.csv_log = csv_log
+        self.async_multicast = bool(async_multicast)
+        self.resume = bool(resume)
+        # Source tree listed by the size calculation, walked again only if not provided
+        self.source_manifest = source_manifest
+        self.kernel_copy = bool(kernel_copy)
+        # Memory the blocks in flight can use, during the copy and the verification
+        self.memory_ceiling = int(memory_ceiling)
+        # Record the chunk digests of the large files, verified chunk by chunk,
+        # the corrupt chunks being copied again from the source if repair is set
+        self.chunk_manifest = bool(chunk_manifest)
+        self.repair = self.chunk_manifest and bool(repair)
+        # Verify the data read back from the media rather than from the page cache filled by the copy
+        self.uncached_verify = bool(uncached_verify) and UNCACHED_READS
+        # When the destination files are flushed to the media, see DURABILITY_POLICIES
+        self.durability = durability
+        # Compression of the files of AFF4 containers, each file is compressed or stored (see SegmentCompressor)
+        self.file_compression = (
+            file_compression if file_compression in AFF4_COMPRESSIONS else "stored"
+        )
+        self.verifier = None
 
     def run(self):
         try:
@@ -77,401 +129,728 @@ class CopyThread(QThread):
                     print(f"Error writing to report: {error}")
                     pass
             raise
-            self.copy_progress.emit(ProgressData(-1, error))
+            self.emit(ProgressData(-1, error))
 
     def copy_folder(self, src: str, destinations: list, hashes: list):
         print("Copying Files...")
 
         base_path = self.base_path
 
-        buffer_size = 64 * 1024 * 1024  # Read 64M at a time
-
-        files_hashes = {}  # {filepath: {hash_name:hash_value, ...}, ...}
-        files_metadata = {}  # {filepath: metadata, ...}
+        async_multicast = self.async_multicast
+        # Size of the blocks read and number of blocks in flight between the source reader and the workers,
+        # tuned while copying within the memory ceiling.
+        # When faster destinations run ahead, half of the memory ceiling is shared between the backlogs of the
+        # destinations: each one copies the blocks it is behind on into its own buffers, releasing the blocks in flight.
+        read_ahead_memory = self.memory_ceiling
+        backlog = 0
+        if async_multicast:
+            read_ahead_memory = self.memory_ceiling // 2
+            backlog = (self.memory_ceiling - read_ahead_memory) // max(
+                1, len(destinations)
+            )
+        controller = BlockSizeController(read_ahead_memory, max_depth=4)
+        # Files up to small_file_size are copied in batches of up to small_files_batch files (and one block)
+        small_file_size = 1024 * 1024
+        small_files_batch = 1024
+        # Only the first destination is written from the blocks read (and hashed), the others are copied
+        # from the source file by the kernel, the data not going through user space again.
+        kernel_copy = self.kernel_copy and hasattr(os, "copy_file_range")
 
         start_time = self.initialize_log_files(destinations, base_path, src)
 
         filecount = 0
-        copied_size = 0
-        for dirpath, dirnames, filenames in os.walk(src):
-            # dst_folder - Join the destination folder (basename_of_source) with the actual relative path
-            rel_path = path.relpath(dirpath, src)
-            dst_folder = path.normpath(path.join(base_path, rel_path))
 
-            # Create Paths in destination directory
-            for dst in destinations:
-                try:
-                    dst_path = path.join(dst, dst_folder)
-                    os.makedirs(dst_path, exist_ok=True)
-                    try:
-                        shutil.copystat(dirpath, dst_path)
-                    except OSError:
-                        # shutil failed to copy directory metadata. Not a critical error, log and continue.
-                        print(
-                            f"Warning - Unable to copy directory attributes to destination folder ({dst_path}), timestamps will not reflect the source."
-                        )
-                        # TODO - Insert code to log (and display) this warning, eventually a UI for the user to confirm could be added.
+        # Journal of the files written to each destination, a resumed copy skips the files already recorded
+        journals = {dst: CopyJournal(dst, base_path) for dst in destinations}
+        previous_records = {
+            dst: journal.load() if self.resume else {}
+            for dst, journal in journals.items()
+        }
+        for journal in journals.values():
+            journal.open(self.resume)
 
-                except FileNotFoundError as error:
-                    # If a device is not mounted anymore we will get a FileNotFound Error
-                    print(
-                        "{} is not available anymore! Deleting from destination list!".format(
-                            dst
-                        )
-                    )
-                    destinations.pop(destinations.index(dst))
-                    raise
+        # Files are reported as soon as they are done, nothing is kept in memory until the end
+        reports = self.open_reports(destinations, base_path, hashes)
 
-            # Copy Files
-            for filename in filenames:
+        chunk_manifests = {}
+        if self.chunk_manifest:
+            chunk_manifests = {
+                dst: ChunkManifest(dst, base_path) for dst in destinations
+            }
+            for chunk_manifest in chunk_manifests.values():
+                chunk_manifest.open(self.resume)
 
-                if rel_path == "." and "gemino.txt" in filename:
-                    # Ignore gemino's hash files
-                    continue
+        # Long-lived workers, one per destination and one per hash algorithm
+        ring = BlockRing(controller.depth, controller.block_size)
+        writers = {
+            dst: CopyWorker(dst, journals[dst], self.durability, backlog)
+            for dst in destinations
+        }
+        # One more lane for the chunk digests
+        hasher = MultiHasher(len(hashes) + (1 if self.chunk_manifest else 0))
+        workers = [*writers.values(), hasher]
+        for worker in workers:
+            worker.start()
 
-                filecount += 1
+        # [(FileEntry, filepath, dst_file_path), ...] waiting to be copied as a batch
+        small_files = []
+        small_files_size = 0
+        tuned_bytes = 0  # Bytes copied to the slowest destination, at the last update of the controller
 
-                self.copy_progress.emit(
-                    ProgressData(
-                        0,
-                        {
-                            dst: {
-                                "status": "copy",
-                                "processed_bytes": copied_size,
-                                "processed_files": filecount,
-                                "current_file": filename,
-                            }
-                            for dst in self.destinations
-                        },
-                    )
-                )
+        try:
+            for dirpath, dirnames, files in self.walk_source(src):
+                # dst_folder - Join the destination folder (basename_of_source) with the actual relative path
+                rel_path = path.relpath(dirpath, src)
+                dst_folder = path.normpath(path.join(base_path, rel_path))
 
-                src_file_path = path.join(dirpath, filename)
-                try:
-                    with open(src_file_path, "rb", buffering=0) as src_file:
-                        # Open all destination files
-                        dst_file_ptrs = {}
+                # Create Paths in destination directory
+                for dst in destinations:
+                    try:
+                        dst_path = path.join(dst, dst_folder)
+                        os.makedirs(dst_path, exist_ok=True)
+                        try:
+                            shutil.copystat(dirpath, dst_path)
+                        except OSError:
+                            # shutil failed to copy directory metadata. Not a critical error, log and continue.
+                            print(
+                                f"Warning - Unable to copy directory attributes to destination folder ({dst_path}), timestamps will not reflect the source."
+                            )
+                            # TODO - Insert code to log (and display) this warning, eventually a UI for the user to confirm could be added.
 
-                        for dst in destinations:
-                            dst_path = path.join(dst, dst_folder)
-                            dst_file_path = path.join(dst_path, filename)
-                            try:
-                                dst_file_ptrs[dst] = open(
-                                    dst_file_path, "wb", buffering=0
+                    except FileNotFoundError as error:
+                        # If a device is not mounted anymore we will get a FileNotFound Error
+                        print(
+                            "{} is not available anymore! Deleting from destination list!".format(
+                                dst
+                            )
+                        )
+                        destinations.pop(destinations.index(dst))
+                        raise
+
+                # Copy Files
+                for entry in files:
+                    filename = entry.name
+
+                    if rel_path == "." and "gemino.txt" in filename:
+                        # Ignore gemino's hash files
+                        continue
+
+                    filecount += 1
+
+                    src_file_path = entry.path
+                    filepath = path.normpath(path.join(rel_path, filename))
+
+                    if self.resume:
+                        src_stat = self.source_stat(entry)
+                        file_hashes = self.resumed_hashes(
+                            previous_records,
+                            filepath,
+                            src_stat,
+                            path.join(dst_folder, filename),
+                            hashes,
+                        )
+                        if file_hashes is not None:
+                            if small_files:
+                                # Reported in the order the files are walked, as if copied
+                                self.copy_small_files(
+                                    small_files, ring, writers, reports, hashes
                                 )
-                            except FileNotFoundError:
-                                # Targed not available anymore, remove from list
-                                print(
-                                    "{} is not available anymore! Deleting from destination list!".format(
-                                        dst
-                                    )
+                                self.remove_lost_destinations(
+                                    destinations, writers, previous_records, reports
                                 )
-                                destinations.pop(destinations.index(dst))
+                                small_files, small_files_size = [], 0
+                            # Already copied to all destinations before the interruption, keep its hashes
+                            for writer in writers.values():
+                                writer.skip_file(src_stat.st_size)
+                            fsmeta = fs_metadata(src_file_path, src_stat)
+                            for report in reports.values():
+                                report.add(filepath, file_hashes, fsmeta)
+                            continue
+
+                        for chunk_manifest in chunk_manifests.values():
+                            if filepath in chunk_manifest.recorded:
+                                # Copied again, possibly smaller than a chunk now
+                                chunk_manifest.forget(filepath)
+
+                    if entry.stat is not None and entry.size <= small_file_size:
+                        # Per file overhead dominates for small files, copy them in batches
+                        small_files.append(
+                            (entry, filepath, path.join(dst_folder, filename))
+                        )
+                        small_files_size += entry.size
+                        if (
+                            len(small_files) >= small_files_batch
+                            or small_files_size >= ring.block_size
+                        ):
+                            self.copy_small_files(
+                                small_files, ring, writers, reports, hashes
+                            )
+                            self.remove_lost_destinations(
+                                destinations, writers, previous_records, reports
+                            )
+                            small_files, small_files_size = [], 0
+                        continue
 
-                        file_hashes = {
-                            hash_algo: hashlib.__getattribute__(hash_algo)()
-                            for hash_algo in hashes
-                            if hasattr(hashlib, hash_algo)
-                        }
+                    if small_files:
+                        # Copy the pending small files first, files are written in the order they are walked
+                        self.copy_small_files(
+                            small_files, ring, writers, reports, hashes
+                        )
+                        self.remove_lost_destinations(
+                            destinations, writers, previous_records, reports
+                        )
+                        small_files, small_files_size = [], 0
 
-                        data = src_file.read(buffer_size)
-                        while data:
+                    self.emit(ProgressData(0, self.writers_progress(writers, filename)))
 
-                            threads = []
+                    try:
+                        with open(src_file_path, "rb", buffering=0) as src_file:
+                            src_stat = self.source_stat(
+                                entry, os.fstat(src_file.fileno())
+                            )
 
-                            # Create a full in-memory copy of the buffer read to avoid issues with concurrency
-                            # when reading the new stream as the same time the old is being written.
-                            # Not sure if really needed but performance impact is negligible and reduces risks.
-                            data_current = deepcopy(data)
+                            # Open all destination files
+                            for index, (dst, writer) in enumerate(writers.items()):
+                                writer.open_file(
+                                    path.join(dst, dst_folder, filename),
+                                    (
+                                        os.dup(src_file.fileno())
+                                        if kernel_copy and index
+                                        else None
+                                    ),
+                                    src_stat.st_size,
+                                )
 
-                            # Forbid thread termination while we have active child threads
-                            # If not done, the threads will return to a non-existing thread and crash the application
-                            # (I think)
-                            self.setTerminationEnabled(False)
+                            file_hashes = {
+                                hash_algo: new_hash(hash_algo) for hash_algo in hashes
+                            }
+                            hash_buffers = list(file_hashes.values())
+                            chunk_digests = None
+                            if chunk_manifests and src_stat.st_size > CHUNK_SIZE:
+                                # Hashed along with the file hashes, from the same blocks
+                                chunk_digests = ChunkDigests()
+                                hash_buffers.append(chunk_digests)
+
+                            offset = 0
+                            while True:
+
+                                # Forbid thread termination while handing the block to the workers
+                                # If not done, the ring slot might never be given back and the workers would stall
+                                self.setTerminationEnabled(False)
 
-                            for hash_algo, hash_buffer in file_hashes.items():
-                                thread = HashBuffer(hash_buffer, data_current)
-                                thread.start()
-                                threads.append(thread)
+                                # The block is read in place in a free slab of the ring and handed over to the
+                                # long-lived workers, the source read continues while the previous blocks are
+                                # still being written and hashed (up to ring.slots blocks).
+                                block = ring.read(
+                                    src_file, len(hash_buffers) + len(writers)
+                                )
+                                if block is None:
+                                    self.setTerminationEnabled(True)
+                                    break
+                                # Read before handing the block over, the last consumer releasing it clears its data
+                                size = len(block.data)
+                                # All the algorithms hash the block together, chunk by chunk
+                                hasher.update(hash_buffers, block)
+
+                                for writer in writers.values():
+                                    writer.write_block(block, offset)
+                                offset += size
 
-                            for dst, dst_file in dst_file_ptrs.items():
-                                thread = CopyBuffer(
-                                    data_current, dst_file
-                                )  # Threaded Version
-                                thread.start()  # Threaded Version
-                                threads.append(thread)  # Threaded Version
+                                self.setTerminationEnabled(True)
 
-                            copied_size += len(data_current)
+                                # Tuned on the slowest destination, the one the reads end up waiting for
+                                copied = min(
+                                    (
+                                        writer.copied_bytes
+                                        for writer in writers.values()
+                                        if not writer.lost
+                                    ),
+                                    default=0,
+                                )
+                                if controller.update(copied - tuned_bytes):
+                                    ring.resize(controller.depth, controller.block_size)
+                                tuned_bytes = copied
 
-                            data = src_file.read(buffer_size)
+                                self.emit(
+                                    ProgressData(
+                                        0, self.writers_progress(writers, filename)
+                                    )
+                                )
 
-                            for thread in threads:
-                                thread.join()
+                            # Hashes are needed for the report and journal, wait for the hasher to be done with the file
+                            hasher.wait()
 
-                            # All the spawned threads have exited, allow the termination of this thread again
-                            self.setTerminationEnabled(True)
+                            for hash_algo, hash_buffer in file_hashes.items():
+                                file_hashes[hash_algo] = hash_buffer.hexdigest()
+
+                            # Close destination files once written (src auto closes)
+                            record = journal_record(filepath, src_stat, file_hashes)
+                            for writer in writers.values():
+                                writer.close_file(src_file_path, record)
+
+                            if async_multicast:
+                                # Destinations drain their backlog at their own speed, only surface errors
+                                for writer in writers.values():
+                                    writer.check()
+                            else:
+                                # Every destination has to be done with the file before reading the next one
+                                for writer in writers.values():
+                                    writer.wait()
+                    except (FileNotFoundError, OSError):
+                        # FileNotFoundError if source disconnected and we try to open it
+                        # OSError if source disconnected and we try to read from it
+                        print("Lost source! (Or permission problem)")
+                        raise
+
+                    # Use pyAFF4 module to get metadata for file, from the stat taken when opening it
+                    fsmeta = fs_metadata(src_file_path, src_stat)
+
+                    self.remove_lost_destinations(
+                        destinations, writers, previous_records, reports
+                    )
 
-                            self.copy_progress.emit(
-                                ProgressData(
-                                    0,
-                                    {
-                                        dst: {
-                                            "processed_bytes": copied_size,
-                                            "processed_files": filecount,
-                                            "status": "copy",
-                                            "current_file": filename,
-                                        }
-                                        for dst in self.destinations
-                                    },
-                                )
+                    for report in reports.values():
+                        report.add(filepath, file_hashes, fsmeta)
+                    if chunk_digests is not None:
+                        for dst in reports:
+                            chunk_manifests[dst].append(
+                                filepath, src_stat.st_size, chunk_digests
                             )
 
-                        # Close open files (src auto closes)
-
-                        for dst, dst_file in dst_file_ptrs.items():
-                            try:
-                                dst_file.close()
-                                try:
-                                    shutil.copystat(src_file_path, dst_file.name)
-                                except OSError:
-                                    # shutil failed to copy file metadata. Not a critical error, log and continue.
-                                    print(
-                                        f"Warning - Unable to copy file attributes to destination folder ({dst_path}), not all metadata might reflect the source."
-                                    )
-
-                            except (FileNotFoundError, OSError):
-                                print("Lost destination")
-                                raise
+            if small_files:
+                self.copy_small_files(small_files, ring, writers, reports, hashes)
+                self.remove_lost_destinations(
+                    destinations, writers, previous_records, reports
+                )
 
-                        for hash_algo, hash_buffer in file_hashes.items():
-                            file_hashes[hash_algo] = hash_buffer.hexdigest()
-                except (FileNotFoundError, OSError):
-                    # FileNotFoundError if source disconnected and we try to open it
-                    # OSError if source disconnected and we try to read from it
-                    print("Lost source! (Or permission problem)")
-                    raise
-                files_hashes[path.normpath(path.join(rel_path, filename))] = file_hashes
-
-                # Use pyAFF4 module to get metadata for file
-                fsmeta = logical.FSMetadata.create(
-                    src_file_path
-                )  # FSMetadata needs absolute path for source info
-                files_metadata[path.normpath(path.join(rel_path, filename))] = fsmeta
+            # Let the slower destinations drain their backlog, reporting their own progress
+            for writer in writers.values():
+                writer.flush()
+            for writer in writers.values():
+                while not writer.wait(timeout=0.25):
+                    self.emit(
+                        ProgressData(0, self.writers_progress(writers, reading=False))
+                    )
+            self.emit(ProgressData(0, self.writers_progress(writers, reading=False)))
+        finally:
+            for worker in workers:
+                worker.stop()
+            # Journals are closed once their writer is done with them
+            for worker in workers:
+                worker.join()
+            for journal in journals.values():
+                journal.close()
+            for report in reports.values():
+                report.close()
+            for chunk_manifest in chunk_manifests.values():
+                chunk_manifest.close()
+
+        # Verification processes share the memory ceiling, each one reading two blocks at most
+        verify_processes = os.cpu_count() or 1
+        verify_block_size = max(
+            MiB,
+            min(controller.block_size, self.memory_ceiling // (2 * verify_processes)),
+        )
 
         # Write Hash Files
         end_time = datetime.now()
         print("Writing Hash Files...")
 
-        for dst in destinations:
+        for dst, report in reports.items():
+            report.write_source_hashes(
+                start_time,
+                end_time,
+                controller.summary()
+                + [
+                    f"Verification Block Size: {verify_block_size // MiB} MiB ({verify_processes} processes)",
+                    f"Verification Reads: {'from the media (page cache bypassed)' if self.uncached_verify else 'through the page cache'}",
+                    f"Source Read: {throughput(ring.read_bytes, ring.read_time)}",
+                    f"Destination Write: {throughput(writers[dst].copied_bytes, writers[dst].write_time + writers[dst].flush_time)}",
+                    f"Destination Flush: {writers[dst].flush_time:.1f} s (Durability: {writers[dst].durability})",
+                ]
+                + ([f"Destination Backlog: {backlog // MiB} MiB"] if backlog else []),
+            )
+
+        # Verify Hashes
+        print("Verifying Hashes...")
+        self.verify_folder(
+            reports,
+            base_path,
+            hashes,
+            verify_block_size,
+            verify_processes,
+            {dst: chunk_manifests[dst] for dst in reports if dst in chunk_manifests},
+            {dst: journals[dst] for dst in reports},
+        )
+
+        # Done
+        print("Done!")
+        self.emit(ProgressData(2, {}))
+
+    def copy_small_files(
+        self,
+        small_files: list,
+        ring: BlockRing,
+        writers: dict,
+        reports: dict,
+        hashes: list,
+    ):
+        """
+        Copy a batch of small files. The files are read and hashed in the current thread, without any handoff
+        to the hashers, and each destination writes the whole batch in a single job.
+        :param small_files: [(FileEntry, filepath, dst_file_path), ...], dst_file_path relative to the destination
+        :param ring: BlockRing bounding the batches in flight, along with the blocks of the large files
+        :param writers: {dst: CopyWorker, ...}
+        :param reports: {dst: ReportSink, ...}
+        :param hashes: hash algorithms
+        """
+        batch = []  # [(dst_file_path, src_file_path, data, record), ...]
+        reported = []  # [(filepath, file_hashes, fsmeta), ...]
+        for entry, filepath, dst_file_path in small_files:
             try:
-                report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
-                with open(report_file_path, "a", encoding="utf-8") as report_file:
-                    report_file.write(f"End Time: {end_time.isoformat()}\n")
-                    report_file.write(f"Duration: {end_time - start_time}\n")
-                    report_file.write("\n")
-                    report_file.write(
-                        f"################## Source Hashes ######################\n"
-                    )
-                    for file, file_hashes in files_hashes.items():
-                        hash_values = [file_hashes[hash_algo] for hash_algo in hashes]
-                        report_file.write(f"{' - '.join(hash_values)} - {file}\n")
-                if self.csv_log:
-                    csv_report_file_path = path.join(
-                        dst, f"{base_path}_file_report.csv"
-                    )
-                    with open(
-                        csv_report_file_path, "w", encoding="utf-8", newline=""
-                    ) as csv_report_file:
-                        csv_report_writer = csv.writer(
-                            csv_report_file,
-                            delimiter=",",
-                            quotechar='"',
-                            quoting=csv.QUOTE_MINIMAL,
-                        )
-                        csv_report_writer.writerow(
-                            [
-                                "path",
-                                "size",
-                                "created",
-                                "modified",
-                                "accessed",
-                                "record_changed",
-                            ]
-                            + self.hashes
-                        )
-                        for file, file_hashes in files_hashes.items():
-                            hash_values = [
-                                file_hashes[hash_algo] for hash_algo in hashes
-                            ]
-                            metadata = files_metadata[file]
-                            csv_report_writer.writerow(
-                                [
-                                    file,
-                                    metadata.length,
-                                    (
-                                        metadata.birthTime
-                                        if hasattr(metadata, "birthTime")
-                                        else ""
-                                    ),
-                                    metadata.lastWritten,
-                                    metadata.lastAccessed,
-                                    (
-                                        metadata.recordChanged
-                                        if hasattr(metadata, "recordChanged")
-                                        else ""
-                                    ),
-                                ]
-                                + hash_values
-                            )
-            except FileNotFoundError as error:
-                print(f"Error writing to report: {error}")
+                with open(entry.path, "rb") as src_file:
+                    src_stat = self.source_stat(entry, os.fstat(src_file.fileno()))
+                    data = src_file.read()
+            except (FileNotFoundError, OSError):
+                # FileNotFoundError if source disconnected and we try to open it
+                # OSError if source disconnected and we try to read from it
+                print("Lost source! (Or permission problem)")
                 raise
-
+            file_hashes = {}
             for hash_algo in hashes:
-                hash_file_path = path.join(dst, f"{base_path}.{hash_algo}")
-                try:
-                    with open(hash_file_path, "w", encoding="utf-8") as hash_file:
-                        for file, file_hashes in files_hashes.items():
-                            hash_file.write(f"{file_hashes[hash_algo]} {file}\n")
-                except FileNotFoundError:
-                    print(
-                        "Unable to write hash file in destination dir, volume not connected anymore."
-                    )
-                    raise
+                hash_buffer = new_hash(hash_algo)
+                hash_buffer.update(data)
+                file_hashes[hash_algo] = hash_buffer.hexdigest()
+            record = journal_record(filepath, src_stat, file_hashes)
+            batch.append((dst_file_path, entry.path, data, record))
+            reported.append((filepath, file_hashes, fs_metadata(entry.path, src_stat)))
+
+        # Forbid thread termination while handing the batch to the writers, see copy_folder
+        self.setTerminationEnabled(False)
+        block = ring.block(batch, len(writers))
+        for writer in writers.values():
+            writer.write_files(block)
+        self.setTerminationEnabled(True)
+
+        if self.async_multicast:
+            for writer in writers.values():
+                writer.check()
+        else:
+            for writer in writers.values():
+                writer.wait()
+
+        for report in reports.values():
+            for filepath, file_hashes, fsmeta in reported:
+                report.add(filepath, file_hashes, fsmeta)
+
+        self.emit(
+            ProgressData(0, self.writers_progress(writers, small_files[-1][0].name))
+        )
+
+    def remove_lost_destinations(
+        self, destinations: list, writers: dict, previous_records: dict, reports: dict
+    ):
+        # Targets not available anymore, remove from list
+        for dst, writer in list(writers.items()):
+            if writer.lost:
+                destinations.pop(destinations.index(dst))
+                previous_records.pop(dst)
+                writers.pop(dst).stop()
+                reports.pop(dst).close()
+
+    def open_reports(self, destinations: list, base_path: str, hashes: list) -> dict:
+        """
+        :return: {dst: ReportSink, ...} ready to receive the files copied
+        """
+        reports = {}
+        try:
+            for dst in destinations:
+                reports[dst] = ReportSink(dst, base_path, hashes, self.csv_log)
+                reports[dst].open()
+        except FileNotFoundError:
+            for report in reports.values():
+                report.close()
+            raise
+        return reports
+
+    def verify_folder(
+        self,
+        reports: dict,
+        base_path: str,
+        hashes: list,
+        buffer_size: int,
+        processes: int,
+        chunk_manifests: dict = None,
+        journals: dict = None,
+    ):
+        """
+        Verify the files copied to each destination against the source hashes.
+        Files are re-read and hashed on a pool of processes, all the destinations being verified at once,
+        each one at its own speed. The source hashes are streamed from the index of each destination.
+        Files with chunk digests get them checked from the same read as their hashes, locating the corrupt
+        byte ranges, which are copied again from the source if repair is set.
+        :param reports: {dst: ReportSink, ...} of the destinations to verify
+        :param base_path: folder containing the copy in each destination
+        :param hashes: hash algorithms
+        :param buffer_size: size of the blocks read, in each process
+        :param processes: number of processes hashing the files
+        :param chunk_manifests: {dst: ChunkManifest, ...} of the destinations with chunk digests
+        :param journals: {dst: CopyJournal, ...} removed once their destination is verified without errors,
+            like the chunk manifests
+        """
+
+        destinations = list(reports)
+        chunk_manifests = chunk_manifests or {}
+        journals = journals or {}
+        hashed_size = {dst: 0 for dst in destinations}
+        hashed_files = {dst: 0 for dst in destinations}
+        failed_files = {dst: [] for dst in destinations}  # [(index, filename), ...]
+        # {index: ([Chunk, ...], file_hashes), ...}
+        corrupt_chunks = {dst: {} for dst in destinations}
+        verified = set()
 
-        # Verify Hashes
-        print("Verifying Hashes...")
         progress = {
             dst: {
                 "status": "idle",
                 "processed_bytes": 0,
-                "processed_files": filecount,
+                "processed_files": 0,
                 "current_file": "",
             }
             for dst in destinations
         }
-        self.copy_progress.emit(ProgressData(1, copy(progress)))
-        for dst in destinations:
-            hashed_size = 0
-            filecount = 0
-            hash_error = 0
-            try:
-                report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
-                with open(report_file_path, "a", encoding="utf-8") as report_file:
-                    report_file.write("\n")
-                    report_file.write(
-                        f"################## Verification Report ######################\n"
-                    )
-                    for filename, file_hashes in files_hashes.items():
-                        # Update File Progress
-                        filecount += 1
-                        progress[dst] = {
-                            "status": "hashing",
-                            "processed_bytes": hashed_size,
-                            "processed_files": filecount,
-                            "current_file": "",
-                        }
-                        self.copy_progress.emit(ProgressData(1, copy(progress)))
-                        filepath = path.normpath(path.join(dst, base_path, filename))
-                        this_file_error = False
-                        with open(filepath, "rb") as file:
-                            dst_file_hashes = {
-                                hash_algo: hashlib.__getattribute__(hash_algo)()
-                                for hash_algo in hashes
-                                if hasattr(hashlib, hash_algo)
-                            }
-
-                            data = file.read(buffer_size)
-                            while data:
-                                threads = []
-
-                                data_current = deepcopy(data)
-
-                                # Forbid thread termination while we have active child threads
-                                # If not done, the threads will return to a non-existing thread and crash the application
-                                # (I think)
-                                self.setTerminationEnabled(False)
-
-                                for hash_algo, hash_buffer in dst_file_hashes.items():
-                                    thread = HashBuffer(hash_buffer, data_current)
-                                    thread.start()
-                                    threads.append(thread)
-
-                                hashed_size += len(data)
-
-                                data = file.read(buffer_size)
-
-                                for thread in threads:
-                                    thread.join()
-
-                                # All the spawned threads have exited, allow the termination of this thread again
-                                self.setTerminationEnabled(True)
+        self.emit(ProgressData(1, copy(progress)))
+
+        def lane(dst):
+            # A resumed copy appends to the chunk manifest, its records are not in copy order
+            records = chunk_manifests[dst].chunks() if dst in chunk_manifests else {}
+            # Source hashes travel with the file, the index is only read once
+            for index, (filename, file_hashes) in enumerate(reports[dst].files()):
+                filepath = path.normpath(path.join(dst, base_path, filename))
+                chunks = records.pop(filename, None) or None
+                yield (index, filename, file_hashes, chunks), filepath, chunks
+
+        with HashVerifier(
+            hashes, buffer_size, processes, self.uncached_verify
+        ) as verifier:
+            self.verifier = verifier
+            scheduler = VerificationScheduler(
+                verifier, {dst: lane(dst) for dst in destinations}
+            )
+            while scheduler.running:
+                hashed, results, finished = scheduler.poll()
 
-                                # Update Byte Progress
-                                progress[dst] = {
-                                    "status": "hashing",
-                                    "processed_bytes": hashed_size,
-                                    "processed_files": filecount,
-                                    "current_file": filename,
-                                }
-                                self.copy_progress.emit(ProgressData(1, copy(progress)))
-
-                            for hash_algo, hash_buffer in dst_file_hashes.items():
-                                dst_file_hashes[hash_algo] = hash_buffer.hexdigest()
-
-                            for hash_algo, file_hash in file_hashes.items():
-                                if dst_file_hashes[hash_algo] != file_hash:
-                                    print(
-                                        "COPY ERROR - %s HASH for %s file DIFFERS!"
-                                        % (hash_algo, filename)
-                                    )
-                                    progress[dst] = {
-                                        "status": "error_hash",
-                                        "processed_bytes": hashed_size,
-                                        "processed_files": filecount,
-                                        "current_file": filename,
-                                    }
-                                    self.copy_progress.emit(
-                                        ProgressData(1, copy(progress))
-                                    )
-                                    hash_error += 1
-                        if this_file_error:
-                            report_file.write(
-                                f"Verification failed for file: {filename}\n"
+                # Update Byte Progress
+                for dst, (_, filename, _, _), hashed_bytes in hashed:
+                    hashed_size[dst] += hashed_bytes
+                    progress[dst]["current_file"] = filename
+
+                # Update File Progress
+                for dst, (index, filename, file_hashes, chunks), result in results:
+                    hashed_files[dst] += 1
+                    if chunks is not None:
+                        result, chunk_digests = result
+                        corrupt = [
+                            chunk
+                            for chunk, digest in zip(
+                                chunks, chunk_digests or [None] * len(chunks)
                             )
+                            if digest != chunk.digest
+                        ]
+                        if corrupt:
+                            corrupt_chunks[dst][index] = (corrupt, file_hashes)
+                            print(
+                                "COPY ERROR - %s CHUNKS for %s file DIFFER!"
+                                % (corrupt[0].algorithm, filename)
+                            )
+                            failed_files[dst].append((index, filename))
+                            continue
+                    for hash_algo in hashes:
+                        if result[hash_algo] != file_hashes[hash_algo]:
+                            print(
+                                "COPY ERROR - %s HASH for %s file DIFFERS!"
+                                % (hash_algo, filename)
+                            )
+                            failed_files[dst].append((index, filename))
+                            break
+
+                for dst in destinations:
+                    if dst in verified:
+                        continue
+                    progress[dst] = {
+                        "status": "error_hash" if failed_files[dst] else "hashing",
+                        "processed_bytes": hashed_size[dst],
+                        "processed_files": hashed_files[dst],
+                        "current_file": progress[dst]["current_file"],
+                    }
+
+                # Each destination is reported as soon as it is verified, without waiting for the slower ones
+                for dst in finished:
+                    verified.add(dst)
+                    corrupt_ranges, repaired_ranges = self.repair_files(
+                        dst,
+                        base_path,
+                        failed_files[dst],
+                        corrupt_chunks[dst],
+                        buffer_size,
+                    )
+                    self.write_verification_report(
+                        dst,
+                        base_path,
+                        [filename for _, filename in sorted(failed_files[dst])],
+                        hashed_files[dst],
+                        corrupt_ranges,
+                        repaired_ranges,
+                    )
+                    # Hashes are in the report and hash files, the index is not needed anymore
+                    reports[dst].remove_index()
+                    if not failed_files[dst]:
+                        # A copy failing the verification can still be resumed (and its chunks located),
+                        # the others are done
+                        if dst in journals:
+                            journals[dst].remove()
+                        if dst in chunk_manifests:
+                            chunk_manifests[dst].remove()
+                    progress[dst] = {
+                        "status": "error_hash" if failed_files[dst] else "done",
+                        "processed_bytes": hashed_size[dst],
+                        "processed_files": hashed_files[dst],
+                        "current_file": "",
+                    }
+                self.emit(ProgressData(1, copy(progress)))
+            self.verifier = None
+
+    def repair_files(
+        self,
+        dst: str,
+        base_path: str,
+        failed_files: list,
+        corrupt_chunks: dict,
+        buffer_size: int,
+    ):
+        """
+        Locate the corrupt byte ranges of the files verified chunk by chunk, copying them again from the source
+        if repair is set. Files entirely repaired are verified again with the selected hashes, and removed
+        from failed_files if they match the source.
+        :param failed_files: [(index, filename), ...] failing the verification
+        :param corrupt_chunks: {index: ([Chunk, ...], file_hashes), ...} failing the verification
+        :return: corrupt_ranges, repaired_ranges
+            corrupt_ranges: {filename: byte ranges, ...} still differing from the source
+            repaired_ranges: {filename: byte ranges, ...} copied again from the source and verified
+        """
+        corrupt_ranges = {}
+        repaired_ranges = {}
+        for index, filename in sorted(failed_files):
+            chunks, file_hashes = corrupt_chunks.get(index, ([], None))
+            chunks = sorted(chunks, key=lambda chunk: chunk.offset)
+            if not chunks:
+                # Verified with the file hashes, nothing to locate
+                continue
+            if self.repair:
+                try:
+                    repaired = repair_chunks(
+                        path.join(self.src, filename),
+                        path.join(dst, base_path, filename),
+                        chunks,
+                        buffer_size,
+                        self.uncached_verify,
+                    )
+                except OSError as error:
+                    print(f"Unable to repair {filename}: {error}")
+                    repaired = []
+                if repaired:
+                    repaired_ranges[filename] = format_ranges(repaired)
+                    chunks = [chunk for chunk in chunks if chunk not in repaired]
+                if not chunks:
+                    # Chunk digests are no proof, the file only counts as verified once its hashes match
+                    if self.hashes_match(
+                        path.join(dst, base_path, filename), filename, file_hashes
+                    ):
+                        failed_files.remove((index, filename))
+                    continue
+            corrupt_ranges[filename] = format_ranges(chunks)
+        return corrupt_ranges, repaired_ranges
+
+    def hashes_match(self, filepath: str, filename: str, file_hashes: dict) -> bool:
+        """
+        Hash a file again on the verification processes, outside of the verification progress
+        :param filepath: file to hash
+        :param filename: file name reported
+        :param file_hashes: {hash_algo: hex_digest, ...} of the source
+        :return: True if all the hashes match the source
+        """
+        try:
+            result = self.verifier.submit(None, filepath, progress=False).result()
+        except OSError as error:
+            print(f"Unable to verify {filename}: {error}")
+            return False
+        for hash_algo in self.verifier.hashes:
+            if result[hash_algo] != file_hashes[hash_algo]:
+                print(
+                    "COPY ERROR - %s HASH for %s file DIFFERS!" % (hash_algo, filename)
+                )
+                return False
+        return True
 
-                    if hash_error:
-                        report_file.write(
-                            f"Verification failed for {hash_error} files.\n"
-                        )
-                        report_file.write(
-                            f"Verification successful for {filecount} files\n"
-                        )
-
-                    if not hash_error:
-                        # Signal the end with no errors of the hash verification for the current volume
-                        progress[dst] = {
-                            "status": "done",
-                            "processed_bytes": hashed_size,
-                            "processed_files": filecount,
-                            "current_file": "",
-                        }
+    def write_verification_report(
+        self,
+        dst: str,
+        base_path: str,
+        failed_files: list,
+        hashed_files: int,
+        corrupt_ranges: dict = None,
+        repaired_ranges: dict = None,
+    ):
+        """
+        :param failed_files: files failing the verification, in copy order
+        :param corrupt_ranges: {filename: byte ranges, ...} differing from the source, for the files with chunk digests
+        :param repaired_ranges: {filename: byte ranges, ...} copied again from the source and verified
+        """
+        corrupt_ranges = corrupt_ranges or {}
+        repaired_ranges = repaired_ranges or {}
+        try:
+            report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
+            with open(report_file_path, "a", encoding="utf-8") as report_file:
+                report_file.write("\n")
+                report_file.write(
+                    f"################## Verification Report ######################\n"
+                )
+                for filename, ranges in repaired_ranges.items():
+                    report_file.write(
+                        f"Repaired from the source: {filename} ({ranges})\n"
+                    )
+                if failed_files:
+                    for filename in failed_files:
                         report_file.write(
-                            f"Verification successful for {filecount} files\n"
+                            f"Verification failed for file: {filename}"
+                            + (
+                                f" ({corrupt_ranges[filename]} differ)"
+                                if filename in corrupt_ranges
+                                else ""
+                            )
+                            + "\n"
                         )
-                        self.copy_progress.emit(ProgressData(1, copy(progress)))
-
-            except FileNotFoundError as error:
-                print(f"Error writing to report: {error}")
-                raise
+                    report_file.write(
+                        f"Verification failed for {len(failed_files)} files.\n"
+                    )
+                    report_file.write(
+                        f"Verification successful for {hashed_files - len(failed_files)} files\n"
+                    )
+                else:
+                    report_file.write(
+                        f"Verification successful for {hashed_files} files\n"
+                    )
+        except FileNotFoundError as error:
+            print(f"Error writing to report: {error}")
+            raise
 
-        # Done
-        print("Done!")
-        self.copy_progress.emit(ProgressData(2, {}))
+    def terminate(self):
+        # Verification processes do not stop with the thread
+        if self.verifier is not None:
+            self.verifier.shutdown(wait=False)
 
     def copy_aff4(self, src: str, destinations: list, hashes: list):
-
-        assert len(destinations) == 1
+        # The container is written to the first destination while being read and hashed,
+        # and mirrored to the other ones: the source is read once, the containers are byte-identical
         destination = destinations[0]
 
         print("Copying Files...")
@@ -480,268 +859,288 @@ class CopyThread(QThread):
 
         # buffer_size = 64 * 1024 * 1024  # Read 64M at a time
 
-        files_hashes = {}  # {filepath: {hash_name:hash_value, ...}, ...}
-        files_metadata = {}  # {filepath: metadata, ...}
         container_hashes = {}
 
         start_time = self.initialize_log_files(destinations, base_path, src)
+        reports = self.open_reports(destinations, base_path, hashes)
+
+        hashers_algos = []
+        if "md5" in hashes:
+            hashers_algos.append(lexicon.HASH_MD5)
+        if "sha1" in hashes:
+            hashers_algos.append(lexicon.HASH_SHA1)
+        if "sha256" in hashes:
+            hashers_algos.append(lexicon.HASH_SHA256)
+
+        # Algorithms AFF4 has no datatype for are only in the reports, not in the container
+        other_hashes = [
+            hash_algo
+            for hash_algo in hashes
+            if hash_algo not in ("md5", "sha1", "sha256")
+        ]
+
+        # All the algorithms of a file hash the data read together, chunk by chunk
+        multi_hasher = MultiHasher(len(hashes))
+        multi_hasher.start()
+        # Compressibility of the files sampled ahead of the writer
+        compressor = SegmentCompressor(self.file_compression)
+        # Pipeline of the container: files larger than a block are read ahead (and hashed) by the reader
+        # while pyaff4 compresses the data already read, its writes being queued to a writer per destination.
+        # Half of the memory ceiling for the blocks read ahead, half for the writes in flight
+        # (pyaff4 writes up to 1MB at a time).
+        read_block_size = 4 * MiB
+        read_ring = BlockRing(
+            max(2, min(16, self.memory_ceiling // (2 * read_block_size))),
+            read_block_size,
+        )
+        write_ring = BlockRing(max(4, self.memory_ceiling // (2 * MiB)))
+        reader = BufferWorker()
+        reader.start()
+        mirrors = [
+            MirrorWorker(dst, path.join(dst, base_path)) for dst in destinations[1:]
+        ]
+        for mirror in mirrors:
+            mirror.start()
+        container_file = None
 
         # Initialize AFF4 Resolver and Container
         container_path = path.join(destination, self.base_path)
-        with data_store.MemoryDataStore() as resolver:
-            container_urn = rdfvalue.URN.FromFileName(container_path)
-            with container.Container.createURN(
-                resolver,
-                container_urn,
-                encryption=False,
-                zip_based=True,
-                compression_method=lexicon.AFF4_IMAGE_COMPRESSION_STORED,
-            ) as volume:
-                hashers_algos = []
-                if "md5" in hashes:
-                    hashers_algos.append(lexicon.HASH_MD5)
-                if "sha1" in hashes:
-                    hashers_algos.append(lexicon.HASH_SHA1)
-                if "sha256" in hashes:
-                    hashers_algos.append(lexicon.HASH_SHA256)
-
-                # Read Files and Folder and add to containers
-                filecount = 0
-                copied_size = 0
-
-                resolver.Set(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN("http://aff4.org/Schema#caseName"),
-                    rdfvalue.XSDString(utils.SmartUnicode(self.metadata["intake"])),
-                )
-                resolver.Set(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN("http://aff4.org/Schema#caseDescription"),
-                    rdfvalue.XSDString(utils.SmartUnicode(self.metadata["notes"])),
-                )
-                resolver.Set(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN("http://aff4.org/Schema#examiner"),
-                    rdfvalue.XSDString(utils.SmartUnicode(self.metadata["operator"])),
-                )
-                resolver.Add(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN(lexicon.AFF4_TYPE),
-                    rdfvalue.URN("http://aff4.org/Schema#CaseDetails"),
-                )
-                resolver.Set(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN("http://aff4.org/Schema#startTime"),
-                    rdfvalue.XSDDateTime(utils.SmartUnicode(start_time.isoformat())),
-                )
-                resolver.Add(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN(lexicon.AFF4_TYPE),
-                    rdfvalue.URN("http://aff4.org/Schema#TimeStamps"),
-                )
-
-                for dirpath, dirnames, filenames in os.walk(src):
-                    # dst_folder - Join the destination folder (basename_of_source) with the actual relative path
-                    rel_path = path.relpath(dirpath, src)
-                    aff4_tree_path = path.normpath(
-                        path.join(path.basename(src), rel_path)
+        try:
+            # Facts of the files and folders kept in columns, information.turtle written in one pass
+            with ColumnarDataStore() as resolver:
+                container_urn = rdfvalue.URN.FromFileName(container_path)
+                with container.Container.createURN(
+                    resolver,
+                    container_urn,
+                    encryption=False,
+                    zip_based=True,
+                    compression_method=compressor.method,
+                ) as volume:
+                    container_file = ContainerFile(
+                        volume.backing_store.fd, mirrors, write_ring
                     )
+                    volume.backing_store.fd = container_file
+                    # Read Files and Folder and add to containers
+                    filecount = 0
+                    copied_size = 0
 
-                    # Create Paths in destination directory
-                    # For AFF4 containers
-                    # We want the DST Pathname as the source pathname relative to the source top directory
-                    dst_path = aff4_tree_path
-                    pathname = utils.SmartUnicode(dst_path)
-                    fsmeta = logical.FSMetadata.create(
-                        dirpath
-                    )  # We need the absolute path to get FS Metadata
-                    if volume.isAFF4Collision(pathname):
-                        image_urn = rdfvalue.URN("aff4://%s" % uuid.uuid4())
-                    else:
-                        image_urn = volume.urn.Append(
-                            escaping.arnPathFragment_from_path(pathname), quote=False
-                        )
-                    fsmeta.urn = image_urn
-                    fsmeta.store(resolver)
                     resolver.Set(
                         volume.urn,
-                        image_urn,
-                        rdfvalue.URN(lexicon.standard11.pathName),
-                        rdfvalue.XSDString(pathname),
+                        volume.urn,
+                        rdfvalue.URN("http://aff4.org/Schema#caseName"),
+                        rdfvalue.XSDString(utils.SmartUnicode(self.metadata["intake"])),
+                    )
+                    resolver.Set(
+                        volume.urn,
+                        volume.urn,
+                        rdfvalue.URN("http://aff4.org/Schema#caseDescription"),
+                        rdfvalue.XSDString(utils.SmartUnicode(self.metadata["notes"])),
+                    )
+                    resolver.Set(
+                        volume.urn,
+                        volume.urn,
+                        rdfvalue.URN("http://aff4.org/Schema#examiner"),
+                        rdfvalue.XSDString(
+                            utils.SmartUnicode(self.metadata["operator"])
+                        ),
                     )
                     resolver.Add(
                         volume.urn,
-                        image_urn,
+                        volume.urn,
                         rdfvalue.URN(lexicon.AFF4_TYPE),
-                        rdfvalue.URN(lexicon.standard11.FolderImage),
+                        rdfvalue.URN("http://aff4.org/Schema#CaseDetails"),
+                    )
+                    resolver.Set(
+                        volume.urn,
+                        volume.urn,
+                        rdfvalue.URN("http://aff4.org/Schema#startTime"),
+                        rdfvalue.XSDDateTime(
+                            utils.SmartUnicode(start_time.isoformat())
+                        ),
                     )
                     resolver.Add(
                         volume.urn,
-                        image_urn,
+                        volume.urn,
                         rdfvalue.URN(lexicon.AFF4_TYPE),
-                        rdfvalue.URN(lexicon.standard.Image),
+                        rdfvalue.URN("http://aff4.org/Schema#TimeStamps"),
                     )
 
-                    # Copy Files
-                    for filename in filenames:
-
-                        filecount += 1
-
-                        self.copy_progress.emit(
-                            ProgressData(
-                                0,
-                                {
-                                    dst: {
-                                        "status": "copy",
-                                        "processed_bytes": copied_size,
-                                        "processed_files": filecount,
-                                        "current_file": filename,
-                                    }
-                                    for dst in self.destinations
-                                },
-                            )
+                    for dirpath, dirnames, files in self.walk_source(src):
+                        # dst_folder - Join the destination folder (basename_of_source) with the actual relative path
+                        rel_path = path.relpath(dirpath, src)
+                        aff4_tree_path = path.normpath(
+                            path.join(path.basename(src), rel_path)
                         )
 
-                        src_file_path = path.join(dirpath, filename)
-                        src_file_path_rel = path.join(aff4_tree_path, filename)
-                        pathname = utils.SmartUnicode(
-                            src_file_path_rel
-                        )  # Destination filepath is relative to top source dir
+                        # Create Paths in destination directory
+                        # For AFF4 containers
+                        # We want the DST Pathname as the source pathname relative to the source top directory
+                        dst_path = aff4_tree_path
+                        pathname = utils.SmartUnicode(dst_path)
                         fsmeta = logical.FSMetadata.create(
-                            src_file_path
-                        )  # FSMetadata needs absolute path for source info
-                        files_metadata[path.normpath(path.join(rel_path, filename))] = (
-                            fsmeta
-                        )
-                        try:
-                            filesize = path.getsize(
-                                src_file_path
-                            )  # Needed until I find a way to get signaled on AFF4's copied size per file.
-                            with open(src_file_path, "rb", buffering=0) as src_file:
-                                file_hashes = {hash_algo: "" for hash_algo in hashes}
-                                hasher = linear_hasher.StreamHasher(
-                                    src_file, hashers_algos
-                                )
-                                progress = ProgressContextListener()
-                                progress.start = copied_size
-                                progress.destinations = self.destinations
-                                progress.processed_files = filecount
-                                progress.current_file = filename
-                                progress.copy_progress = self.copy_progress
-                                progress.status = "copy"
-                                urn = volume.writeLogicalStream(
-                                    pathname,
-                                    hasher,
-                                    fsmeta.length,
-                                    allow_large_zipsegments=True,
-                                    progress=progress,
+                            dirpath
+                        )  # We need the absolute path to get FS Metadata
+                        if volume.isAFF4Collision(pathname):
+                            image_urn = rdfvalue.URN("aff4://%s" % uuid.uuid4())
+                        else:
+                            image_urn = volume.urn.Append(
+                                escaping.arnPathFragment_from_path(pathname),
+                                quote=False,
+                            )
+                        fsmeta.urn = image_urn
+                        resolver.columns.add(image_urn, fsmeta, pathname)
+
+                        # Copy Files
+                        compressor.prefetch(files)
+                        for entry in files:
+                            filename = entry.name
+
+                            filecount += 1
+
+                            self.emit(
+                                ProgressData(
+                                    0,
+                                    {
+                                        dst: {
+                                            "status": "copy",
+                                            "processed_bytes": copied_size,
+                                            "processed_files": filecount,
+                                            "current_file": filename,
+                                        }
+                                        for dst in self.destinations
+                                    },
                                 )
-                                fsmeta.urn = urn
-                                fsmeta.store(resolver)
-                                for h in hasher.hashes:
-                                    hh = aff4_hashes.newImmutableHash(
-                                        h.hexdigest(), hasher.hashToType[h]
+                            )
+
+                            src_file_path = entry.path
+                            src_file_path_rel = path.join(aff4_tree_path, filename)
+                            pathname = utils.SmartUnicode(
+                                src_file_path_rel
+                            )  # Destination filepath is relative to top source dir
+                            try:
+                                with open(src_file_path, "rb", buffering=0) as src_file:
+                                    # FSMetadata needs absolute path for source info
+                                    fsmeta = fs_metadata(
+                                        src_file_path,
+                                        self.source_stat(
+                                            entry, os.fstat(src_file.fileno())
+                                        ),
+                                    )
+                                    # Needed until I find a way to get signaled on AFF4's copied size per file.
+                                    filesize = fsmeta.length
+                                    file_hashes = {
+                                        hash_algo: "" for hash_algo in hashes
+                                    }
+                                    pipelined = filesize > read_ring.block_size
+                                    hasher = StreamHasher(
+                                        src_file,
+                                        hashers_algos,
+                                        multi_hasher,
+                                        other_hashes,
+                                        reader if pipelined else None,
+                                        read_ring if pipelined else None,
+                                        filesize,
                                     )
-                                    resolver.Add(
-                                        urn,
-                                        urn,
-                                        rdfvalue.URN(lexicon.standard.hash),
-                                        hh,
+                                    progress = ProgressContextListener()
+                                    progress.start = copied_size
+                                    progress.destinations = self.destinations
+                                    progress.processed_files = filecount
+                                    progress.current_file = filename
+                                    progress.copy_progress = self.emit
+                                    progress.status = "copy"
+                                    segment = compressor.segment(entry)
+                                    if hasattr(volume, "compression_method"):
+                                        # Per segment, files not compressible enough are stored
+                                        volume.compression_method = (
+                                            segment.compression_method
+                                        )
+                                    try:
+                                        urn = volume.writeLogicalStream(
+                                            pathname,
+                                            hasher,
+                                            fsmeta.length,
+                                            allow_large_zipsegments=segment.large_zip_segment,
+                                            progress=progress,
+                                        )
+                                        hasher.finish()
+                                    finally:
+                                        # Stop reading ahead before the source is closed
+                                        hasher.close()
+                                    fsmeta.urn = urn
+                                    aff4_file_hashes = {}
+                                    for h in hasher.hashes:
+                                        aff4_file_hashes[hasher.hashToType[h]] = (
+                                            h.hexdigest()
+                                        )
+                                        file_hashes[h.name] = h.hexdigest()
+                                    resolver.columns.add(
+                                        urn, fsmeta, hashes=aff4_file_hashes
                                     )
-                                    file_hashes[h.name] = hh.value
-                            copied_size += filesize
-
-                        except (FileNotFoundError, OSError):
-                            # FileNotFoundError if source disconnected and we try to open it
-                            # OSError if source disconnected and we try to read from it
-                            print("Lost source! (Or permission problem)")
-                            raise
-                        files_hashes[path.normpath(path.join(rel_path, filename))] = (
-                            file_hashes
-                        )
+                                    for hash_algo, h in hasher.others.items():
+                                        file_hashes[hash_algo] = h.hexdigest()
+                                copied_size += filesize
 
-                # Write Hash Files
-                end_time = datetime.now()
+                            except (FileNotFoundError, OSError):
+                                # FileNotFoundError if source disconnected and we try to open it
+                                # OSError if source disconnected and we try to read from it
+                                print("Lost source! (Or permission problem)")
+                                raise
+                            for report in reports.values():
+                                report.add(
+                                    path.normpath(path.join(rel_path, filename)),
+                                    file_hashes,
+                                    fsmeta,
+                                )
+                            self.remove_lost_mirrors(destinations, mirrors, reports)
 
-                resolver.Set(
-                    volume.urn,
-                    volume.urn,
-                    rdfvalue.URN("http://aff4.org/Schema#endTime"),
-                    rdfvalue.XSDDateTime(utils.SmartUnicode(end_time.isoformat())),
-                )
+                    # Write Hash Files
+                    end_time = datetime.now()
+
+                    resolver.Set(
+                        volume.urn,
+                        volume.urn,
+                        rdfvalue.URN("http://aff4.org/Schema#endTime"),
+                        rdfvalue.XSDDateTime(utils.SmartUnicode(end_time.isoformat())),
+                    )
+        except BaseException:
+            for report in reports.values():
+                report.close()
+            raise
+        finally:
+            multi_hasher.stop()
+            multi_hasher.join()
+            compressor.close()
+            reader.stop()
+            reader.join()
+            # Wait for the writers to write the whole container
+            if container_file is not None:
+                container_file.close()
+            for mirror in mirrors:
+                mirror.stop()
+                mirror.join()
+        self.remove_lost_mirrors(destinations, mirrors, reports)
+
+        # Container closed, its metadata written
+        write_seconds = (datetime.now() - start_time).total_seconds()
+        container_size = os.path.getsize(container_path)
+        details = [
+            f"AFF4 File Compression: {compressor.compression}"
+            + (
+                f" ({compressor.compressed_files} files compressed, {compressor.stored_files} stored as not compressible)"
+                if compressor.compression != "stored"
+                else ""
+            ),
+            f"Container Size: {container_size} Bytes (Compression Ratio: {copied_size / container_size if container_size else 1:.2f})",
+            f"Container Write: {throughput(copied_size, write_seconds)}",
+        ]
 
         print("Writing Hash Files...")
 
-        for dst in destinations:
-            try:
-                report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
-                with open(report_file_path, "a", encoding="utf-8") as report_file:
-                    report_file.write(f"End Time: {end_time.isoformat()}\n")
-                    report_file.write(f"Duration: {end_time - start_time}\n")
-                    report_file.write("\n")
-                    report_file.write(
-                        f"################## Source Hashes ######################\n"
-                    )
-                    for file, file_hashes in files_hashes.items():
-                        hash_values = [file_hashes[hash_algo] for hash_algo in hashes]
-                        report_file.write(f"{' - '.join(hash_values)} - {file}\n")
-                if self.csv_log:
-                    csv_report_file_path = path.join(
-                        dst, f"{base_path}_file_report.csv"
-                    )
-                    with open(
-                        csv_report_file_path, "w", encoding="utf-8", newline=""
-                    ) as csv_report_file:
-                        csv_report_writer = csv.writer(
-                            csv_report_file,
-                            delimiter=",",
-                            quotechar='"',
-                            quoting=csv.QUOTE_MINIMAL,
-                        )
-                        csv_report_writer.writerow(
-                            [
-                                "path",
-                                "size",
-                                "created",
-                                "modified",
-                                "accessed",
-                                "record_changed",
-                            ]
-                            + self.hashes
-                        )
-                        for file, file_hashes in files_hashes.items():
-                            hash_values = [
-                                file_hashes[hash_algo] for hash_algo in hashes
-                            ]
-                            metadata = files_metadata[file]
-                            csv_report_writer.writerow(
-                                [
-                                    file,
-                                    metadata.length,
-                                    (
-                                        metadata.birthTime
-                                        if hasattr(metadata, "birthTime")
-                                        else ""
-                                    ),
-                                    metadata.lastWritten,
-                                    metadata.lastAccessed,
-                                    (
-                                        metadata.recordChanged
-                                        if hasattr(metadata, "recordChanged")
-                                        else ""
-                                    ),
-                                ]
-                                + hash_values
-                            )
-            except FileNotFoundError as error:
-                print(f"Error writing to report: {error}")
-                raise
+        for report in reports.values():
+            report.close()
+            report.write_source_hashes(start_time, end_time, details)
+            # The container is verified from its own hashes, the index is not needed anymore
+            report.remove_index()
 
         # Verify Hashes
         print("Verifying Hashes...")
@@ -754,7 +1153,7 @@ class CopyThread(QThread):
             }
             for dst in destinations
         }
-        self.copy_progress.emit(ProgressData(1, copy(progress)))
+        self.emit(ProgressData(1, copy(progress)))
         for dst in destinations:
             hashed_size = 0
             filecount = 0
@@ -762,7 +1161,7 @@ class CopyThread(QThread):
                 report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
                 with open(report_file_path, "a", encoding="utf-8") as report_file:
                     with container.Container.openURNtoContainer(
-                        rdfvalue.URN.FromFileName(container_path)
+                        rdfvalue.URN.FromFileName(path.join(dst, base_path))
                     ) as volume:
                         resolver = volume.resolver
                         verification_listener = LinearVerificationListener(volume.urn)
@@ -819,15 +1218,16 @@ class CopyThread(QThread):
                                 "processed_files": filecount,
                                 "current_file": filename,
                             }
-                            self.copy_progress.emit(ProgressData(1, copy(progress)))
+                            self.emit(ProgressData(1, copy(progress)))
 
-                            # Quick Fix, will not work if multiple destinations are implemented
+                            # Containers are verified one after the other, the other destinations keep their status
                             progress_listener = ProgressContextListener()
                             progress_listener.start = hashed_size
-                            progress_listener.destinations = self.destinations
+                            progress_listener.destinations = [dst]
+                            progress_listener.payload = progress
                             progress_listener.processed_files = filecount
                             progress_listener.current_file = filename
-                            progress_listener.copy_progress = self.copy_progress
+                            progress_listener.copy_progress = self.emit
                             progress_listener.status = "hashing"
                             progress_listener.main_status = 1
 
@@ -857,7 +1257,7 @@ class CopyThread(QThread):
                             report_file.write(
                                 f"Verification successful for {filecount-failed_files} files\n"
                             )
-                            self.copy_progress.emit(ProgressData(1, copy(progress)))
+                            self.emit(ProgressData(1, copy(progress)))
 
                         else:
                             # Signal the end with no errors of the hash verification for the current volume
@@ -871,7 +1271,7 @@ class CopyThread(QThread):
                             report_file.write(
                                 f"Verification successful for {filecount} files\n"
                             )
-                            self.copy_progress.emit(ProgressData(1, copy(progress)))
+                            self.emit(ProgressData(1, copy(progress)))
 
             except FileNotFoundError as error:
                 print(f"Error writing to report: {error}")
@@ -879,7 +1279,100 @@ class CopyThread(QThread):
 
         # Done
         print("Done!")
-        self.copy_progress.emit(ProgressData(2, {}))
+        self.emit(ProgressData(2, {}))
+
+    def remove_lost_mirrors(self, destinations: list, mirrors: list, reports: dict):
+        # Destinations the container could not be mirrored to anymore, remove from list
+        for mirror in mirrors:
+            if mirror.lost and mirror.destination in destinations:
+                destinations.pop(destinations.index(mirror.destination))
+                reports.pop(mirror.destination).close()
+                try:
+                    report_file_path = path.join(
+                        mirror.destination, f"{self.base_path}_copy_report.txt"
+                    )
+                    with open(report_file_path, "a", encoding="utf-8") as report_file:
+                        report_file.write(f"ERROR DURING COPY:\n")
+                        report_file.write(str(mirror.lost_error))
+                except OSError as error:
+                    print(f"Error writing to report: {error}")
+
+    def walk_source(self, src: str):
+        """
+        :return: DirectoryEntry for each directory of the source, as listed by the size calculation if available
+        """
+        if self.source_manifest is not None:
+            return iter(self.source_manifest)
+        return TreeWalker(src).walk()
+
+    def source_stat(
+        self, entry: FileEntry, stat: os.stat_result = None
+    ) -> os.stat_result:
+        """
+        Stat of a source file, as listed in the manifest unless the file changed since
+        :param entry: FileEntry of the file
+        :param stat: current stat of the file (fstat of the opened file), None to trust the manifest
+        """
+        if stat is None:
+            return entry.stat if entry.stat is not None else os.stat(entry.path)
+        if SourceManifest.changed(entry, stat):
+            print(
+                f"Warning - {entry.path} changed since the source was listed, using its current metadata."
+            )
+            return stat
+        return entry.stat
+
+    def resumed_hashes(
+        self,
+        previous_records: dict,
+        filepath: str,
+        src_stat: os.stat_result,
+        dst_file_path: str,
+        hashes: list,
+    ) -> dict | None:
+        """
+        Hashes recorded for a file already copied to all the destinations by an interrupted copy
+        :param previous_records: {dst: {filepath: record, ...}, ...} loaded from the journals
+        :param filepath: path of the file relative to the copy
+        :param src_stat: stat of the source file
+        :param dst_file_path: path of the file in the destinations, relative to the destination
+        :param hashes: hash algorithms of the current copy
+        :return: {hash_name:hash_value, ...}, None if the file needs to be copied
+        """
+        file_hashes = None
+        for dst, records in previous_records.items():
+            record = records.get(filepath)
+            if not resumable(record, src_stat, hashes, path.join(dst, dst_file_path)):
+                return None
+            record_hashes = {
+                hash_algo: record["hashes"][hash_algo] for hash_algo in hashes
+            }
+            if file_hashes is not None and record_hashes != file_hashes:
+                return None
+            file_hashes = record_hashes
+        return file_hashes
+
+    def writers_progress(
+        self, writers: dict, current_file: str = "", reading: bool = True
+    ) -> dict:
+        """
+        Copy progress of each destination, as written by its own writer
+        :param writers: {dst: CopyWorker, ...}
+        :param current_file: file being read from the source, used until the writer opened a file
+        :param reading: source still being read, destinations cannot be done yet
+        :return: {dst: progress_status, ...}
+        """
+        return {
+            dst: {
+                "status": "copy" if reading or writer.busy else "copied",
+                "processed_bytes": writer.written_bytes,
+                "processed_files": writer.written_files,
+                "current_file": writer.current_file or current_file,
+                # Bytes/s of this destination alone, remembered for the duration estimates of the next copies
+                "write_throughput": writer.throughput,
+            }
+            for dst, writer in writers.items()
+        }
 
     def initialize_log_files(self, destinations, base_path, src):
         start_time = datetime.now()
@@ -923,11 +1416,9 @@ class CopyThread(QThread):
         return start_time
 
 
-class VerifyThread(QThread):
-    verify_progress = Signal(object)
-
-    def __init__(self, src: str, total_files, total_bytes):
-        super().__init__()
+class VerifyEngine(Engine):
+    def __init__(self, src: str, total_files, total_bytes, progress=None):
+        super().__init__(progress)
         self.src = src
         self.total_files = total_files
         self.total_bytes = total_bytes
@@ -938,7 +1429,7 @@ class VerifyThread(QThread):
         except Exception as error:
             # TODO Implement Error handling
             raise
-            self.verify_progress.emit(ProgressData(-1, error))
+            self.emit(ProgressData(-1, error))
 
     def verify_aff4(self, src: str):
 
@@ -954,7 +1445,7 @@ class VerifyThread(QThread):
             }
         }
 
-        self.verify_progress.emit(ProgressData(4, copy(progress)))
+        self.emit(ProgressData(4, copy(progress)))
 
         hashed_size = 0
         filecount = 0
@@ -1011,7 +1502,7 @@ class VerifyThread(QThread):
                     "processed_files": filecount,
                     "current_file": filename,
                 }
-                self.verify_progress.emit(ProgressData(4, copy(progress)))
+                self.emit(ProgressData(4, copy(progress)))
 
                 # Quick Fix, will not work if multiple destinations are implemented
                 progress_listener = ProgressContextListener()
@@ -1021,7 +1512,7 @@ class VerifyThread(QThread):
                 ]  # When verifying a container, the container source has the destination role in normal progress.
                 progress_listener.processed_files = filecount
                 progress_listener.current_file = filename
-                progress_listener.copy_progress = self.verify_progress
+                progress_listener.copy_progress = self.emit
                 progress_listener.status = "hashing"
                 progress_listener.main_status = 4
 
@@ -1044,7 +1535,7 @@ class VerifyThread(QThread):
                     "log": log,
                 }
 
-                self.verify_progress.emit(ProgressData(4, copy(progress)))
+                self.emit(ProgressData(4, copy(progress)))
 
             else:
                 # Signal the end with no errors of the hash verification for the current volume
@@ -1056,11 +1547,11 @@ class VerifyThread(QThread):
                     "current_file": "",
                     "log": log,
                 }
-                self.verify_progress.emit(ProgressData(4, copy(progress)))
+                self.emit(ProgressData(4, copy(progress)))
 
         # Done
         print("Done!")
-        self.verify_progress.emit(ProgressData(5, {}))
+        self.emit(ProgressData(5, {}))
 
     def initialise_log_text(self):
         log = ""
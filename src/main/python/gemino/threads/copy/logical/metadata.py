@@ -0,0 +1,226 @@
+# Metadata of the images (files and folders) of AFF4-L containers, kept in columns instead of the resolver.
+# pyaff4 keeps every fact as an RDFValue in nested dictionaries of its MemoryDataStore, and serializes the
+# container metadata (information.turtle) by building an rdflib graph of all the facts: with a million files,
+# most of the time and memory of closing the container. The facts gemino writes for each image (timestamps,
+# size, path, hashes) are instead appended to arrays, and information.turtle is written as plain text in a
+# single pass over the resolver and the columns, without rdflib.
+
+import math
+import re
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from io import StringIO
+
+from pyaff4 import data_store, lexicon, rdfvalue, utils
+
+# Timestamps of the images and the FSMetadata attributes they come from
+TIMESTAMPS = (
+    (lexicon.standard11.lastWritten, "lastWritten"),
+    (lexicon.standard11.lastAccessed, "lastAccessed"),
+    (lexicon.standard11.recordChanged, "recordChanged"),
+    (lexicon.standard11.birthTime, "birthTime"),
+)
+TURTLE_ESCAPES = str.maketrans(
+    {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+)
+# Prefixes of information.turtle, IRIs in these namespaces are written as prefixed names
+PREFIXES = {
+    "aff4": lexicon.AFF4_NAMESPACE,
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+}
+LOCAL_NAME = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+
+
+def turtle_literal(value: str, datatype) -> str:
+    return f'"{value.translate(TURTLE_ESCAPES)}"^^<{datatype}>'
+
+
+def turtle_term(value: rdfvalue.RDFValue) -> str:
+    # Same term rdflib would serialize for the value
+    return value.GetRaptorTerm().n3()
+
+
+@lru_cache(maxsize=1024)
+def prefixed_name(iri: str) -> str:
+    """
+    :return: iri as a prefixed name (eg. aff4:size) if in the namespace of a prefix, else <iri>
+    """
+    for prefix, namespace in PREFIXES.items():
+        if iri.startswith(namespace) and LOCAL_NAME.fullmatch(iri[len(namespace) :]):
+            return f"{prefix}:{iri[len(namespace):]}"
+    return f"<{iri}>"
+
+
+def compact_term(term: str) -> str:
+    """
+    :param term: IRI or typed literal, with full IRIs
+    """
+    if term.startswith("<"):
+        return prefixed_name(term[1:-1])
+    datatype = term.rfind('"^^<')
+    if datatype != -1 and term.endswith(">"):
+        return term[: datatype + 3] + prefixed_name(term[datatype + 4 : -1])
+    return term
+
+
+class ImageColumns:
+    """
+    Facts of the images of a container, one row per image and one array per fact.
+    """
+
+    def __init__(self):
+        self.urns = []
+        self.rows = {}  # {urn: row, ...}
+        self.folders = array("b")  # 1 for folder images, 0 for file images
+        # pathName of the folder images, None for files (set by pyaff4)
+        self.path_names = []
+        self.sizes = array("q")
+        # Seconds since the epoch of each timestamp, NaN if the image has none
+        self.timestamps = {predicate: array("d") for predicate, _ in TIMESTAMPS}
+        self.hashes = {}  # {hash datatype: [hex digest or None, ...], ...}
+        # Timestamps not in the time zone of the others, {(row, predicate): isoformat, ...}
+        self.other_timestamps = {}
+        self.timezone = None
+
+    def __len__(self):
+        return len(self.urns)
+
+    def add(
+        self,
+        urn,
+        fsmeta,
+        path_name: str = None,
+        hashes: dict = None,
+    ):
+        """
+        :param urn: URN of the image
+        :param fsmeta: pyaff4 FSMetadata of the file or folder
+        :param path_name: path of the folder in the container, None for files
+        :param hashes: {hash datatype: hex digest, ...} of the file
+        """
+        urn = rdfvalue.URN(urn).SerializeToString()
+        hashes = dict(hashes or {})
+        row = len(self.urns)
+        self.urns.append(urn)
+        self.rows[urn] = row
+        self.folders.append(path_name is not None)
+        self.path_names.append(path_name)
+        self.sizes.append(int(fsmeta.length))
+        for predicate, attribute in TIMESTAMPS:
+            timestamp = getattr(fsmeta, attribute, None)
+            self.timestamps[predicate].append(
+                self.__timestamp(row, predicate, timestamp)
+            )
+        for datatype, column in self.hashes.items():
+            column.append(hashes.pop(datatype, None))
+        for datatype, value in hashes.items():
+            # First file hashed with this algorithm
+            self.hashes[datatype] = [None] * row + [value]
+
+    def triples(self, row: int) -> dict:
+        """
+        :return: {predicate: [turtle term, ...], ...} of the image
+        """
+        if self.folders[row]:
+            types = [lexicon.standard11.FolderImage, lexicon.standard.Image]
+        else:
+            types = []
+        facts = {}
+        if types:
+            facts[lexicon.AFF4_TYPE] = [f"<{value}>" for value in types]
+            facts[lexicon.standard11.pathName] = [
+                turtle_term(rdfvalue.XSDString(self.path_names[row]))
+            ]
+        facts[lexicon.AFF4_STREAM_SIZE] = [
+            f'"{self.sizes[row]}"^^<{rdfvalue.XSDInteger.datatype}>'
+        ]
+        for predicate, column in self.timestamps.items():
+            timestamp = column[row]
+            if math.isnan(timestamp):
+                continue
+            value = self.other_timestamps.get((row, predicate))
+            if value is None:
+                value = datetime.fromtimestamp(timestamp, self.timezone).isoformat()
+            facts[predicate] = [turtle_literal(value, rdfvalue.XSDDateTime.datatype)]
+        hashes = [
+            turtle_literal(column[row], datatype)
+            for datatype, column in self.hashes.items()
+            if column[row] is not None
+        ]
+        if hashes:
+            facts[lexicon.standard.hash] = hashes
+        return facts
+
+    def __timestamp(self, row: int, predicate, timestamp) -> float:
+        if timestamp is None or not isinstance(timestamp, datetime):
+            return math.nan
+        if self.timezone is None:
+            self.timezone = timestamp.tzinfo
+        if timestamp.tzinfo is not self.timezone:
+            self.other_timestamps[(row, predicate)] = timestamp.isoformat()
+        return timestamp.timestamp()
+
+
+class ColumnarDataStore(data_store.MemoryDataStore):
+    """
+    MemoryDataStore whose information.turtle also holds the facts of the images added to columns,
+    written as text in a single pass instead of through an rdflib graph.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.columns = ImageColumns()
+
+    def _DumpToTurtle(self, volumeurn, verbose=False):
+        turtle = StringIO()
+        for prefix, namespace in PREFIXES.items():
+            turtle.write(f"@prefix {prefix}: <{namespace}> .\n")
+        turtle.write("\n")
+        written = set()
+        for urn, items in self.store.items():
+            urn = utils.SmartUnicode(urn)
+            row = self.columns.rows.get(urn)
+            facts = {}
+            for attr, value in items.items():
+                attr = utils.SmartUnicode(attr)
+                if not verbose and attr.startswith(lexicon.AFF4_VOLATILE_NAMESPACE):
+                    continue
+                terms = facts.setdefault(attr, [])
+                for item in value if isinstance(value, list) else [value]:
+                    if not self._should_ignore(urn, attr, item):
+                        terms.append(turtle_term(item))
+            if row is not None:
+                written.add(row)
+                for predicate, terms in self.columns.triples(row).items():
+                    if (
+                        predicate == lexicon.AFF4_TYPE
+                        or predicate == lexicon.standard.hash
+                    ):
+                        # Added to the facts of pyaff4
+                        known = facts.setdefault(predicate, [])
+                        known.extend(term for term in terms if term not in known)
+                    else:
+                        # Set, replacing the facts of pyaff4
+                        facts[predicate] = terms
+            elif lexicon.AFF4_TYPE not in items and not urn.startswith("aff4:sha512:"):
+                # Only objects and pseudo map entries are dumped
+                continue
+            self.__write(turtle, urn, facts)
+        for row, urn in enumerate(self.columns.urns):
+            if row not in written:
+                self.__write(turtle, urn, self.columns.triples(row))
+        return turtle.getvalue()
+
+    @staticmethod
+    def __write(turtle: StringIO, urn: str, facts: dict):
+        predicates = [
+            f"    {'a' if predicate == lexicon.AFF4_TYPE else prefixed_name(predicate)} "
+            + " , ".join(compact_term(term) for term in terms)
+            for predicate, terms in facts.items()
+            if terms
+        ]
+        if predicates:
+            turtle.write(f"<{urn}>\n")
+            turtle.write(" ;\n".join(predicates))
+            turtle.write(" .\n\n")
@@ -0,0 +1,81 @@
+# Preallocation of the destination files to the size of the source, before streaming the data.
+# Filesystems can then allocate large files in one go (contiguous on exFAT/NTFS drives) instead of growing
+# them block by block, and a destination running out of space fails before the file is written.
+# Linux: fallocate, called directly as posix_fallocate falls back to writing the whole file on filesystems
+# without support for it (eg. FAT). macOS: F_PREALLOCATE. Windows: setting the size of the file allocates it,
+# without writing it. Elsewhere: posix_fallocate.
+
+import ctypes
+import errno
+import os
+import platform
+import struct
+
+# Errors meaning the filesystem cannot preallocate, the file grows as it is written instead
+PREALLOCATE_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+# Allocate past the end of the file without changing its size, the only mode supported by FAT
+FALLOC_FL_KEEP_SIZE = 0x01
+
+_fallocate = None
+if platform.system() == "Linux":
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _fallocate = getattr(_libc, "fallocate64", None) or _libc.fallocate
+        _fallocate.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int64,
+            ctypes.c_int64,
+        ]
+    except (OSError, AttributeError):
+        _fallocate = None
+
+if platform.system() == "Darwin":
+    import fcntl
+
+    # From <sys/fcntl.h>, not exposed by the fcntl module
+    F_PREALLOCATE = 42
+    F_ALLOCATECONTIG = 0x2
+    F_ALLOCATEALL = 0x4
+    F_PEOFPOSMODE = 3
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """
+    Allocate size bytes for a file about to be written from its start.
+    Depending on the platform the file might already have its final size, or only the space might be reserved,
+    a file ending up shorter than expected has to be truncated to what was written.
+    :param fd: descriptor of the file, open for writing
+    :param size: final size of the file
+    :return: False if the filesystem does not support it
+    :raise OSError: ENOSPC if the destination does not have enough space left
+    """
+    if size <= 0:
+        return False
+    try:
+        if _fallocate is not None:
+            if _fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error))
+        elif platform.system() == "Darwin":
+            # Contiguous if possible, allocated past the end of the file which keeps its size
+            for flags in (F_ALLOCATECONTIG | F_ALLOCATEALL, F_ALLOCATEALL):
+                store = struct.pack("Iiqqq", flags, F_PEOFPOSMODE, 0, size, 0)
+                try:
+                    fcntl.fcntl(fd, F_PREALLOCATE, store)
+                    break
+                except OSError as error:
+                    if flags == F_ALLOCATEALL or error.errno == errno.ENOSPC:
+                        raise
+        elif os.name == "nt":
+            # NTFS and exFAT only zero the clusters that are read before being written
+            os.ftruncate(fd, size)
+        elif hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            return False
+    except OSError as error:
+        if error.errno in PREALLOCATE_UNSUPPORTED:
+            return False
+        raise
+    return True
@@ -0,0 +1,149 @@
+import csv
+import os
+import os.path as path
+from datetime import datetime
+
+
+class ReportSink:
+    """
+    Per-file part of the copy report of a destination, written as the files are copied.
+    Rows are appended to the CSV report, the .<algo> hash files and a compact index as soon as a file
+    is done, nothing is kept in memory. The source hashes of the text report and the verification
+    are streamed back from the index.
+    """
+
+    def __init__(self, dst: str, base_path: str, hashes: list, csv_log: bool):
+        self.dst = dst
+        self.base_path = base_path
+        self.hashes = hashes
+        self.csv_log = csv_log
+        self.report_file_path = path.join(dst, f"{base_path}_copy_report.txt")
+        self.index_file_path = path.join(dst, f"{base_path}_file_index.csv")
+        self.__index_file = None
+        self.__index_writer = None
+        self.__csv_report_file = None
+        self.__csv_report_writer = None
+        self.__hash_files = {}
+
+    def open(self):
+        try:
+            self.__index_file = open(
+                self.index_file_path, "w", encoding="utf-8", newline=""
+            )
+            self.__index_writer = csv.writer(self.__index_file)
+            if self.csv_log:
+                csv_report_file_path = path.join(
+                    self.dst, f"{self.base_path}_file_report.csv"
+                )
+                self.__csv_report_file = open(
+                    csv_report_file_path, "w", encoding="utf-8", newline=""
+                )
+                self.__csv_report_writer = csv.writer(
+                    self.__csv_report_file,
+                    delimiter=",",
+                    quotechar='"',
+                    quoting=csv.QUOTE_MINIMAL,
+                )
+                self.__csv_report_writer.writerow(
+                    [
+                        "path",
+                        "size",
+                        "created",
+                        "modified",
+                        "accessed",
+                        "record_changed",
+                    ]
+                    + self.hashes
+                )
+            for hash_algo in self.hashes:
+                hash_file_path = path.join(self.dst, f"{self.base_path}.{hash_algo}")
+                self.__hash_files[hash_algo] = open(
+                    hash_file_path, "w", encoding="utf-8"
+                )
+        except FileNotFoundError:
+            print(
+                "Unable to write hash file in destination dir, volume not connected anymore."
+            )
+            self.close()
+            raise
+
+    def add(self, filepath: str, file_hashes: dict, metadata):
+        """
+        :param filepath: path of the file relative to the copy
+        :param file_hashes: {hash_name:hash_value, ...}
+        :param metadata: pyaff4 FSMetadata of the source file
+        """
+        hash_values = [file_hashes[hash_algo] for hash_algo in self.hashes]
+        self.__index_writer.writerow([filepath] + hash_values)
+        if self.__csv_report_writer is not None:
+            self.__csv_report_writer.writerow(
+                [
+                    filepath,
+                    metadata.length,
+                    (metadata.birthTime if hasattr(metadata, "birthTime") else ""),
+                    metadata.lastWritten,
+                    metadata.lastAccessed,
+                    (
+                        metadata.recordChanged
+                        if hasattr(metadata, "recordChanged")
+                        else ""
+                    ),
+                ]
+                + hash_values
+            )
+        for hash_algo, hash_file in self.__hash_files.items():
+            hash_file.write(f"{file_hashes[hash_algo]} {filepath}\n")
+
+    def close(self):
+        for report_file in [
+            self.__index_file,
+            self.__csv_report_file,
+            *self.__hash_files.values(),
+        ]:
+            if report_file is not None:
+                try:
+                    report_file.close()
+                except OSError as error:
+                    print(f"Error writing to report: {error}")
+        self.__index_file = self.__csv_report_file = None
+        self.__index_writer = self.__csv_report_writer = None
+        self.__hash_files = {}
+
+    def files(self):
+        """
+        Stream the files recorded in the index, in copy order
+        :return: (filepath, {hash_name:hash_value, ...}) for each file
+        """
+        with open(self.index_file_path, "r", encoding="utf-8", newline="") as index:
+            for row in csv.reader(index):
+                yield row[0], dict(zip(self.hashes, row[1:]))
+
+    def write_source_hashes(
+        self, start_time: datetime, end_time: datetime, details: list = None
+    ):
+        """
+        Close the copy section of the text report, listing the hashes of all the files copied
+        :param details: additional lines about the copy (eg. block sizes and throughputs)
+        """
+        try:
+            with open(self.report_file_path, "a", encoding="utf-8") as report_file:
+                report_file.write(f"End Time: {end_time.isoformat()}\n")
+                report_file.write(f"Duration: {end_time - start_time}\n")
+                for line in details or []:
+                    report_file.write(f"{line}\n")
+                report_file.write("\n")
+                report_file.write(
+                    f"################## Source Hashes ######################\n"
+                )
+                for file, file_hashes in self.files():
+                    hash_values = [file_hashes[hash_algo] for hash_algo in self.hashes]
+                    report_file.write(f"{' - '.join(hash_values)} - {file}\n")
+        except FileNotFoundError as error:
+            print(f"Error writing to report: {error}")
+            raise
+
+    def remove_index(self):
+        try:
+            os.remove(self.index_file_path)
+        except OSError as error:
+            print(f"Unable to remove file index: {error}")
@@ -0,0 +1,147 @@
+import time
+
+MiB = 1024 * 1024
+# Memory the blocks in flight of a job can use if not configured
+DEFAULT_MEMORY_CEILING = 1024 * MiB
+
+
+class BlockSizeController:
+    """
+    Tunes the size of the blocks read while a job runs.
+    The block size is doubled (then halved) as long as it improves the throughput measured over a window,
+    and settles on the best size found. The number of blocks in flight is not measured, it only follows
+    the memory ceiling: as many blocks of that size as the ceiling allows, up to max_depth.
+    """
+
+    def __init__(
+        self,
+        memory_ceiling: int,
+        max_depth: int,
+        initial_block_size: int = 8 * MiB,
+        min_block_size: int = 1 * MiB,
+        max_block_size: int = 256 * MiB,
+        window: float = 1.0,
+    ):
+        """
+        :param memory_ceiling: bytes the blocks in flight can use at most
+        :param max_depth: maximum number of blocks in flight
+        :param initial_block_size: block size the job starts with
+        :param min_block_size: smallest block size tried
+        :param max_block_size: largest block size tried, further limited by the memory ceiling
+        :param window: seconds of transfer each block size is measured for
+        """
+        self.memory_ceiling = memory_ceiling
+        self.max_depth = max(2, max_depth)
+        # At least two blocks in flight, so that reading and writing overlap
+        self.min_block_size = min(min_block_size, max(MiB, memory_ceiling // 2))
+        self.max_block_size = max(
+            self.min_block_size, min(max_block_size, memory_ceiling // 2)
+        )
+        self.window = window
+        self.block_size = self.__clamp(initial_block_size)
+        self.settled = False
+        self.history = []  # [(block_size, throughput), ...] of each measurement window
+        self.__direction = 1
+        self.__reversed = False
+        self.__best = None  # (block_size, throughput)
+        self.__window_start = None
+        self.__window_bytes = 0
+        self.__window_blocks = 0
+
+    @property
+    def depth(self) -> int:
+        return max(2, min(self.max_depth, self.memory_ceiling // self.block_size))
+
+    def update(self, processed_bytes: int) -> bool:
+        """
+        Account for a block handed to the workers, to be called by the reader
+        :param processed_bytes: bytes processed since the last update, by the slowest worker if several consume the blocks
+        :return: True if the block size (and depth) changed
+        """
+        if self.settled:
+            return False
+        now = time.monotonic()
+        if self.__window_start is None:
+            # The first block of a window was read before it started, only measure the following ones
+            self.__window_start = now
+            return False
+        self.__window_bytes += processed_bytes
+        self.__window_blocks += 1
+        elapsed = now - self.__window_start
+        if elapsed < self.window or self.__window_blocks < self.depth:
+            return False
+
+        throughput = self.__window_bytes / elapsed
+        self.history.append((self.block_size, throughput))
+        self.__window_start = None
+        self.__window_bytes = 0
+        self.__window_blocks = 0
+
+        # Only consider an improvement above the noise of the measurement
+        improved = self.__best is None or throughput > self.__best[1] * 1.05
+        if improved:
+            self.__best = (self.block_size, throughput)
+        elif self.__reversed:
+            return self.__settle()
+        else:
+            self.__reverse()
+
+        block_size = self.__step()
+        if block_size is None and not self.__reversed:
+            # Limit reached in this direction, try the other one
+            self.__reverse()
+            block_size = self.__step()
+        if block_size is None:
+            return self.__settle()
+        self.block_size = block_size
+        return True
+
+    def summary(self) -> list:
+        """
+        :return: lines describing the block sizes used, for the report
+        """
+        used = []
+        for block_size in [size for size, _ in self.history] + [self.block_size]:
+            if block_size not in used:
+                used.append(block_size)
+        return [
+            f"Block Size: {self.block_size // MiB} MiB"
+            + (
+                f" (used: {', '.join(f'{size // MiB} MiB' for size in used)})"
+                if len(used) > 1
+                else ""
+            ),
+            f"Blocks in Flight: {self.depth} (not tuned, as many as the Memory Ceiling of "
+            f"{self.memory_ceiling // MiB} MiB allows, up to {self.max_depth})",
+        ]
+
+    def __clamp(self, block_size: int) -> int:
+        return max(self.min_block_size, min(self.max_block_size, block_size))
+
+    def __step(self) -> int | None:
+        # Always step from the best size measured so far
+        best_size = self.__best[0] if self.__best else self.block_size
+        block_size = best_size * 2 if self.__direction > 0 else best_size // 2
+        if block_size != self.__clamp(block_size):
+            return None
+        return block_size
+
+    def __reverse(self):
+        self.__reversed = True
+        self.__direction = -self.__direction
+
+    def __settle(self) -> bool:
+        self.settled = True
+        best_size = self.__best[0] if self.__best else self.block_size
+        changed = best_size != self.block_size
+        self.block_size = best_size
+        return changed
+
+
+def throughput(processed_bytes: int, seconds: float) -> str:
+    """
+    :return: throughput formatted for the report
+    """
+    if not seconds:
+        return "n/a"
+    return f"{processed_bytes / seconds / 10 ** 6:.1f} MB/s"
@@ -1,23 +1,579 @@
-from threading import Thread
+from threading import Thread, Semaphore, Lock, Condition
+from queue import Queue
+import errno
+import os
+import os.path as path
+import shutil
+import time
 
+from .preallocation import preallocate
+
+# copy_file_range errors meaning the kernel cannot copy between these files, not an I/O error
+KERNEL_COPY_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP}
+
+# When the destination files are flushed to the media:
+#   none: left to the OS, dirty pages may pile up and stall the end of large jobs on slow drives
+#   file: each file is flushed before being closed (and recorded in the journal)
+#   batch: closed files are flushed together every SYNC_INTERVAL bytes (or SYNC_BATCH_FILES files)
+#   incremental: the write-back starts every SYNC_INTERVAL bytes written, each file is flushed before being closed
+DURABILITY_POLICIES = ("none", "file", "batch", "incremental")
+SYNC_INTERVAL = 256 * 1024 * 1024
+SYNC_BATCH_FILES = 256
+# Flushes the data of a file, not its metadata (not available on macOS)
+fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+class Block:
+    """
+    Block of data read from the source, shared between all the workers consuming it.
+    The block frees its slot (and slab) in the ring once every consumer released it.
+    """
+
+    def __init__(self, ring, data, consumers: int, slab: bytearray = None):
+        self.ring = ring
+        self.data = data
+        self.slab = slab
+        self.__consumers = consumers
+        self.__lock = Lock()
+
+    def release(self):
+        with self.__lock:
+            self.__consumers -= 1
+            if self.__consumers > 0:
+                return
+        self.ring.release(self)
+
+
+class BlockRing:
+    """
+    Bounded number of blocks in flight between the source reader and the workers.
+    The reader blocks when all slots are in use, bounding the memory used by the read-ahead.
+    Blocks read through the ring are filled in place in slabs allocated once and recycled
+    when released, no new buffer is allocated (nor copied) for each block.
+    """
+
+    def __init__(self, slots: int, block_size: int = 0, allocate=bytearray):
+        """
+        :param slots: maximum number of blocks in flight
+        :param block_size: size of the blocks read
+        :param allocate: allocate(size) returning a new writable slab (eg. aligned for direct I/O)
+        """
+        self.slots = slots
+        self.block_size = block_size
+        self.__allocate = allocate
+        # Bytes read and time spent reading through the ring, the source throughput
+        self.read_bytes = 0
+        self.read_time = 0.0
+        self.__free = Semaphore(slots)
+        self.__slabs = []  # Slabs already allocated and not in use
+        self.__slabs_lock = Lock()
+
+    def resize(self, slots: int, block_size: int):
+        """
+        Change the number of slots and the size of the blocks read, to be called by the reader.
+        Blocks in flight keep their slab, slabs of another size are dropped when released.
+        """
+        with self.__slabs_lock:
+            self.block_size = block_size
+            self.__slabs = [slab for slab in self.__slabs if len(slab) == block_size]
+        for _ in range(slots, self.slots):
+            # Waits for blocks in flight to be released
+            self.__free.acquire()
+        for _ in range(self.slots, slots):
+            self.__free.release()
+        self.slots = slots
+
+    def block(self, data, consumers: int) -> Block:
+        """
+        Wrap data already in memory (eg. returned by a stream without readinto) in a block
+        """
+        self.__free.acquire()
+        return self.__share(Block(self, data, consumers), consumers)
+
+    def read(self, file, consumers: int, size: int = None) -> Block | None:
+        """
+        Read the next block of file directly into a free slab
+        :param file: file object supporting readinto
+        :param consumers: number of workers that will release the block
+        :param size: bytes to read, at most (and by default) block_size
+        :return: Block, None once the end of file is reached
+        """
+        self.__free.acquire()
+        with self.__slabs_lock:
+            slab = (
+                self.__slabs.pop() if self.__slabs else self.__allocate(self.block_size)
+            )
+        try:
+            start = time.perf_counter()
+            read = file.readinto(memoryview(slab)[: size or self.block_size])
+            self.read_time += time.perf_counter() - start
+            self.read_bytes += read or 0
+        except BaseException:
+            self.__recycle(slab)
+            raise
+        if not read:
+            self.__recycle(slab)
+            return None
+        return self.__share(
+            Block(self, memoryview(slab)[:read], consumers, slab), consumers
+        )
+
+    def release(self, block: Block):
+        block.data = None
+        if block.slab is not None:
+            slab, block.slab = block.slab, None
+            self.__recycle(slab)
+        else:
+            self.__free.release()
+
+    def __share(self, block: Block, consumers: int) -> Block:
+        if not consumers:
+            # Nobody will release the block, give back the slot straight away
+            self.release(block)
+        return block
+
+    def __recycle(self, slab: bytearray):
+        with self.__slabs_lock:
+            if len(slab) == self.block_size:
+                self.__slabs.append(slab)
+        self.__free.release()
+
+
+class Backlog:
+    """
+    Bytes a worker holds in its own buffers, ahead of what it has written.
+    The submitting thread waits once the limit is reached, until the worker catches up.
+    """
+
+    def __init__(self, limit: int):
+        """
+        :param limit: bytes held at most, a single larger block is still accepted when nothing is held
+        """
+        self.limit = limit
+        self.size = 0
+        self.__free = Condition()
+
+    def hold(self, data, size: int = None) -> "HeldBlock":
+        """
+        Wait for room in the backlog, then hold data until the worker released it once written
+        :param data: data to hold, copied if not immutable (eg. a view of a slab of the ring)
+        :param size: bytes accounted for, by default the size of data
+        """
+        size = len(data) if size is None else size
+        with self.__free:
+            self.__free.wait_for(
+                lambda: not self.size or self.size + size <= self.limit
+            )
+            self.size += size
+        if not isinstance(data, (bytes, list)):
+            data = bytes(data)
+        return HeldBlock(self, data, size)
+
+    def release(self, size: int):
+        with self.__free:
+            self.size -= size
+            self.__free.notify_all()
+
+
+class HeldBlock:
+    """
+    Copy of the data of a block, owned by a single worker: the shared block is released straight away
+    and its slot reused for the next read while the worker is still behind.
+    """
+
+    def __init__(self, backlog: Backlog, data, size: int):
+        self.backlog = backlog
+        self.data = data
+        self.size = size
+
+    def release(self):
+        if self.data is not None:
+            self.data = None
+            self.backlog.release(self.size)
+
+
+def write_all(file_handler, data):
+    # Unbuffered files might not write the whole buffer at once
+    data = memoryview(data)
+    while data:
+        written = file_handler.write(data)
+        data = data[written:]
+
+
+def copy_range(src_fd: int, dst_fd: int, length: int, offset: int) -> int:
+    """
+    Copy a range of the source file at the current position of the destination file, in the kernel.
+    The data does not go through user space, filesystems supporting it share the extents (reflink).
+    :return: bytes copied, less than length if the source is shorter
+    """
+    copied = 0
+    while copied < length:
+        chunk = os.copy_file_range(src_fd, dst_fd, length - copied, offset + copied)
+        if not chunk:
+            break
+        copied += chunk
+    return copied
 
-class CopyBuffer(Thread):
-    def __init__(self, buffer, file_handler):
-        super().__init__()
-        self.buffer = buffer
-        self.file_handler = file_handler
+
+class BufferWorker(Thread):
+    """
+    Long-lived worker processing the jobs submitted to its queue until stopped.
+    Errors are kept and raised in the submitting thread on the next check() or wait().
+    """
+
+    # Once a job failed, the following ones are skipped until the error is raised
+    skip_after_error = True
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.queue = Queue()
+        self.error = None
+        self.__pending = 0
+        self.__idle = Condition()
+
+    def submit(self, job, *args, block: Block = None):
+        with self.__idle:
+            self.__pending += 1
+        self.queue.put((job, args, block))
+
+    def check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Wait until all the jobs submitted until now have been processed
+        :param timeout: seconds to wait for, None to wait until done
+        :return: True if the worker is idle, False if the timeout expired
+        """
+        with self.__idle:
+            idle = self.__idle.wait_for(lambda: not self.__pending, timeout)
+        self.check()
+        return idle
+
+    @property
+    def busy(self) -> bool:
+        return bool(self.__pending)
+
+    def stop(self):
+        self.queue.put(None)
 
     def run(self):
-        # print("Thread {} - Starting copy to {}".format(current_thread(), self.file_handler.name))
-        self.file_handler.write(self.buffer)
-        # print("Thread {} - Finished copy to {}".format(current_thread(), self.file_handler.name))
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, args, block = item
+            try:
+                if self.error is None or not self.skip_after_error:
+                    job(*args)
+            except Exception as error:
+                if self.error is None:
+                    self.error = error
+            finally:
+                if block is not None:
+                    block.release()
+                with self.__idle:
+                    self.__pending -= 1
+                    self.__idle.notify_all()
 
 
-class HashBuffer(Thread):
-    def __init__(self, hash_buffer, data_buffer):
+class CopyWorker(BufferWorker):
+    """
+    Writes the files of a single destination, in the order they are submitted.
+    Counters are only updated by the worker and reflect what has been written to the destination.
+    """
+
+    def __init__(
+        self,
+        destination: str,
+        journal=None,
+        durability: str = "none",
+        backlog: int = 0,
+    ):
+        """
+        :param destination: destination folder
+        :param journal: CopyJournal recording the files once closed (once flushed if batched)
+        :param durability: when the files are flushed to the media, see DURABILITY_POLICIES
+        :param backlog: bytes the destination can fall behind the others by, copied into its own buffers.
+            0 to write the shared blocks, every destination then holds the ring until it is done with a block
+        """
         super().__init__()
-        self.hash_buffer = hash_buffer
-        self.data_buffer = data_buffer
+        self.destination = destination
+        self.backlog = Backlog(backlog) if backlog else None
+        self.journal = journal
+        self.durability = durability if durability in DURABILITY_POLICIES else "none"
+        # Destination not available anymore, following jobs are ignored
+        self.lost = False
+        self.file_handler = None
+        # Source file descriptor of the current file, when the destination is written by the kernel
+        self.src_fd = None
+        # Cleared if the kernel cannot copy to this destination, blocks are written from memory instead
+        self.kernel_copy = hasattr(os, "copy_file_range")
+        self.current_file = ""
+        self.written_bytes = 0
+        self.written_files = 0
+        self.skipped_bytes = (
+            0  # Part of written_bytes already on the destination (resumed copy)
+        )
+        self.write_time = 0.0  # Time spent writing, the destination throughput
+        self.flush_time = 0.0  # Time spent flushing the files to the media
+        # [(fd, record), ...] files closed, waiting for the batch flush
+        self.__unsynced = []
+        self.__unsynced_bytes = 0
+        self.__writeback_offset = (
+            0  # Position of the current file when its write-back last started
+        )
+        self.__preallocated = 0  # Size preallocated for the current file
+
+    @property
+    def copied_bytes(self) -> int:
+        # Bytes actually written to the destination by this copy
+        return self.written_bytes - self.skipped_bytes
+
+    @property
+    def throughput(self) -> float | None:
+        """
+        :return: bytes/s written to the destination, flushes included, None until something was written
+        """
+        seconds = self.write_time + self.flush_time
+        if not seconds:
+            return None
+        return self.copied_bytes / seconds
+
+    def open_file(self, dst_file_path: str, src_fd: int = None, size: int = 0):
+        """
+        :param dst_file_path: file to write
+        :param src_fd: descriptor of the source file, owned (and closed) by the worker.
+            If given, the blocks are copied from the source file by the kernel instead of written from memory
+        :param size: size of the source file, preallocated on the destination before writing
+        """
+        self.submit(self.__open, dst_file_path, src_fd, size)
+
+    def write_block(self, block: Block, offset: int = None):
+        """
+        :param block: Block read from the source
+        :param offset: position of the block in the source file, needed to copy it in the kernel
+        """
+        block = self.__own(block)
+        self.submit(self.__write_block, block.data, offset, block=block)
+
+    def write_files(self, block: Block):
+        """
+        Write a batch of whole files in a single job
+        :param block: Block whose data is [(dst_file_path, src_file_path, data, record), ...],
+            dst_file_path relative to the destination
+        """
+        if self.backlog is not None:
+            # The data of the files is not in the slabs of the ring, only accounted for in the backlog
+            size = sum(len(data) for _, _, data, _ in block.data)
+            held = self.backlog.hold(block.data, size)
+            block.release()
+            block = held
+        self.submit(self.__write_files, block.data, block=block)
+
+    def close_file(self, src_file_path: str, record: dict = None):
+        self.submit(self.__close, src_file_path, record)
+
+    def skip_file(self, size: int):
+        # File already on the destination (resumed copy), only accounted for
+        self.submit(self.__skip, size)
+
+    def flush(self):
+        # Flush the files waiting for the batch flush, to be submitted once all the files are closed
+        self.submit(self.__sync_batch)
+
+    def __own(self, block: Block):
+        # Copies the block into the backlog of the destination, releasing the shared block
+        if self.backlog is None:
+            return block
+        held = self.backlog.hold(block.data)
+        block.release()
+        return held
 
     def run(self):
-        self.hash_buffer.update(self.data_buffer)
+        super().run()
+        # Stopped before the batch flush (eg. copy interrupted), the files are not recorded in the journal
+        for fd, _ in self.__unsynced:
+            os.close(fd)
+        self.__unsynced = []
+        # Stopped while writing a file (eg. copy interrupted, error), drop what was preallocated past the data
+        self.__close_src()
+        if self.file_handler is not None:
+            file_handler, self.file_handler = self.file_handler, None
+            try:
+                self.__truncate(file_handler)
+                file_handler.close()
+            except OSError:
+                pass
+
+    def __open(self, dst_file_path, src_fd=None, size=0):
+        if src_fd is not None and not self.kernel_copy:
+            os.close(src_fd)
+            src_fd = None
+        self.src_fd = src_fd
+        if self.lost:
+            self.__close_src()
+            return
+        try:
+            self.file_handler = open(dst_file_path, "wb", buffering=0)
+            self.current_file = path.basename(dst_file_path)
+            self.__writeback_offset = 0
+            self.__preallocated = 0
+            if size and preallocate(self.file_handler.fileno(), size):
+                self.__preallocated = size
+        except FileNotFoundError:
+            # Target not available anymore
+            print(
+                "{} is not available anymore! Deleting from destination list!".format(
+                    self.destination
+                )
+            )
+            self.lost = True
+            self.__close_src()
+        except OSError as error:
+            if error.errno != errno.ENOSPC:
+                raise
+            # Fail before writing anything, instead of once the destination is full
+            raise OSError(
+                errno.ENOSPC,
+                f"Not enough space left on {self.destination} to copy {self.current_file} ({size} bytes)",
+                dst_file_path,
+            ) from error
+
+    def __truncate(self, file_handler):
+        # Preallocated files written short (source shrunk, copy interrupted) keep only what was written
+        if self.__preallocated:
+            written = file_handler.tell()
+            if written < self.__preallocated:
+                file_handler.truncate(written)
+            self.__preallocated = 0
+
+    def __write_block(self, data, offset):
+        if self.file_handler is None:
+            return
+        if self.src_fd is None or offset is None:
+            self.__write(data)
+            return
+        start = self.file_handler.tell()
+        start_time = time.perf_counter()
+        try:
+            copied = copy_range(
+                self.src_fd, self.file_handler.fileno(), len(data), offset
+            )
+        except OSError as error:
+            if error.errno not in KERNEL_COPY_UNSUPPORTED:
+                raise
+            copied = self.file_handler.tell() - start
+            print(
+                f"Kernel copy not supported by {self.destination}, writing from memory instead."
+            )
+            self.kernel_copy = False
+            self.__close_src()
+        self.write_time += time.perf_counter() - start_time
+        self.written_bytes += copied
+        if copied < len(data):
+            # Whatever the kernel could not copy is written from the block
+            self.__write(data[copied:])
+        else:
+            self.__writeback()
+
+    def __close_src(self):
+        if self.src_fd is not None:
+            src_fd, self.src_fd = self.src_fd, None
+            os.close(src_fd)
+
+    def __write(self, data):
+        if self.file_handler is None:
+            return
+        start_time = time.perf_counter()
+        write_all(self.file_handler, data)
+        self.write_time += time.perf_counter() - start_time
+        self.written_bytes += len(data)
+        self.__writeback()
+
+    def __writeback(self):
+        if self.durability != "incremental":
+            return
+        written = self.file_handler.tell()
+        if written - self.__writeback_offset < SYNC_INTERVAL:
+            return
+        start_time = time.perf_counter()
+        if hasattr(os, "posix_fadvise"):
+            # Starts the write-back of the dirty pages without waiting for it (like sync_file_range),
+            # the pages already written back are dropped from the cache
+            os.posix_fadvise(
+                self.file_handler.fileno(), 0, written, os.POSIX_FADV_DONTNEED
+            )
+        else:
+            fdatasync(self.file_handler.fileno())
+        self.flush_time += time.perf_counter() - start_time
+        self.__writeback_offset = written
+
+    def __sync(self, fd: int):
+        start_time = time.perf_counter()
+        fdatasync(fd)
+        self.flush_time += time.perf_counter() - start_time
+
+    def __sync_batch(self):
+        unsynced, self.__unsynced = self.__unsynced, []
+        self.__unsynced_bytes = 0
+        try:
+            for fd, record in unsynced:
+                self.__sync(fd)
+                if self.journal is not None and record is not None:
+                    self.journal.append(record)
+        finally:
+            for fd, _ in unsynced:
+                os.close(fd)
+
+    def __write_files(self, files):
+        for dst_file_path, src_file_path, data, record in files:
+            self.__open(path.join(self.destination, dst_file_path))
+            self.__write(data)
+            self.__close(src_file_path, record)
+
+    def __close(self, src_file_path, record):
+        self.__close_src()
+        if self.file_handler is None:
+            return
+        file_handler, self.file_handler = self.file_handler, None
+        batched = self.durability == "batch"
+        try:
+            self.__truncate(file_handler)
+            if self.durability in ("file", "incremental"):
+                self.__sync(file_handler.fileno())
+            elif batched:
+                # Kept open until the batch flush
+                self.__unsynced.append((os.dup(file_handler.fileno()), record))
+                self.__unsynced_bytes += file_handler.tell()
+            file_handler.close()
+            try:
+                shutil.copystat(src_file_path, file_handler.name)
+            except OSError:
+                # shutil failed to copy file metadata. Not a critical error, log and continue.
+                print(
+                    f"Warning - Unable to copy file attributes to destination file ({file_handler.name}), not all metadata might reflect the source."
+                )
+        except (FileNotFoundError, OSError):
+            print("Lost destination")
+            raise
+        self.written_files += 1
+        if batched:
+            # Recorded in the journal once flushed
+            if (
+                self.__unsynced_bytes >= SYNC_INTERVAL
+                or len(self.__unsynced) >= SYNC_BATCH_FILES
+            ):
+                self.__sync_batch()
+            return
+        if self.journal is not None and record is not None:
+            self.journal.append(record)
+
+    def __skip(self, size):
+        if self.lost:
+            return
+        self.written_bytes += size
+        self.skipped_bytes += size
+        self.written_files += 1
@@ -0,0 +1,248 @@
+# Hash verification of the copied files on a pool of processes.
+# Hashing is CPU bound and threads are limited by the GIL (hash objects only release it for large updates),
+# as such each file is hashed in its own process, several files and destinations being verified at once.
+# Files with chunk digests (see chunks.py) get their chunk digests computed from the same read as their hashes.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Manager
+from queue import Empty
+
+from .algorithms import new_hash
+from .chunks import ChunkDigests
+from .direct import ALIGNMENT, aligned_buffer, open_verify
+from .hashing import MultiHasher
+from .utils import BlockRing
+
+# Multi-digest engine of the current worker process, kept for the lifetime of the process
+_hasher = None
+
+
+def _process_hasher(lanes: int) -> MultiHasher:
+    global _hasher
+    if _hasher is None or len(_hasher.workers) < lanes:
+        if _hasher is not None:
+            _hasher.stop()
+        _hasher = MultiHasher(lanes)
+        _hasher.start()
+    return _hasher
+
+
+def hash_file(
+    filepath: str,
+    hashes: list,
+    buffer_size: int,
+    progress=None,
+    key=None,
+    uncached: bool = False,
+    chunks: list = None,
+) -> dict | tuple:
+    """
+    Hash a file, to be run in a worker process.
+    Files larger than a block are hashed by one thread per algorithm, all the algorithms
+    of a large file being computed in parallel, in lockstep (see MultiHasher).
+    :param filepath: file to hash
+    :param hashes: hash algorithms
+    :param buffer_size: size of the blocks read
+    :param progress: queue receiving (key, hashed_bytes) after each block
+    :param key: key identifying the file in progress updates
+    :param uncached: read the data from the media, bypassing the page cache (see direct.py)
+    :param chunks: [Chunk, ...] recorded for the file, their digests are computed along with the hashes
+    :return: {hash_algo: hex_digest, ...}
+        (file_hashes, chunk_digests) if chunks are given, chunk_digests None if the file does not have
+        the size of the source
+    """
+    # The pool already hashes several files at once on all the cores
+    file_hashes = {
+        hash_algo: new_hash(hash_algo, parallel=False) for hash_algo in hashes
+    }
+    hash_buffers = list(file_hashes.values())
+    chunk_digests = None
+    if chunks:
+        chunk_digests = ChunkDigests(chunks[0].algorithm, chunks[0].length)
+        hash_buffers.append(chunk_digests)
+    with open_verify(filepath, uncached) as file:
+        size = os.fstat(file.fileno()).st_size
+        # Small files are hashed inline, the thread handoff would cost more than the hashing
+        inline = size <= buffer_size
+        hasher = None if inline else _process_hasher(len(hash_buffers))
+        # Slabs no larger than the file, allocating (and zeroing) full blocks would cost more than hashing small files
+        block_size = max(1, min(size, buffer_size))
+        if uncached:
+            block_size = -(-block_size // ALIGNMENT) * ALIGNMENT
+        ring = BlockRing(
+            1 if inline else 2,
+            block_size,
+            aligned_buffer if uncached else bytearray,
+        )
+        while (
+            block := ring.read(file, 1 if inline else len(hash_buffers))
+        ) is not None:
+            hashed_bytes = len(block.data)
+            if inline:
+                for hash_buffer in hash_buffers:
+                    hash_buffer.update(block.data)
+                block.release()
+            else:
+                hasher.update(hash_buffers, block)
+            if progress is not None:
+                progress.put((key, hashed_bytes))
+        if hasher is not None:
+            hasher.wait()
+
+    file_hashes = {
+        hash_algo: hash_buffer.hexdigest()
+        for hash_algo, hash_buffer in file_hashes.items()
+    }
+    if chunks is None:
+        return file_hashes
+    if chunk_digests is None or size != chunks[0].file_size:
+        return file_hashes, None
+    return file_hashes, chunk_digests.hexdigests()
+
+
+class HashVerifier:
+    """
+    Pool of processes hashing files, with progress reported per block through a shared queue.
+    """
+
+    def __init__(
+        self,
+        hashes: list,
+        buffer_size: int,
+        processes: int = None,
+        uncached: bool = False,
+    ):
+        """
+        :param hashes: hash algorithms
+        :param buffer_size: size of the blocks read, in each process
+        :param processes: number of processes hashing the files
+        :param uncached: read the data from the media, bypassing the page cache (see direct.py)
+        """
+        self.hashes = hashes
+        self.buffer_size = buffer_size
+        self.processes = processes or os.cpu_count() or 1
+        self.uncached = uncached
+        self.__manager = None
+        self.__executor = None
+        self.__progress = None
+
+    def __enter__(self):
+        self.__manager = Manager()
+        self.__progress = self.__manager.Queue()
+        self.__executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=exc_type is None)
+
+    def shutdown(self, wait: bool = True):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=wait, cancel_futures=True)
+        if self.__manager is not None:
+            self.__manager.shutdown()
+
+    def submit(self, key, filepath: str, chunks: list = None, progress: bool = True):
+        """
+        :param key: returned with the progress of the file
+        :param filepath: file to hash
+        :param chunks: [Chunk, ...] recorded for the file, their digests are computed along with the hashes
+        :param progress: report the progress of the file (see progress)
+        :return: Future, result is {hash_algo: hex_digest, ...}, (file_hashes, chunk_digests) if chunks are given
+            (see hash_file)
+        """
+        return self.__executor.submit(
+            hash_file,
+            filepath,
+            self.hashes,
+            self.buffer_size,
+            self.__progress if progress else None,
+            key,
+            self.uncached,
+            chunks,
+        )
+
+    def progress(self):
+        """
+        :return: (key, hashed_bytes) updates received since the last call
+        """
+        while True:
+            try:
+                yield self.__progress.get_nowait()
+            except Empty:
+                return
+
+
+class VerificationScheduler:
+    """
+    Reads back all the destinations at once, each destination in its own lane.
+    A lane only gets its share of the processes, so that a slow drive cannot hold back the others
+    and every destination is verified at its own speed; the share of a finished lane goes to the others.
+    """
+
+    def __init__(self, verifier: HashVerifier, lanes: dict):
+        """
+        :param verifier: HashVerifier hashing the files
+        :param lanes: {dst: iterable of (file, filepath, chunks), ...}, file identifies the file in the results,
+               chunks are the [Chunk, ...] recorded for the file, None if it has none (see HashVerifier.submit)
+        """
+        self.verifier = verifier
+        self.__tasks = {dst: iter(tasks) for dst, tasks in lanes.items()}
+        self.__in_flight = {dst: 0 for dst in lanes}
+        self.__pending = {}  # {future: (dst, file), ...}
+        self.__finished = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self.__tasks or self.__pending)
+
+    def __refill(self):
+        lanes = [dst for dst in self.__in_flight if dst in self.__tasks]
+        if not lanes:
+            return
+        # One more file than processes in each lane, so its processes never wait for the scheduler
+        depth = max(1, self.verifier.processes // len(lanes)) + 1
+        for dst in lanes:
+            while self.__in_flight[dst] < depth:
+                task = next(self.__tasks[dst], None)
+                if task is None:
+                    # Lane exhausted, its processes go to the other lanes on the next refill
+                    del self.__tasks[dst]
+                    self.__finish(dst)
+                    break
+                file, filepath, chunks = task
+                future = self.verifier.submit((dst, file), filepath, chunks)
+                self.__pending[future] = (dst, file)
+                self.__in_flight[dst] += 1
+
+    def poll(self, timeout: float = 0.25):
+        """
+        Wait for the next results, keeping each lane filled
+        :param timeout: seconds to wait for at least one file to be hashed
+        :return: progress, results, finished
+            progress: [(dst, file, hashed_bytes), ...] bytes hashed since the last poll
+            results: [(dst, file, result), ...] files hashed since the last poll, see HashVerifier.submit
+            finished: [dst, ...] destinations entirely verified since the last poll
+        """
+        self.__refill()
+        done, _ = wait(self.__pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        progress = [
+            (dst, file, hashed_bytes)
+            for (dst, file), hashed_bytes in self.verifier.progress()
+        ]
+
+        results = []
+        for future in done:
+            dst, file = self.__pending.pop(future)
+            results.append((dst, file, future.result()))
+            self.__in_flight[dst] -= 1
+            self.__finish(dst)
+
+        finished, self.__finished = self.__finished, []
+        return progress, results, finished
+
+    def __finish(self, dst):
+        if dst not in self.__tasks and not self.__in_flight[dst]:
+            del self.__in_flight[dst]
+            self.__finished.append(dst)
@@ -1 +1 @@
-from .export_thread import ExportThread
+from .export import ExportEngine
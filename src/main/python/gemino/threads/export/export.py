@@ -0,0 +1,140 @@
+from ..common.engine import Engine
+from ..common.utils import ProgressData
+from ..copy.utils import BlockRing, BufferWorker, write_all
+from ..copy.tuning import BlockSizeController, DEFAULT_MEMORY_CEILING
+
+
+class ExportEngine(Engine):
+    def __init__(
+        self,
+        src,
+        destinations: list,
+        total_files: int,
+        total_bytes: int,
+        memory_ceiling: int = DEFAULT_MEMORY_CEILING,
+        progress=None,
+    ):
+        """
+
+        :param src: Source file object, should be bufferedIO like,
+               already open in RB mode
+        :param destinations: destination files, should be bufferedIO like,
+               already open in WB mode (Should be list of 1 item)
+        :param hashes: empty list
+        :param total_files: Kept for compatibility with ProgressWindow
+        :param total_bytes: Kept for compatibility with ProgressWindow
+        :param metadata: Kept for compatibility with ProgressWindow
+        :param aff4: Kept for compatibility with ProgressWindow
+        :param aff4_filename: Kept for compatibility with ProgressWindow
+        :param memory_ceiling: bytes the blocks in flight can use at most
+        :param progress: progress(ProgressData) callback
+        """
+        super().__init__(progress)
+        # Only store parameters needed for file export
+        self.src_file = src
+        self.destinations = destinations
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.memory_ceiling = memory_ceiling
+
+    def run(self):
+        try:
+            self.export_file()
+        except Exception as error:
+            raise
+            self.emit(ProgressData(-1, error))
+
+    def export_file(self):
+        print("Exporting selected file...")
+
+        # Size of the blocks read and number of blocks in flight between the source reader and the writers,
+        # tuned while exporting within the memory ceiling
+        controller = BlockSizeController(self.memory_ceiling, max_depth=4)
+
+        filecount = 0
+        copied_size = 0
+
+        # Send initial window update
+        self.emit(
+            ProgressData(
+                7,
+                {
+                    dst.name: {
+                        "status": "exporting",
+                        "processed_bytes": copied_size,
+                        "processed_files": filecount,
+                        "current_file": str(self.src_file.urn),
+                    }
+                    for dst in self.destinations
+                },
+            )
+        )
+
+        # Long-lived writers, one per destination
+        ring = BlockRing(controller.depth)
+        writers = {dst: BufferWorker() for dst in self.destinations}
+        for writer in writers.values():
+            writer.start()
+
+        try:
+            # AFF4 streams do not support readinto, blocks are wrapped as returned by the stream (no copy)
+            data = self.src_file.read(controller.block_size)
+            while data:
+
+                # Forbid thread termination while handing the block to the workers
+                # If not done, the ring slot might never be given back and the workers would stall
+                self.setTerminationEnabled(False)
+
+                block = ring.block(data, len(writers))
+                for dst, writer in writers.items():
+                    writer.submit(write_all, dst, block.data, block=block)
+
+                self.setTerminationEnabled(True)
+
+                if controller.update(len(data)):
+                    ring.resize(controller.depth, controller.block_size)
+
+                copied_size += len(data)
+
+                data = self.src_file.read(controller.block_size)
+
+                self.emit(
+                    ProgressData(
+                        7,
+                        {
+                            dst.name: {
+                                "processed_bytes": copied_size,
+                                "processed_files": filecount,
+                                "status": "exporting",
+                                "current_file": str(self.src_file.urn),
+                            }
+                            for dst in self.destinations
+                        },
+                    )
+                )
+
+            for writer in writers.values():
+                writer.wait()
+        finally:
+            for writer in writers.values():
+                writer.stop()
+
+        filecount = 1
+
+        # End of copy reached
+        self.emit(
+            ProgressData(
+                7,
+                {
+                    dst.name: {
+                        "processed_bytes": copied_size,
+                        "processed_files": filecount,
+                        "status": "done",
+                        "current_file": str(self.src_file.urn),
+                    }
+                    for dst in self.destinations
+                },
+            )
+        )
+        print("Done!")
+        self.emit(ProgressData(8, {}))
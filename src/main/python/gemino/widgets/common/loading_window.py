@@ -11,7 +11,8 @@ class LoadingWindow(QtWidgets.QDialog):
     and will call "return_function" when the progress status received is 0
     passing the progress payload as kwargs to the function.
 
-    All the while, if status is 1, it will update the interface as needed.
+    All the while, if status is 1, it will update the interface as needed,
+    if status is 2 (partial results), it will call "partial_function" with the payload as kwargs.
     """
 
     def __init__(
@@ -20,11 +21,13 @@ class LoadingWindow(QtWidgets.QDialog):
         total_items: int,
         call_thread: TaskThread,
         return_function,
+        partial_function=None,
     ):
         super().__init__(parent=parent)
 
         self.setWindowTitle("Parsing")
         self.__return_function = return_function
+        self.__partial_function = partial_function
 
         self.__current_item = None
         self.__processed_items = 0
@@ -72,17 +75,24 @@ class LoadingWindow(QtWidgets.QDialog):
 
     def update_progress(self, progress: ProgressData):
         """
-        :param progress: : (status, payload) - status is -1, 0, 1
+        :param progress: : (status, payload) - status is -1, 0, 1, 2
                 payload: {arg1: data1, arg2: data2, ...}
         :return:
         """
 
-        if progress.status == 1:
+        if progress.status == 1 and "message" in progress.payload:
+            # New step, without progress
+            self.__status_label.setText(progress.payload["message"])
+            self.__progress_bar.setMaximum(0)
+        elif progress.status == 1:
             self.__progress_bar.setMaximum(100)
             # Processing
             self.__current_item = progress.payload.get("current_item", "N/A")
             self.__processed_items = progress.payload.get("processed_items", 0)
             self.__update_ui()
+        elif progress.status == 2:
+            if self.__partial_function is not None:
+                self.__partial_function(**progress.payload)
         elif progress.status == 0:
             # Completed with success
             self.__return_function(**progress.payload)
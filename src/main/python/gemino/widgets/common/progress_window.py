@@ -6,9 +6,12 @@ import traceback
 
 from .volume_progress import VolumeProgress
 from .error_box import error_box
-from ...threads.copy.logical.copy import CopyThread, VerifyThread
-from ...threads.export import ExportThread
+from ...threads.copy.logical.copy import CopyEngine, VerifyEngine
+from ...threads.export import ExportEngine
+from ...threads.common.threads import EngineThread
 from ...threads.common.utils import ProgressData
+from ...threads.common.manifest import SourceManifest
+from ...threads.copy.tuning import DEFAULT_MEMORY_CEILING
 
 
 class ProgressWindow(QtWidgets.QDialog):
@@ -36,6 +39,8 @@ class ProgressWindow(QtWidgets.QDialog):
         "end_export": "File exported successfully",
         "cancel_export": "File export aborted",
     }
+    # {dst: bytes/s, ...} write throughput of the destinations, once the copy finished
+    throughputs_measured = QtCore.Signal(object)
 
     def __init__(
         self,
@@ -51,6 +56,16 @@ class ProgressWindow(QtWidgets.QDialog):
         aff4_verify: bool = False,
         file_export: bool = False,
         csv_log: bool = False,
+        async_multicast: bool = False,
+        resume: bool = False,
+        source_manifest: SourceManifest = None,
+        kernel_copy: bool = False,
+        memory_ceiling: int = DEFAULT_MEMORY_CEILING,
+        chunk_manifest: bool = False,
+        repair: bool = False,
+        uncached_verify: bool = False,
+        durability: str = "none",
+        file_compression: str = "stored",
     ):
         super().__init__(parent=parent)
 
@@ -129,12 +144,13 @@ class ProgressWindow(QtWidgets.QDialog):
             )
 
         self.processed_files = 0
+        self.write_throughputs = {}
         self.status = ProgressWindow.STATUSES[0]
         self.update_ui()
 
         # Start copying files
         if not aff4_verify and not file_export:
-            self.thread = CopyThread(
+            engine = CopyEngine(
                 src,
                 dst,
                 hash_algos,
@@ -144,21 +160,24 @@ class ProgressWindow(QtWidgets.QDialog):
                 aff4,
                 aff4_filename,
                 csv_log,
-            )
-            self.thread.copy_progress.connect(
-                self.update_progress, QtCore.Qt.QueuedConnection
+                async_multicast,
+                resume,
+                source_manifest,
+                kernel_copy,
+                memory_ceiling,
+                chunk_manifest,
+                repair,
+                uncached_verify,
+                durability,
+                file_compression,
             )
         elif aff4_verify:
-            self.thread = VerifyThread(src, total_files, total_bytes)
-            self.thread.verify_progress.connect(
-                self.update_progress, QtCore.Qt.QueuedConnection
-            )
+            engine = VerifyEngine(src, total_files, total_bytes)
         else:
             # File export set
-            self.thread = ExportThread(src, dst, total_files, total_bytes)
-            self.thread.copy_progress.connect(
-                self.update_progress, QtCore.Qt.QueuedConnection
-            )
+            engine = ExportEngine(src, dst, total_files, total_bytes, memory_ceiling)
+        self.thread = EngineThread(engine)
+        self.thread.progress.connect(self.update_progress, QtCore.Qt.QueuedConnection)
 
     def start_tasks(self):
         self.thread.start()
@@ -194,6 +213,10 @@ class ProgressWindow(QtWidgets.QDialog):
                     volume_progress.processed_files = progress_status["processed_files"]
                     volume_progress.current_file = progress_status["current_file"]
                     volume_progress.status = progress_status["status"]
+                    if progress_status.get("write_throughput"):
+                        self.write_throughputs[volume_progress.volume] = (
+                            progress_status["write_throughput"]
+                        )
                     volume_progress.container_hashes = progress_status.get(
                         "container_hashes", []
                     )
@@ -212,6 +235,8 @@ class ProgressWindow(QtWidgets.QDialog):
             if self.file_export:
                 for destination in self.dst:
                     destination.close()
+            if status == 2 and self.write_throughputs:
+                self.throughputs_measured.emit(dict(self.write_throughputs))
 
         self.update_ui()
 
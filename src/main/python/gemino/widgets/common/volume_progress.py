@@ -9,6 +9,7 @@ from .log_dialog import LogDialog
 class VolumeProgress(QtWidgets.QWidget):
     __STATUSES = {
         "copy": "Copying Files",
+        "copied": "Copy Done, Waiting for Other Destinations",
         "idle": "Preparing",
         "hashing": "Verifying Hash",
         "done": "Done",
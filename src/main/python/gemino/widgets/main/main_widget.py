@@ -4,13 +4,34 @@ from PySide6 import QtWidgets, QtCore, QtGui
 import os
 import os.path as path
 
-from ...threads.common import SizeCalcThread
+from ...threads.common.size_calc import SizeCalcThread
+from ...threads.copy.algorithms import algorithms
+from ...threads.copy.capacity import CapacityPlan
+from ...threads.copy.logical.compression import AFF4_COMPRESSIONS
+from ...threads.copy.direct import UNCACHED_READS
+from ...threads.copy.utils import DURABILITY_POLICIES
+from ...threads.copy.tuning import DEFAULT_MEMORY_CEILING, MiB
 from ..common import ProgressWindow, LoadingDialog, error_box
 from ..common.utils import is_portable
 
 # Typing assignment for easier code navigation
 ProgressTuple = tuple[int, dict[str, dict]]
 
+# Labels of the durability policies of the copied files
+DURABILITY_LABELS = {
+    "none": "When the System Decides",
+    "file": "After Each File",
+    "batch": "In Batches of Files",
+    "incremental": "While Writing (Limits Write-Back Stalls)",
+}
+
+# Labels of the compressions of the files of the AFF4 containers
+AFF4_COMPRESSION_LABELS = {
+    "stored": "None - Store All Files (Most Compatible)",
+    "deflate": "Deflate the Files That Compress",
+    "lz4": "LZ4 the Large Files That Compress (Deflate Small Ones)",
+}
+
 
 class MainWidget(QtWidgets.QWidget):
     def __init__(self, parent: QtWidgets.QWidget = None):
@@ -30,12 +51,22 @@ class MainWidget(QtWidgets.QWidget):
         self.managed_csv_log = (
             None  # If set forces creation of a csv log with additional metadata
         )
+        self.managed_async_multicast = None  # destinations/async_multicast -> If set forces decoupled destination writes
+        self.managed_kernel_copy = None  # destinations/kernel_copy -> If set forces kernel copies for extra destinations
+        self.memory_ceiling = DEFAULT_MEMORY_CEILING  # copy/memory_ceiling -> MB the copy buffers can use at most
+        self.managed_chunk_manifest = (
+            None  # copy/chunk_manifest -> If set forces the recording of chunk hashes
+        )
+        self.managed_repair = None  # copy/repair -> If set forces the repair of corrupt chunks from the source
+        self.managed_uncached_verify = None  # copy/uncached_verify -> If set forces verification reads bypassing the page cache
+        self.managed_durability = None  # copy/durability -> If set forces when copied files are flushed (none, file, batch, incremental)
         self.managed_destinations_aff4 = (
             None  # destinations/aff4     -> If true forces the creation of AFF4 images
         )
         self.managed_destinations_drives = (
             None  # destinations/drives   -> If false disables the drives box
         )
+        self.managed_aff4_compression = None  # destinations/aff4_file_compression -> If set forces the compression of the files of AFF4 containers (stored, deflate, lz4)
         if os.path.exists("config.ini"):
             self.managed_settings = QtCore.QSettings(
                 "config.ini", QtCore.QSettings.IniFormat
@@ -58,7 +89,7 @@ class MainWidget(QtWidgets.QWidget):
                 if (
                     managed_algorithms is not None
                 ):  # if wrong value supplied keep none and do not force set empty list.
-                    allowed_algorithms = ["md5", "sha1", "sha256"]
+                    allowed_algorithms = [algorithm.name for algorithm in algorithms()]
                     self.managed_algorithms = []
                     for algorithm in managed_algorithms:
                         if algorithm in allowed_algorithms:
@@ -66,6 +97,50 @@ class MainWidget(QtWidgets.QWidget):
             self.managed_csv_log = self.managed_settings.value("logging/csv", None)
             if self.managed_csv_log is not None:
                 self.managed_csv_log = self.managed_csv_log.lower() == "true"
+            self.managed_async_multicast = self.managed_settings.value(
+                "destinations/async_multicast", None
+            )
+            if self.managed_async_multicast is not None:
+                self.managed_async_multicast = (
+                    self.managed_async_multicast.lower() == "true"
+                )
+            self.managed_kernel_copy = self.managed_settings.value(
+                "destinations/kernel_copy", None
+            )
+            if self.managed_kernel_copy is not None:
+                self.managed_kernel_copy = self.managed_kernel_copy.lower() == "true"
+            memory_ceiling = self.managed_settings.value("copy/memory_ceiling", None)
+            if memory_ceiling is not None:
+                try:
+                    self.memory_ceiling = max(2, int(memory_ceiling)) * MiB
+                except ValueError:
+                    # Wrong value supplied, keep the default
+                    pass
+            self.managed_chunk_manifest = self.managed_settings.value(
+                "copy/chunk_manifest", None
+            )
+            if self.managed_chunk_manifest is not None:
+                self.managed_chunk_manifest = (
+                    self.managed_chunk_manifest.lower() == "true"
+                )
+            self.managed_repair = self.managed_settings.value("copy/repair", None)
+            if self.managed_repair is not None:
+                self.managed_repair = self.managed_repair.lower() == "true"
+            self.managed_uncached_verify = self.managed_settings.value(
+                "copy/uncached_verify", None
+            )
+            if self.managed_uncached_verify is not None:
+                self.managed_uncached_verify = (
+                    self.managed_uncached_verify.lower() == "true"
+                )
+            self.managed_durability = self.managed_settings.value(
+                "copy/durability", None
+            )
+            if self.managed_durability is not None:
+                self.managed_durability = self.managed_durability.lower()
+                if self.managed_durability not in DURABILITY_POLICIES:
+                    # Wrong value supplied, keep it configurable
+                    self.managed_durability = None
             self.managed_destinations_aff4 = self.managed_settings.value(
                 "destinations/aff4", None
             )
@@ -73,6 +148,14 @@ class MainWidget(QtWidgets.QWidget):
                 self.managed_destinations_aff4 = (
                     self.managed_destinations_aff4.lower() == "true"
                 )
+            self.managed_aff4_compression = self.managed_settings.value(
+                "destinations/aff4_file_compression", None
+            )
+            if self.managed_aff4_compression is not None:
+                self.managed_aff4_compression = self.managed_aff4_compression.lower()
+                if self.managed_aff4_compression not in AFF4_COMPRESSIONS:
+                    # Wrong value supplied, keep it configurable
+                    self.managed_aff4_compression = None
             self.managed_destinations_drives = self.managed_settings.value(
                 "destinations/drives", None
             )
@@ -155,6 +238,56 @@ class MainWidget(QtWidgets.QWidget):
         if self.managed_csv_log is not None:
             self.csv_log.setChecked(self.managed_csv_log)
             self.csv_log.setDisabled(True)
+        self.async_multicast = QtWidgets.QCheckBox(
+            "Let Faster Destinations Run Ahead of Slower Ones", self
+        )
+        if self.managed_async_multicast is not None:
+            self.async_multicast.setChecked(self.managed_async_multicast)
+            self.async_multicast.setDisabled(True)
+        self.kernel_copy = QtWidgets.QCheckBox(
+            "Copy Extra Destinations Without Going Through Memory (Linux)", self
+        )
+        if not hasattr(os, "copy_file_range"):
+            # Only available on Linux
+            self.kernel_copy.setDisabled(True)
+        elif self.managed_kernel_copy is not None:
+            self.kernel_copy.setChecked(self.managed_kernel_copy)
+            self.kernel_copy.setDisabled(True)
+        self.resume = QtWidgets.QCheckBox(
+            "Resume Interrupted Copy (Skip Files Already Copied)", self
+        )
+        self.chunk_manifest = QtWidgets.QCheckBox(
+            "Record Chunk Hashes of Large Files (Locate Corrupt Byte Ranges)", self
+        )
+        self.repair = QtWidgets.QCheckBox(
+            "Repair Corrupt Byte Ranges From the Source", self
+        )
+        self.chunk_manifest.stateChanged.connect(self.toggle_repair)
+        if self.managed_chunk_manifest is not None:
+            self.chunk_manifest.setChecked(self.managed_chunk_manifest)
+            self.chunk_manifest.setDisabled(True)
+        if self.managed_repair is not None:
+            self.repair.setChecked(self.managed_repair)
+        self.toggle_repair()
+        self.uncached_verify = QtWidgets.QCheckBox(
+            "Verify From the Media (Bypass the Page Cache)", self
+        )
+        if not UNCACHED_READS:
+            # Not available on Windows
+            self.uncached_verify.setDisabled(True)
+        elif self.managed_uncached_verify is not None:
+            self.uncached_verify.setChecked(self.managed_uncached_verify)
+            self.uncached_verify.setDisabled(True)
+        self.durability_label = QtWidgets.QLabel("Flush Copied Files to the Media:")
+        self.durability = QtWidgets.QComboBox(self)
+        for policy in DURABILITY_POLICIES:
+            self.durability.addItem(DURABILITY_LABELS[policy], policy)
+        if self.managed_durability is not None:
+            self.durability.setCurrentIndex(
+                DURABILITY_POLICIES.index(self.managed_durability)
+            )
+            self.durability_label.setDisabled(True)
+            self.durability.setDisabled(True)
         # AFF4 Support
         self.aff4_checkbox = QtWidgets.QCheckBox("Write to AFF4 Container", self)
         self.aff4_checkbox.stateChanged.connect(self.toggle_aff4_filename)
@@ -162,6 +295,19 @@ class MainWidget(QtWidgets.QWidget):
             "AFF4 Container Filename (w/o extension):"
         )
         self.aff4_filename = QtWidgets.QLineEdit()
+        self.aff4_compression_label = QtWidgets.QLabel("AFF4 File Compression:")
+        self.aff4_compression = QtWidgets.QComboBox(self)
+        for compression in AFF4_COMPRESSIONS:
+            self.aff4_compression.addItem(
+                AFF4_COMPRESSION_LABELS[compression], compression
+            )
+        self.aff4_compression.setToolTip(
+            "Each file is compressed or stored, from a sample of its start: files that do not compress (pictures, videos, archives...) are stored."
+        )
+        if self.managed_aff4_compression is not None:
+            self.aff4_compression.setCurrentIndex(
+                AFF4_COMPRESSIONS.index(self.managed_aff4_compression)
+            )
         self.toggle_aff4_filename()
         if self.managed_destinations_aff4 is not None:
             self.aff4_checkbox.setChecked(self.managed_destinations_aff4)
@@ -212,13 +358,22 @@ class MainWidget(QtWidgets.QWidget):
         self.left_layout.addWidget(self.notes_text_field)
         self.hash_layout = QtWidgets.QHBoxLayout()
         self.hash_layout.addWidget(self.hash_label)
-        self.hash_layout.addWidget(self.md5_checkbox)
-        self.hash_layout.addWidget(self.sha1_checkbox)
-        self.hash_layout.addWidget(self.sha256_checkbox)
+        for checkbox in self.hash_checkboxes.values():
+            self.hash_layout.addWidget(checkbox)
         self.left_layout.addLayout(self.hash_layout)
         # CSV Log
         self.csv_log_layout = QtWidgets.QVBoxLayout()
         self.csv_log_layout.addWidget(self.csv_log)
+        self.csv_log_layout.addWidget(self.async_multicast)
+        self.csv_log_layout.addWidget(self.kernel_copy)
+        self.csv_log_layout.addWidget(self.resume)
+        self.csv_log_layout.addWidget(self.chunk_manifest)
+        self.csv_log_layout.addWidget(self.repair)
+        self.csv_log_layout.addWidget(self.uncached_verify)
+        self.durability_layout = QtWidgets.QHBoxLayout()
+        self.durability_layout.addWidget(self.durability_label)
+        self.durability_layout.addWidget(self.durability)
+        self.csv_log_layout.addLayout(self.durability_layout)
         self.left_layout.addLayout(self.csv_log_layout)
         # AFF4
         self.aff4_layout = QtWidgets.QVBoxLayout()
@@ -229,6 +384,10 @@ class MainWidget(QtWidgets.QWidget):
         self.aff4_filename_layout.addWidget(self.aff4_filename)
         self.aff4_layout.addLayout(self.aff4_checkbox_layout)
         self.aff4_layout.addLayout(self.aff4_filename_layout)
+        self.aff4_compression_layout = QtWidgets.QHBoxLayout()
+        self.aff4_compression_layout.addWidget(self.aff4_compression_label)
+        self.aff4_compression_layout.addWidget(self.aff4_compression)
+        self.aff4_layout.addLayout(self.aff4_compression_layout)
         self.left_layout.addLayout(self.aff4_layout)
         # Right Side
         self.right_layout.addWidget(self.destinations_label)
@@ -249,6 +408,10 @@ class MainWidget(QtWidgets.QWidget):
 
         # Init data and fill widgets
         self.dir_size = 0
+        self.source_manifest = None
+        self.capacity_planner = None
+        # {volume: bytes/s, ...} measured by the copies of this session
+        self.write_throughputs = {}
         self.dst_folder = None
         self.get_volumes()
         self.populate_volumes_widget()
@@ -266,14 +429,16 @@ class MainWidget(QtWidgets.QWidget):
         self.volumes_list.setItemAlignment(QtCore.Qt.AlignCenter)
 
         for volume in self.volumes:
-            if not volume.isReadOnly() and volume.bytesFree() > self.dir_size:
+            plan = self.capacity_plan(volume)
+            if not volume.isReadOnly() and plan.fits:
                 item = QtWidgets.QListWidgetItem(
-                    "{} - {} - {} - {} - {:.2f} GB Free".format(
+                    "{} - {} - {} - {} - {:.2f} GB Free - {}".format(
                         volume.rootPath(),
                         volume.name(),
                         volume.device().data().decode(),
                         volume.fileSystemType().data().decode(),
-                        volume.bytesFree() / 10**9,
+                        plan.free / 10**9,
+                        plan.describe(),
                     )
                 )
                 item.setData(256, volume)
@@ -282,13 +447,14 @@ class MainWidget(QtWidgets.QWidget):
                 errors = []
                 if volume.isReadOnly():
                     errors.append("ReadOnly")
-                if volume.bytesFree() < self.dir_size:
+                if not plan.fits:
                     errors.append("Insufficient Space")
                 item = QtWidgets.QListWidgetItem(
-                    "{} - {} - {:.2f} GB Free - ! {} !".format(
+                    "{} - {} - {:.2f} GB Free - {} - ! {} !".format(
                         volume.name(),
                         volume.fileSystemType().data().decode(),
-                        volume.bytesFree() / 10**9,
+                        plan.free / 10**9,
+                        plan.describe(),
                         ", ".join(errors),
                     )
                 )
@@ -319,28 +485,23 @@ class MainWidget(QtWidgets.QWidget):
             for hash_algo in self.hashing_algos.buttons()
             if hash_algo.isChecked()
         ]
-        dst_volumes = [
-            item.data(256).rootPath()
-            for item in self.volumes_list.selectedItems()
-            if not item.data(256).isReadOnly()
-            and item.data(256).bytesFree() > self.dir_size
-        ]
+        # Space checked against the footprint of the copy with the options selected
+        dst_volumes = []
+        for item in self.volumes_list.selectedItems():
+            volume = item.data(256)
+            volume.refresh()
+            if not volume.isReadOnly() and self.capacity_plan(volume).fits:
+                dst_volumes.append(volume.rootPath())
         if self.dst_folder:
             dst_folder_storage_info = QtCore.QStorageInfo(self.dst_folder)
             dst_folder_writable = os.access(self.dst_folder, os.W_OK)
             if (
                 dst_folder_storage_info.isReady()
                 and dst_folder_writable
-                and dst_folder_storage_info.bytesFree() > self.dir_size
+                and self.capacity_plan(dst_folder_storage_info, self.dst_folder).fits
             ):
                 dst_volumes.append(self.dst_folder)
 
-        if self.aff4_checkbox.isChecked() and len(dst_volumes) > 1:
-            # error_box("Writing to Multiple Destinations When Using AFF4 Creates Container Files With Different Hashes.\n\n"
-            #          "You will have to verify the content of the AFF4 containers when comparing containers and not the container itself.\n")
-            error_box(self, "Only One Destination Supported When Using AFF4 Containers")
-            return
-
         if self.aff4_checkbox.isChecked():
             error_box(
                 self,
@@ -364,11 +525,25 @@ class MainWidget(QtWidgets.QWidget):
                 self.aff4_checkbox.isChecked(),
                 self.aff_filename,
                 csv_log=self.csv_log.isChecked(),
+                async_multicast=self.async_multicast.isChecked(),
+                resume=self.resume.isChecked() and not self.aff4_checkbox.isChecked(),
+                source_manifest=self.source_manifest,
+                kernel_copy=self.kernel_copy.isChecked()
+                and not self.aff4_checkbox.isChecked(),
+                memory_ceiling=self.memory_ceiling,
+                chunk_manifest=self.chunk_manifest.isChecked()
+                and not self.aff4_checkbox.isChecked(),
+                repair=self.repair.isChecked(),
+                uncached_verify=self.uncached_verify.isChecked()
+                and not self.aff4_checkbox.isChecked(),
+                durability=self.durability.currentData(),
+                file_compression=self.aff4_compression.currentData(),
             )
             self.progress.setWindowFlags(
                 QtCore.Qt.CustomizeWindowHint | QtCore.Qt.Dialog
             )
             self.progress.setWindowModality(QtCore.Qt.ApplicationModal)
+            self.progress.throughputs_measured.connect(self.record_throughputs)
             self.progress.open()
             self.progress.start_tasks()
         else:
@@ -383,6 +558,9 @@ class MainWidget(QtWidgets.QWidget):
             base_path = self.src_base_path
             for i in range(len(volumes)):
                 dst_path = os.path.join(volumes[i], base_path)
+                if self.resume.isChecked():
+                    # Folder content is expected, files already copied are skipped
+                    continue
                 if os.path.exists(dst_path) and os.listdir(dst_path):
                     # Folder not empty alert user
                     print(f"{dst_path} not empty!")
@@ -441,55 +619,67 @@ class MainWidget(QtWidgets.QWidget):
         return aff4_filename
 
     def init_hashing_widgets(self):
-        # Hash Related Widgets
-        hash_algos = {
-            "md5": None,
-            "sha1": None,
-            "sha256": None,
-        }
+        # Hash Related Widgets, one checkbox per algorithm available
+        hash_algos = {algorithm.name: None for algorithm in algorithms()}
         if self.managed_algorithms is not None:
             for hash_algo in hash_algos:
                 hash_algos[hash_algo] = hash_algo in self.managed_algorithms
         elif not is_portable():
-            for hash_algo in hash_algos:
-                stored_setting = self.settings.value(hash_algo)
+            for algorithm in algorithms():
+                stored_setting = self.settings.value(algorithm.name)
+                # Forensic algorithms are selected unless disabled, fast ones only if enabled
+                default = algorithm.forensic
                 if isinstance(stored_setting, str):
                     # Windows returns a string
-                    hash_algos[hash_algo] = (
+                    hash_algos[algorithm.name] = (
                         (stored_setting == "true")
                         if stored_setting is not None
-                        else True
+                        else default
                     )
                 else:
                     # macOS, returns a Boolean
-                    hash_algos[hash_algo] = (
-                        bool(stored_setting) if stored_setting is not None else True
+                    hash_algos[algorithm.name] = (
+                        bool(stored_setting) if stored_setting is not None else default
                     )
         else:
             # By default use only MD5
-            hash_algos = {"md5": True, "sha1": False, "sha256": False}
+            hash_algos = {hash_algo: hash_algo == "md5" for hash_algo in hash_algos}
 
         self.hash_label = QtWidgets.QLabel("Hashing Algorithms: ")
-        self.md5_checkbox = QtWidgets.QCheckBox("md5", self)
-        self.md5_checkbox.setChecked(hash_algos["md5"])
-        self.sha1_checkbox = QtWidgets.QCheckBox("sha1", self)
-        self.sha1_checkbox.setChecked(hash_algos["sha1"])
-        self.sha256_checkbox = QtWidgets.QCheckBox("sha256", self)
-        self.sha256_checkbox.setChecked(hash_algos["sha256"])
+        self.hash_checkboxes = {}
         self.hashing_algos = QtWidgets.QButtonGroup(self)
         self.hashing_algos.setExclusive(False)
-        self.hashing_algos.addButton(self.md5_checkbox)
-        self.hashing_algos.addButton(self.sha1_checkbox)
-        self.hashing_algos.addButton(self.sha256_checkbox)
+        for algorithm in algorithms():
+            checkbox = QtWidgets.QCheckBox(algorithm.name, self)
+            checkbox.setChecked(hash_algos[algorithm.name])
+            if not algorithm.forensic:
+                checkbox.setToolTip(
+                    "Fast integrity hash, to verify large copies. "
+                    "Combine with a forensic hash if the report has to be checked by third parties."
+                )
+            self.hash_checkboxes[algorithm.name] = checkbox
+            self.hashing_algos.addButton(checkbox)
         if self.managed_algorithms is not None:
             self.hash_label.setDisabled(True)
-            self.md5_checkbox.setDisabled(True)
-            self.sha1_checkbox.setDisabled(True)
-            self.sha256_checkbox.setDisabled(True)
+            for checkbox in self.hash_checkboxes.values():
+                checkbox.setDisabled(True)
+
+    def toggle_repair(self):
+        # Corrupt ranges are only known with chunk hashes
+        self.repair.setDisabled(
+            self.managed_repair is not None or not self.chunk_manifest.isChecked()
+        )
 
     def toggle_aff4_filename(self):
         self.aff4_filename_label.setDisabled(not self.aff4_checkbox.isChecked())
         self.aff4_filename.setDisabled(not self.aff4_checkbox.isChecked())
+        self.aff4_compression_label.setDisabled(not self.aff4_checkbox.isChecked())
+        self.aff4_compression.setDisabled(
+            self.managed_aff4_compression is not None
+            or not self.aff4_checkbox.isChecked()
+        )
+        # Containers cannot be resumed
+        self.resume.setDisabled(self.aff4_checkbox.isChecked())
 
     def open_files(self):
         directory = ""
@@ -554,7 +744,9 @@ class MainWidget(QtWidgets.QWidget):
 
     def size_calc_handle(self, data):
         # Unpack Result
-        self.dir_size, self.files_count = data
+        self.dir_size, self.files_count, self.source_manifest, self.capacity_planner = (
+            data
+        )
 
         self.size_label.setText("{:.2f} GB".format(self.dir_size / 10**9))
         self.files_count_label.setText("{} Files".format(self.files_count))
@@ -567,9 +759,9 @@ class MainWidget(QtWidgets.QWidget):
         if self.dst_folder:
             # Only execute if a destination folder has been selected
             dst_storage_info = QtCore.QStorageInfo(self.dst_folder)
-            dst_bytes_available = dst_storage_info.bytesAvailable()
+            plan = self.capacity_plan(dst_storage_info, self.dst_folder)
             dst_folder_writable = os.access(self.dst_folder, os.W_OK)
-            if dst_bytes_available > self.dir_size:
+            if plan.fits:
                 # Enough space available on destination
                 self.dst_dir_information_label.setText(
                     "Enough space available on destination"
@@ -579,30 +771,102 @@ class MainWidget(QtWidgets.QWidget):
                     "NOT Enough space available on destination"
                 )
 
-            if dst_folder_writable and dst_storage_info.bytesFree() > self.dir_size:
+            if dst_folder_writable and plan.fits:
                 self.dst_dir_information_label.setText(
-                    "On volume: {} - {} - {:.2f} GB Free".format(
+                    "On volume: {} - {} - {:.2f} GB Free - {}".format(
                         dst_storage_info.name(),
                         dst_storage_info.fileSystemType().data().decode(),
-                        dst_storage_info.bytesFree() / 10**9,
+                        plan.free / 10**9,
+                        plan.describe(),
                     )
                 )
             else:
                 errors = []
                 if not dst_folder_writable:
                     errors.append("ReadOnly")
-                if dst_storage_info.bytesFree() < self.dir_size:
+                if not plan.fits:
                     errors.append("Insufficient Space")
                 self.dst_dir_information_label.setText(
-                    "On volume: {} - {} - {:.2f} GB Free - ! {} !".format(
+                    "On volume: {} - {} - {:.2f} GB Free - {} - ! {} !".format(
                         dst_storage_info.name(),
                         dst_storage_info.fileSystemType().data().decode(),
-                        dst_storage_info.bytesFree() / 10**9,
+                        plan.free / 10**9,
+                        plan.describe(),
                         ", ".join(errors),
                     )
                 )
                 # self.dst_dir_information_label.setTextColor(QtGui.QColor(255, 0, 0))
 
+    def capacity_plan(
+        self, storage_info: QtCore.QStorageInfo, destination: str = None
+    ) -> CapacityPlan:
+        """
+        Space the copy of the source takes on a volume, with the options currently selected
+        :param storage_info: volume of the destination
+        :param destination: destination folder, the root of the volume if not set
+        """
+        destination = destination or storage_info.rootPath()
+        # Space usable by the copy, without what is reserved for the system
+        free = storage_info.bytesAvailable()
+        throughput = self.volume_throughput(storage_info)
+        if self.capacity_planner is None:
+            # Source not scanned yet
+            return CapacityPlan(
+                destination, self.dir_size, free, storage_info.blockSize(), throughput
+            )
+        aff4 = self.aff4_checkbox.isChecked()
+        return self.capacity_planner.plan(
+            destination,
+            free,
+            storage_info.blockSize(),
+            storage_info.fileSystemType().data().decode(),
+            throughput,
+            hashes=[
+                hash_algo.text()
+                for hash_algo in self.hashing_algos.buttons()
+                if hash_algo.isChecked()
+            ],
+            aff4=aff4,
+            csv_log=self.csv_log.isChecked(),
+            chunk_manifest=self.chunk_manifest.isChecked() and not aff4,
+        )
+
+    @staticmethod
+    def volume_key(storage_info: QtCore.QStorageInfo) -> str:
+        # Volumes are remembered by label (device if unnamed), device paths change from one plug to the next
+        key = storage_info.name() or storage_info.device().data().decode()
+        return key.replace("/", "_").replace("\\", "_")
+
+    def volume_throughput(self, storage_info: QtCore.QStorageInfo) -> float | None:
+        """
+        :return: write throughput measured on the volume by the last copy to it, bytes/s, None if unknown
+        """
+        key = self.volume_key(storage_info)
+        if key in self.write_throughputs:
+            return self.write_throughputs[key]
+        if not is_portable():
+            try:
+                return (
+                    float(self.settings.value(f"throughput/{key}", None) or 0) or None
+                )
+            except (TypeError, ValueError):
+                return None
+        return None
+
+    def record_throughputs(self, throughputs: dict):
+        """
+        :param throughputs: {dst: bytes/s, ...} measured by the copy that just finished
+        """
+        for dst, throughput in throughputs.items():
+            key = self.volume_key(QtCore.QStorageInfo(dst))
+            self.write_throughputs[key] = throughput
+            if not is_portable():
+                self.settings.setValue(f"throughput/{key}", throughput)
+        if not is_portable():
+            self.settings.sync()
+        self.refresh_button_handler()
+        self.dst_folder_check()
+
     @property
     def metadata(self):
         return {
@@ -6,7 +6,8 @@ from .main_widget import MainWidget
 from ..common.loading_window import LoadingWindow
 from ..viewer import AdvancedWidget
 from ..common import ProgressWindow, error_box
-from ...threads.aff4 import GetSummaryThread, OpenContainerThread
+from ...threads.aff4.get_summary import GetSummaryThread
+from ...threads.aff4.open_container import OpenContainerThread
 from ...threads.aff4.utils import number_of_items
 
 
@@ -94,7 +95,9 @@ class MainWindow(QtWidgets.QMainWindow):
                     total_items=item_count,
                     call_thread=OpenContainerThread(src_container_path),
                     return_function=self.advanced_widget.populate,
+                    partial_function=self.advanced_widget.add_items,
                 )
+                self.advanced_widget.reset()
                 self.loading.setWindowFlags(
                     QtCore.Qt.CustomizeWindowHint | QtCore.Qt.Dialog
                 )
@@ -20,7 +20,9 @@ from pyaff4.container import (
 from pyaff4 import lexicon, rdfvalue
 
 from ..common import ProgressWindow
+from ..common.loading_window import LoadingWindow
 from ...threads.aff4.common import AFF4Item
+from ...threads.aff4.open_container import OpenVolumeThread
 from .hex_dump_widget import HexDumpWidget
 
 
@@ -37,8 +39,12 @@ class AdvancedWidget(QtWidgets.QWidget):
     ):
         super().__init__(parent=parent)
 
+        # Loaded with pyaff4 once an item or the container metadata is opened, the tree comes from the metadata stream
         self.volume = None
-        self.aff4_items = None
+        self.container_path = None
+        self.loading: LoadingWindow = None
+        # Tree items of the container, by path
+        self.item_dict: dict[Path, QtWidgets.QTreeWidgetItem] = {}
 
         # Instantiate Widgets
         ## Top
@@ -132,19 +138,13 @@ class AdvancedWidget(QtWidgets.QWidget):
         )
         self.tree_view.itemSelectionChanged.connect(self.view_details)
 
-    def populate(
-        self,
-        aff4_volume: Union[
-            PhysicalImageContainer,
-            WritableHashBasedImageContainer,
-            LogicalImageContainer,
-            PreStdLogicalImageContainer,
-            EncryptedImageContainer,
-        ],
-        aff4_items: dict[str, AFF4Item],
-        src_container_path: str,
-    ):
-        self.volume = aff4_volume
+    def reset(self):
+        """
+        Clears the tree and the viewers before the items of a container are added
+        """
+        self.volume = None
+        self.container_path = None
+        self.item_dict = {}
 
         # We need to disconnect before clearing the tree,
         # else the selection changes and view_details is called on an empty tree
@@ -157,16 +157,34 @@ class AdvancedWidget(QtWidgets.QWidget):
         self.pdf_view.setDocument(None)
         self.metadata_box.clear()
 
-        self.container_label.setText(src_container_path)
-        self.container_details_button.setEnabled(True)
+        self.container_label.clear()
+        self.container_details_button.setDisabled(True)
+        # Items are sorted once the container is loaded, not at each insertion
+        self.tree_view.setSortingEnabled(False)
 
-        # Populate tree
+    def add_items(self, aff4_items: list[AFF4Item]):
+        """
+        Adds a batch of items to the tree, in the order they are read from the container
+        """
         items = []
-        item_dict: dict[Path, QtWidgets.QTreeWidgetItem] = {}
-
-        # This relies on the dictionary being already sorted by key (path)
-        for path, item in aff4_items.items():
-            current_item_path = Path(str(path).lstrip("/"))
+        item_dict: dict[Path, QtWidgets.QTreeWidgetItem] = self.item_dict
+
+        for item in aff4_items:
+            current_item_path = Path(str(item.path).lstrip("/"))
+            columns = [
+                item.path.split("/")[-1],
+                item.modify,
+                item.create,
+                str(item.size),
+                str(item.folder),
+                str(item.urn),
+            ]
+            existing_item = item_dict.get(current_item_path)
+            if existing_item is not None:
+                # Folder created for its content before being read itself
+                for column, text in enumerate(columns):
+                    existing_item.setText(column, text)
+                continue
             if current_item_path.parent == Path(""):
                 # Top Level Node
                 parent = None
@@ -174,26 +192,28 @@ class AdvancedWidget(QtWidgets.QWidget):
                 try:
                     parent = item_dict[current_item_path.parent]
                 except KeyError:
-                    # Parent does not exist (eg. in AFF4-L reference images), create all needed tree items
+                    # Parent does not exist (yet, or at all in AFF4-L reference images), create all needed tree items
                     self.create_missing_tree_folders(
                         current_item_path.parent, items, item_dict
                     )
                     parent = item_dict[current_item_path.parent]
-            qtree_item = QtWidgets.QTreeWidgetItem(
-                parent,
-                [
-                    item.path.split("/")[-1],
-                    item.modify,
-                    item.create,
-                    str(item.size),
-                    str(item.folder),
-                    str(item.urn),
-                ],
-            )
+            qtree_item = QtWidgets.QTreeWidgetItem(parent, columns)
             item_dict[current_item_path] = qtree_item
             items.append(qtree_item)
 
-        self.tree_view.insertTopLevelItems(0, items)
+        self.tree_view.addTopLevelItems(
+            [qtree_item for qtree_item in items if qtree_item.parent() is None]
+        )
+
+    def populate(self, src_container_path: str):
+        """
+        Called once all the items of the container are in the tree
+        """
+        self.container_path = src_container_path
+
+        self.container_label.setText(src_container_path)
+        self.container_details_button.setEnabled(True)
+        self.tree_view.setSortingEnabled(True)
 
     @staticmethod
     def create_missing_tree_folders(
@@ -257,7 +277,47 @@ class AdvancedWidget(QtWidgets.QWidget):
                 self.progress.open()
                 self.progress.start_tasks()
 
+    def with_volume(self, action):
+        """
+        Run action once the container is loaded with pyaff4, loading it first if needed
+        """
+        if self.volume is not None:
+            action()
+            return
+        if self.container_path is None:
+            return
+
+        def loaded(
+            aff4_volume: Union[
+                PhysicalImageContainer,
+                WritableHashBasedImageContainer,
+                LogicalImageContainer,
+                PreStdLogicalImageContainer,
+                EncryptedImageContainer,
+            ],
+        ):
+            self.volume = aff4_volume
+            action()
+
+        self.loading = LoadingWindow(
+            parent=self,
+            total_items=0,
+            call_thread=OpenVolumeThread(self.container_path),
+            return_function=loaded,
+        )
+        self.loading.setWindowFlags(QtCore.Qt.CustomizeWindowHint | QtCore.Qt.Dialog)
+        self.loading.setModal(True)
+        self.loading.setWindowModality(QtCore.Qt.ApplicationModal)
+        self.loading.open()
+        self.loading.start_tasks()
+
     def view_details(self):
+        if self.tree_view.selectedItems():
+            self.with_volume(self.load_details)
+
+    def load_details(self):
+        if not self.tree_view.selectedItems():
+            return
         urn = self.tree_view.selectedItems()[0].data(5, 0)
         folder = self.tree_view.selectedItems()[0].data(4, 0) == "True"
 
@@ -330,6 +390,9 @@ class AdvancedWidget(QtWidgets.QWidget):
             self.hex_viewer.load_next_chunk()
 
     def show_case_metadata(self):
+        self.with_volume(self.load_case_metadata)
+
+    def load_case_metadata(self):
         case_name = self.volume.resolver.Get(
             self.volume.urn,
             self.volume.urn,
@@ -1,4 +1,5 @@
 from PySide6.QtWidgets import QApplication
+import multiprocessing
 import traceback
 
 import sys
@@ -8,6 +9,8 @@ from gemino.widgets.common import error_box
 from gemino.vars import VERSION
 
 if __name__ == "__main__":
+    # Hash verification runs in worker processes, needed for the frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     exit_code = -1
     app = QApplication(sys.argv)
     try:
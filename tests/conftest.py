@@ -0,0 +1,10 @@
+import os.path as path
+import sys
+
+# gemino is not installed, its sources are run from the fbs layout
+sys.path.insert(
+    0,
+    path.join(
+        path.dirname(path.dirname(path.abspath(__file__))), "src", "main", "python"
+    ),
+)
@@ -0,0 +1,52 @@
+from gemino.threads.common.manifest import SourceManifest
+from gemino.threads.copy.capacity import (
+    DEFAULT_CLUSTER_SIZE,
+    FILE_RECORD_SIZE,
+    CapacityPlanner,
+)
+
+
+def planner(tmp_path, sizes: dict) -> CapacityPlanner:
+    src = tmp_path / "evidence"
+    for name, size in sizes.items():
+        (src / name).parent.mkdir(parents=True, exist_ok=True)
+        (src / name).write_bytes(b"x" * size)
+    return CapacityPlanner(SourceManifest.scan(str(src)))
+
+
+def test_files_and_directories_take_whole_clusters(tmp_path):
+    capacity = planner(
+        tmp_path, {"empty": 0, "one": 1, "full": 4096, "over": 4097, "sub/one": 1}
+    )
+
+    # Empty files take no cluster, the others are rounded up, each directory takes one
+    assert capacity.data_footprint(4096) == (0 + 1 + 1 + 2 + 1) * 4096 + 2 * 4096
+    assert capacity.data_footprint(32768) == (0 + 1 + 1 + 1 + 1) * 32768 + 2 * 32768
+
+
+def test_long_names_take_more_directory_clusters(tmp_path):
+    # 2 + 20 * (2 + 40 / 13 rounded up) directory entries of 32 bytes: 3904 bytes, 8 clusters of 512
+    capacity = planner(tmp_path, {f"{index:040d}": 0 for index in range(20)})
+
+    assert capacity.data_footprint(512) == 8 * 512
+    assert capacity.data_footprint(4096) == 4096
+
+
+def test_footprint_of_the_filesystem_and_container(tmp_path):
+    capacity = planner(tmp_path, {"one": 1, "sub/two": 2})
+    reports = capacity.reports_size(["md5"])
+
+    # Unknown cluster size
+    assert (
+        capacity.footprint(0, hashes=["md5"])
+        == capacity.data_footprint(DEFAULT_CLUSTER_SIZE) + reports
+    )
+    # NTFS records of 2 files and 2 directories
+    assert (
+        capacity.footprint(4096, "NTFS", ["md5"])
+        == capacity.data_footprint(4096) + reports + 4 * FILE_RECORD_SIZE
+    )
+    # A single container rounded up to a cluster, without journal
+    assert capacity.footprint(65536, hashes=["md5"], aff4=True) == 65536 + (
+        capacity.reports_size(["md5"], journal=False)
+    )
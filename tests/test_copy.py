@@ -0,0 +1,157 @@
+import os
+import os.path as path
+import shutil
+
+import pytest
+
+from gemino.threads.copy.chunks import CHUNK_SIZE
+from gemino.threads.copy.journal import CopyJournal, journal_record
+from gemino.threads.copy.logical.copy import CopyEngine
+
+MiB = 1024 * 1024
+
+
+@pytest.fixture
+def source(tmp_path):
+    # Small files (copied in batches) around large ones (copied block by block)
+    src = tmp_path / "evidence"
+    sizes = {
+        "a_small": 10_000,
+        "b_large": 3 * MiB,
+        "c_small": 20_000,
+        "d_small": 0,
+        "e_large": 2 * MiB,
+        "f_small": 30_000,
+    }
+    for folder in (src, src / "sub"):
+        folder.mkdir()
+        for name, size in sizes.items():
+            (folder / name).write_bytes(os.urandom(size))
+    return src
+
+
+def copy(src, dst, before_verification=None, **options):
+    """
+    :param before_verification: called once the files are copied, before they are verified
+    :param options: options of CopyEngine
+    """
+    engine = CopyEngine(
+        str(src),
+        [str(dst)],
+        ["md5"],
+        0,
+        0,
+        {"operator": "", "intake": "", "notes": ""},
+        False,
+        "",
+        True,
+        **options,
+    )
+    if before_verification is not None:
+        verify_folder = engine.verify_folder
+
+        def corrupted_verify_folder(*args, **kwargs):
+            before_verification()
+            verify_folder(*args, **kwargs)
+
+        engine.verify_folder = corrupted_verify_folder
+    engine.run()
+    return dst / src.name
+
+
+def reported(dst, base_path):
+    with open(dst / f"{base_path}.md5", encoding="utf-8") as hash_file:
+        hashes = hash_file.read()
+    with open(dst / f"{base_path}_file_report.csv", encoding="utf-8") as csv_file:
+        paths = [line.split(",")[0] for line in csv_file]
+    return hashes, paths
+
+
+def test_resumed_copy_reports_files_in_copy_order(source, tmp_path):
+    clean, resumed = tmp_path / "clean", tmp_path / "resumed"
+    clean.mkdir()
+    resumed.mkdir()
+    copy(source, clean)
+    hashes = dict(
+        reversed(line.split(" ", 1))
+        for line in reported(clean, source.name)[0].splitlines()
+    )
+
+    # Interrupted copy having written only the large files, small files still pending
+    journal = CopyJournal(str(resumed), source.name)
+    journal.open(resume=False)
+    for filepath in ("b_large", "e_large", path.join("sub", "b_large")):
+        src_file_path = source / filepath
+        dst_file_path = resumed / source.name / filepath
+        dst_file_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(src_file_path, dst_file_path)
+        journal.append(
+            journal_record(filepath, os.stat(src_file_path), {"md5": hashes[filepath]})
+        )
+    journal.close()
+
+    copy(source, resumed, resume=True)
+
+    assert reported(resumed, source.name) == reported(clean, source.name)
+    report = (resumed / f"{source.name}_copy_report.txt").read_text(encoding="utf-8")
+    assert "Verification successful for 12 files" in report
+
+
+@pytest.mark.parametrize("resume", [False, True])
+@pytest.mark.parametrize("repair", [False, True])
+def test_corrupt_chunks_are_located_and_repaired(tmp_path, repair, resume):
+    src, dst = tmp_path / "evidence", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    data = os.urandom(CHUNK_SIZE + MiB)
+    (src / "large").write_bytes(data)
+    (src / "small").write_bytes(os.urandom(1000))
+
+    def corrupt():
+        # A byte of the second chunk altered on the destination
+        with open(dst / src.name / "large", "r+b") as copied:
+            copied.seek(CHUNK_SIZE + 10)
+            copied.write(bytes([data[CHUNK_SIZE + 10] ^ 0xFF]))
+
+    if resume:
+        # Failed copy resumed, the chunks recorded before the interruption are kept
+        copy(src, dst, corrupt, chunk_manifest=True)
+        copy(src, dst, chunk_manifest=True, repair=repair, resume=True)
+    else:
+        copy(src, dst, corrupt, chunk_manifest=True, repair=repair)
+
+    report = (dst / f"{src.name}_copy_report.txt").read_text(encoding="utf-8")
+    corrupt_range = f"bytes {CHUNK_SIZE}-{CHUNK_SIZE + MiB - 1}"
+    if repair:
+        assert f"Repaired from the source: large ({corrupt_range})" in report
+        assert "Verification successful for 2 files" in report
+        assert (dst / src.name / "large").read_bytes() == data
+        assert not (dst / f"{src.name}_chunk_manifest.jsonl").exists()
+    else:
+        assert f"Verification failed for file: large ({corrupt_range} differ)" in report
+        assert "Verification successful for 1 files" in report
+        # Kept to locate the corrupt ranges again
+        assert (dst / f"{src.name}_chunk_manifest.jsonl").exists()
+
+
+def test_repaired_files_are_verified_with_their_hashes(tmp_path):
+    src, dst = tmp_path / "evidence", tmp_path / "dst"
+    src.mkdir()
+    dst.mkdir()
+    data = os.urandom(CHUNK_SIZE + MiB)
+    (src / "large").write_bytes(data)
+
+    def corrupt():
+        with open(dst / src.name / "large", "r+b") as copied:
+            copied.seek(10)
+            copied.write(bytes([data[10] ^ 0xFF]))
+        # Source hash the chunk digests cannot vouch for
+        index = dst / f"{src.name}_file_index.csv"
+        index.write_text(f"large,{'0' * 32}\n", encoding="utf-8")
+
+    copy(src, dst, corrupt, chunk_manifest=True, repair=True)
+
+    report = (dst / f"{src.name}_copy_report.txt").read_text(encoding="utf-8")
+    assert f"Repaired from the source: large (bytes 0-{CHUNK_SIZE - 1})" in report
+    assert "Verification failed for file: large\n" in report
+    assert (dst / f"{src.name}_chunk_manifest.jsonl").exists()
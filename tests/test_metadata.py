@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta, timezone
+
+import rdflib
+from rdflib.compare import isomorphic
+
+from pyaff4 import data_store, escaping, lexicon, logical, rdfvalue
+from pyaff4 import hashes as aff4_hashes
+
+from gemino.threads.copy.logical.metadata import ColumnarDataStore
+
+VOLUME = rdfvalue.URN("aff4://685b4b6c-2d3a-4b3f-9c41-0a3b5e7d9f10")
+CET = timezone(timedelta(hours=1))
+TIME = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=CET)
+
+
+def images():
+    """
+    :return: [(pathname, fsmeta, hashes), ...], hashes None for folders
+    """
+    return [
+        (
+            "/evidence",
+            logical.LinuxFSMetadata(
+                None, "evidence", 0, TIME, TIME, TIME, TIME - timedelta(days=1)
+            ),
+            None,
+        ),
+        (
+            '/evidence/dir "quoted" \\ back\tslash',
+            # No birth time
+            logical.ClassicUnixMetadata(None, "dir", 4096, TIME, TIME, TIME),
+            None,
+        ),
+        (
+            "/evidence/résumé #1.txt",
+            logical.LinuxFSMetadata(
+                None,
+                "résumé #1.txt",
+                42,
+                TIME,
+                # Not in the time zone of the others
+                datetime(2024, 6, 1, tzinfo=timezone.utc),
+                TIME,
+                TIME,
+            ),
+            {
+                lexicon.HASH_MD5: "d41d8cd98f00b204e9800998ecf8427e",
+                lexicon.HASH_SHA1: "da39a3ee5e6b4b0d3255bfef95601890afd80709",
+            },
+        ),
+        (
+            "/evidence/line\nbreak",
+            # No record change time
+            logical.WindowsFSMetadata(None, "line\nbreak", 0, TIME, TIME, TIME),
+            {lexicon.HASH_SHA1: "adc83b19e793491b1c6ea0fd8b46cd9f32e592fc"},
+        ),
+    ]
+
+
+def dump(resolver, add_image) -> rdflib.Graph:
+    # Facts of pyaff4 dumped along with the images
+    resolver.Set(
+        VOLUME,
+        VOLUME,
+        rdfvalue.URN(lexicon.AFF4_TYPE),
+        rdfvalue.URN(lexicon.AFF4_ZIP_TYPE),
+    )
+    resolver.Set(
+        VOLUME,
+        VOLUME,
+        rdfvalue.URN(lexicon.standard.stored),
+        rdfvalue.URN("file:///media/evidence.aff4"),
+    )
+    for pathname, fsmeta, file_hashes in images():
+        fsmeta.urn = VOLUME.Append(
+            escaping.arnPathFragment_from_path(pathname), quote=False
+        )
+        if file_hashes is not None:
+            # Set by pyaff4 on the stream of the file
+            for image_type in (lexicon.standard11.FileImage, lexicon.standard.Image):
+                resolver.Add(
+                    VOLUME,
+                    fsmeta.urn,
+                    rdfvalue.URN(lexicon.AFF4_TYPE),
+                    rdfvalue.URN(image_type),
+                )
+        add_image(resolver, pathname, fsmeta, file_hashes)
+    graph = rdflib.Graph()
+    graph.parse(data=resolver._DumpToTurtle(VOLUME), format="turtle")
+    return graph
+
+
+def add_to_resolver(resolver, pathname, fsmeta, file_hashes):
+    # As the facts were stored before the columns
+    fsmeta.store(resolver)
+    if file_hashes is None:
+        resolver.Set(
+            VOLUME,
+            fsmeta.urn,
+            rdfvalue.URN(lexicon.standard11.pathName),
+            rdfvalue.XSDString(pathname),
+        )
+        for image_type in (lexicon.standard11.FolderImage, lexicon.standard.Image):
+            resolver.Add(
+                VOLUME,
+                fsmeta.urn,
+                rdfvalue.URN(lexicon.AFF4_TYPE),
+                rdfvalue.URN(image_type),
+            )
+        return
+    for datatype, hex_digest in file_hashes.items():
+        resolver.Add(
+            fsmeta.urn,
+            fsmeta.urn,
+            rdfvalue.URN(lexicon.standard.hash),
+            aff4_hashes.newImmutableHash(hex_digest, datatype),
+        )
+
+
+def add_to_columns(resolver, pathname, fsmeta, file_hashes):
+    if file_hashes is None:
+        resolver.columns.add(fsmeta.urn, fsmeta, pathname)
+    else:
+        resolver.columns.add(fsmeta.urn, fsmeta, hashes=file_hashes)
+
+
+def test_columns_dump_the_graph_of_the_resolver():
+    with data_store.MemoryDataStore() as resolver:
+        expected = dump(resolver, add_to_resolver)
+    with ColumnarDataStore() as resolver:
+        columns = dump(resolver, add_to_columns)
+
+    assert isomorphic(columns, expected)
+    # Not isomorphic by chance, every image is there
+    path_names = set(columns.objects(None, rdflib.URIRef(lexicon.standard11.pathName)))
+    assert len(path_names) == 2
+    assert len(set(columns.objects(None, rdflib.URIRef(lexicon.standard.hash)))) == 3
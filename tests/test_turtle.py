@@ -0,0 +1,91 @@
+import io
+
+import pytest
+import rdflib
+from rdflib.compare import isomorphic
+
+from gemino.threads.aff4 import turtle
+from gemino.threads.aff4.turtle import Literal, TurtleReader
+
+BASE = "http://base/"
+TURTLE = '''# Metadata of a container
+@prefix aff4: <http://aff4.org/Schema#> .
+@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+PREFIX ex: <http://example.org/>
+@base <http://base/> .
+
+<aff4://volume>
+    a aff4:ZipVolume ;
+    aff4:caseDescription """Seized "as is"
+on two lines""" ;
+    aff4:examiner "J\\u00e9r\\u00f4me \\"J\\" Doe\\\\" , 'single'@fr-CH ;;
+    aff4:startTime "2024-01-02T03:04:05+00:00"^^xsd:dateTime .
+
+<aff4://volume/folder%20a/file.txt> a aff4:FileImage , aff4:Image ; # trailing comment
+    aff4:size "42"^^xsd:long ;
+    aff4:hash "d41d8cd98f00b204e9800998ecf8427e"^^aff4:MD5 ,
+        "da39a3ee5e6b4b0d3255bfef95601890afd80709"^^<http://aff4.org/Schema#SHA1> ;
+    ex:count 5 , -3.25 ;
+    ex:flag true .
+
+<relative> ex:parent [ a ex:Node ; ex:child [ ex:leaf "v" ] ] .
+[ ex:anonymous "first" ] ex:more 1 .
+_:b1 ex:link _:b2 .
+ex:local.name ex:end ex:o.
+'''
+
+
+def reader_graph(text: str) -> rdflib.Graph:
+    graph = rdflib.Graph()
+
+    def term(value):
+        if isinstance(value, Literal):
+            # Simple literals are xsd:string in RDF 1.1, rdflib leaves them untyped
+            return rdflib.Literal(
+                value.value,
+                lang=value.language,
+                datatype=(
+                    None if value.datatype == turtle.XSD + "string" else value.datatype
+                ),
+            )
+        if value.startswith("_:"):
+            return rdflib.BNode(value[2:])
+        return rdflib.URIRef(value)
+
+    for subject, predicates in TurtleReader(io.StringIO(text), BASE).subjects():
+        for predicate, objects in predicates.items():
+            for value in objects:
+                graph.add((term(subject), rdflib.URIRef(predicate), term(value)))
+    return graph
+
+
+@pytest.mark.parametrize("chunk_size", [turtle.CHUNK_SIZE, 7, 64])
+def test_statements_match_rdflib(monkeypatch, chunk_size):
+    # Small chunks split the tokens between reads of the stream
+    monkeypatch.setattr(turtle, "CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr(turtle, "LOOKAHEAD", min(chunk_size, turtle.LOOKAHEAD))
+    expected = rdflib.Graph().parse(data=TURTLE, format="turtle", publicID=BASE)
+
+    assert isomorphic(reader_graph(TURTLE), expected)
+
+
+def test_subjects_are_yielded_in_order():
+    subjects = [
+        subject
+        for subject, _ in TurtleReader(io.StringIO(TURTLE), BASE).subjects()
+        if not subject.startswith("_:")
+    ]
+
+    assert subjects == [
+        "aff4://volume",
+        "aff4://volume/folder%20a/file.txt",
+        "http://base/relative",
+        "http://example.org/local.name",
+    ]
+
+
+def test_invalid_turtle_is_reported():
+    with pytest.raises(turtle.TurtleError):
+        list(TurtleReader(io.StringIO("<a> <b> .")).subjects())
+    with pytest.raises(turtle.TurtleError):
+        list(TurtleReader(io.StringIO("undeclared:a <b> <c> .")).subjects())